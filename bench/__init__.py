@@ -0,0 +1,283 @@
+'''
+Benchmarks of building, trimming, saving, loading and querying graphs, over synthetic datasets of growing sizes, and
+micro-benchmarks of calculators, which measure how many pairs each of them calculates per second.
+
+Each size is benchmarked in a process of its own, so the peak memory usage recorded for it is not affected by other
+sizes. Results are plain dicts, which are written as JSON and could be compared with the results of previous runs.
+'''
+
+import collections
+import contextlib
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import time
+
+import numpy
+
+import calculators
+import graph
+import instrument
+import trim
+from bench.synthetic import synthesize
+from dataset import Dataset
+from generator import GraphBuilder
+
+
+RESULTS_VERSION = 1
+
+
+class Recorder(object):
+    '''
+    Records how long each stage of a benchmark takes, and the peak memory usage of the process once it's done, where
+    the platform reports it.
+    '''
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name, operations=None):
+        '''
+        Measures the stage that runs within the context.
+
+        :param name: name of the stage
+        :param operations: amount of operations performed in the stage, to report their rate. optional
+        '''
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+
+        result = {'seconds': seconds}
+
+        peak_rss_mb = instrument.peak_rss_mb()
+        if peak_rss_mb is not None:
+            result['peak_rss_mb'] = peak_rss_mb
+
+        if operations is not None:
+            result['operations'] = operations
+            result['per_second'] = operations / seconds if seconds > 0 else None
+
+        self.stages[name] = result
+
+
+def run(sizes, options, run_function=None):
+    '''
+    Runs the benchmark for each size.
+
+    :param sizes: amounts of rows of the synthetic datasets
+    :param options: options of the benchmark, see `run_size`
+    :param run_function: benchmarks a single size, given the amount of rows and the options. `run_size` if not
+                         given. optional
+    :return: results of all sizes, along with a description of the environment they were measured in
+    :rtype: dict
+    '''
+    results = {'version': RESULTS_VERSION,
+               'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+               'commit': _get_commit(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'cpus': multiprocessing.cpu_count(),
+               'options': options,
+               'sizes': collections.OrderedDict()}
+
+    for amount_of_rows in sizes:
+        with multiprocessing.Pool(1) as pool:
+            stages = pool.apply(run_function or run_size, (amount_of_rows, options))
+
+        results['sizes'][str(amount_of_rows)] = {'stages': stages}
+
+    return results
+
+
+def run_size(amount_of_rows, options):
+    '''
+    Benchmarks all stages over a synthetic dataset of a given size.
+
+    :param amount_of_rows: amount of rows of the synthetic dataset
+    :param options: dict of:
+                    workdir - directory to write datasets and graphs into
+                    calculator - name of the calculator, or a weighted sum of calculators (see `calculators`)
+                    max_vertices - maximal outgoing vertices per edge of the built graph
+                    pruned - whether to build with a pruned search
+                    workers - number of processes to build in, or None
+                    full_limit - largest size for which a full graph is built and trimmed
+                    queries - amount of queries of each kind
+                    seed - seed of the synthetic dataset and of the queries
+    :return: results of each stage, by name
+    :rtype: dict
+    '''
+    recorder = Recorder()
+    randomizer = random.Random(options['seed'])
+
+    csv_filename = os.path.join(options['workdir'], 'synthetic_{0}.csv'.format(amount_of_rows))
+    graph_filename = os.path.join(options['workdir'], 'synthetic_{0}.graph'.format(amount_of_rows))
+
+    with recorder.stage('synthesize', operations=amount_of_rows):
+        synthesize(csv_filename, amount_of_rows, seed=options['seed'])
+
+    # the first load parses the csv file and writes the cache, the second one reads the cache
+    with recorder.stage('dataset', operations=amount_of_rows):
+        dataset = Dataset(csv_filename, sort_by='name')
+
+    with recorder.stage('dataset_cached', operations=amount_of_rows):
+        dataset = Dataset(csv_filename, sort_by='name')
+
+    calculator = calculators.create(options['calculator'])
+    builder = GraphBuilder()
+
+    # progress bars of the builder would only clutter the output
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        with recorder.stage('build', operations=amount_of_rows):
+            trimmed_graph = builder.build_graph(dataset, calculator,
+                                                max_vertices=options['max_vertices'],
+                                                pruned=options['pruned'],
+                                                workers=options['workers'])
+
+        if amount_of_rows <= options['full_limit']:
+            with recorder.stage('build_full', operations=int(dataset.amount_of_pairs)):
+                full_graph = builder.build_graph(dataset, calculator, workers=options['workers'])
+
+            with recorder.stage('trim', operations=amount_of_rows):
+                trim.GraphTrimmer().trim(full_graph, options['max_vertices'])
+
+            del full_graph
+
+    with recorder.stage('save'):
+        trimmed_graph.save(graph_filename)
+
+    # queries are made with the query cache disabled, so each of them is actually performed
+    loaded_graph = graph.Graph(cache_size=0)
+    with recorder.stage('load'):
+        loaded_graph.load(graph_filename)
+
+    names = dataset.get_column('wikiquotes_names')
+    queries = [randomizer.choice(names) for _ in range(options['queries'])]
+    groups = [randomizer.sample(names, 3) for _ in range(options['queries'])]
+
+    with recorder.stage('neighbours', operations=len(queries)):
+        for name in queries:
+            loaded_graph.get_sorted_neighbours(name, limit=10)
+
+    with recorder.stage('joint', operations=len(groups)):
+        for group in groups:
+            loaded_graph.get_joint_neighbours(group, group_size=10)
+
+    with recorder.stage('find_names', operations=len(queries)):
+        for name in queries:
+            loaded_graph.find_names(name[:len(name) // 2])
+
+    return recorder.stages
+
+
+def run_calculators(sizes, expressions, options):
+    '''
+    Runs the micro-benchmarks of calculators for each size.
+
+    :param sizes: amounts of rows of the synthetic datasets
+    :param expressions: calculators to benchmark, by name, or as weighted sums of calculators
+    :param options: options of the benchmark, see `run_calculators_size`
+    :return: results of all sizes, as with `run`
+    :rtype: dict
+    '''
+    return run(sizes, dict(options, calculators=list(expressions)), run_calculators_size)
+
+
+def run_calculators_size(amount_of_rows, options):
+    '''
+    Benchmarks each calculator over a synthetic dataset of a given size: preparing the features of all rows, and
+    calculating random blocks of pairs with the batch interface, if the calculator implements it, and pair by pair.
+
+    :param amount_of_rows: amount of rows of the synthetic dataset
+    :param options: dict of:
+                    workdir - directory to write datasets into
+                    calculators - calculators to benchmark, by name, or as weighted sums of calculators
+                    pairs - amount of pairs to calculate with the batch interface
+                    scalar_pairs - amount of pairs to calculate pair by pair
+                    seed - seed of the synthetic dataset and of the pairs
+    :return: results of each stage, by name, as "<stage>:<calculator>"
+    :rtype: dict
+    '''
+    recorder = Recorder()
+    randomizer = numpy.random.RandomState(options['seed'])
+
+    csv_filename = os.path.join(options['workdir'], 'synthetic_{0}.csv'.format(amount_of_rows))
+    synthesize(csv_filename, amount_of_rows, seed=options['seed'])
+
+    dataset = Dataset(csv_filename, sort_by='name')
+    rows = dataset.rows
+
+    # blocks are as large as the generator's, and are the same for all calculators
+    block_rows = min(amount_of_rows, int(GraphBuilder.block_size ** 0.5))
+    blocks = [(randomizer.randint(0, amount_of_rows, block_rows), randomizer.randint(0, amount_of_rows, block_rows))
+              for _ in range(max(1, options['pairs'] // block_rows ** 2))]
+    pairs = randomizer.randint(0, amount_of_rows, (options['scalar_pairs'], 2)).tolist()
+
+    for expression in options['calculators']:
+        calculator = calculators.create(expression)
+        calculators.check_columns(calculator, dataset.columns)
+
+        if calculators.supports_batch(calculator):
+            with recorder.stage('prepare:{0}'.format(expression), operations=amount_of_rows):
+                features = calculator.prepare(rows)
+
+            with recorder.stage('batch:{0}'.format(expression), operations=len(blocks) * block_rows ** 2):
+                for a, b in blocks:
+                    calculator.calculate_block(features, a, b)
+
+        # rows are fetched before the pairs are measured, so only the calculator is
+        pair_rows = [(rows[i], rows[j]) for i, j in pairs]
+
+        with recorder.stage('scalar:{0}'.format(expression), operations=len(pair_rows)):
+            for a, b in pair_rows:
+                calculator.calculate(a, b)
+
+    return recorder.stages
+
+
+def compare(results, baseline, threshold=0.2, min_seconds=0.05):
+    '''
+    Compares results with the results of a previous run.
+
+    :param results: results of the current run
+    :param baseline: results of the previous run
+    :param threshold: relative slowdown, or growth of peak memory, that's considered a regression. optional
+    :param min_seconds: stages that took less than this in the previous run are too noisy to compare times of.
+                        optional
+    :return: description of each regression
+    :rtype: list(str)
+    '''
+    regressions = []
+
+    for size, result in results['sizes'].items():
+        baseline_stages = baseline['sizes'].get(size, {}).get('stages', {})
+
+        for name, stage in result['stages'].items():
+            baseline_stage = baseline_stages.get(name)
+            if baseline_stage is None:
+                continue
+
+            before, after = baseline_stage['seconds'], stage['seconds']
+            if before >= min_seconds and after > before * (1 + threshold):
+                regressions.append('{0} rows, {1}: {2:.3f}s -> {3:.3f}s (+{4:.0%})'.format(
+                    size, name, before, after, after / before - 1))
+
+            # peak memory is missing from results of platforms that do not report it
+            before, after = baseline_stage.get('peak_rss_mb'), stage.get('peak_rss_mb')
+            if before is not None and after is not None and after > before * (1 + threshold):
+                regressions.append('{0} rows, {1}: peak memory {2:.1f}MB -> {3:.1f}MB (+{4:.0%})'.format(
+                    size, name, before, after, after / before - 1))
+
+    return regressions
+
+
+def _get_commit():
+    '''
+    :return: hash of the checked out commit, or None if it's not known
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,95 @@
+'''
+Synthetic datasets, shaped like the pantheon dataset but of any size.
+
+Each synthetic person is based on a random person of the source dataset, so occupations, industries and domains come
+with the same cardinalities and mixed in the same proportions, and birth years are spread the same. Some people are
+born in a random country of the geocoding dataset instead, and as many people as in the source dataset have no LAT/LON
+values, so the calculators' geocoding fallback is exercised as well.
+'''
+
+import csv
+import random
+
+from dataset import Dataset
+
+
+# fraction of people born in a random country of the geocoding dataset, rather than in their source person's country
+FOREIGN_RATIO = 0.2
+
+# standard deviation of the distance of a person from their source person, in degrees
+LOCATION_SPREAD = 1.0
+
+# maximal distance of a person's birth year from their source person's
+BIRTHYEAR_SPREAD = 10
+
+
+def load_countries(filename='country_geocoding.txt'):
+    '''
+    :param filename: country geocoding dataset
+    :return: list of (country code, lat, lon, country name)
+    :rtype: list(tuple(str, float, float, str))
+    '''
+    countries = []
+
+    with open(filename, 'rb') as f:
+        f.readline()
+
+        for line in f.readlines():
+            country_code, lat, lon, country_name = line.decode().split(' ', 3)
+            countries.append((country_code.upper(), float(lat), float(lon), country_name.strip()))
+
+    return countries
+
+
+def synthesize(filename, amount_of_rows, source='pantheon.csv', geocoding='country_geocoding.txt', seed=0):
+    '''
+    Writes a synthetic dataset into a csv file, with the same columns as the source dataset.
+
+    :param filename: csv file to write into
+    :param amount_of_rows: amount of people in the dataset
+    :param source: dataset to base the people on. optional
+    :param geocoding: country geocoding dataset. optional
+    :param seed: seed of the random generator, so the same dataset could be synthesized again. optional
+    '''
+    generator = random.Random(seed)
+    source_dataset = Dataset(source, use_cache=False)
+    source_rows = list(source_dataset.rows)
+    countries = load_countries(geocoding)
+    locations = {country_code: (lat, lon) for country_code, lat, lon, _ in countries}
+
+    missing_ratio = sum(1 for row in source_rows if row['LAT'] == '' or row['LON'] == '') / len(source_rows)
+
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=',')
+        writer.writerow(source_dataset.columns)
+
+        for i in range(amount_of_rows):
+            row = dict(generator.choice(source_rows))
+            row['en_curid'] = str(i + 1)
+
+            # names are made unique by the person's number
+            name = '{0} {1}'.format(row['name'], i + 1)
+            row['name'] = row['wikiquotes_names'] = row['wikipedia_names'] = name
+
+            row['birthyear'] = str(int(row['birthyear']) + generator.randint(-BIRTHYEAR_SPREAD, BIRTHYEAR_SPREAD))
+
+            if generator.random() < FOREIGN_RATIO:
+                country_code, lat, lon, country_name = generator.choice(countries)
+                row.update({'countryCode': country_code, 'countryCode3': '', 'countryName': country_name,
+                            'continentName': '', 'birthcity': '', 'birthstate': ''})
+            elif row['LAT'] != '' and row['LON'] != '':
+                lat, lon = float(row['LAT']), float(row['LON'])
+            else:
+                lat, lon = locations[row['countryCode']]
+
+            if generator.random() < missing_ratio:
+                row['LAT'] = row['LON'] = ''
+            else:
+                row['LAT'] = str(round(_clamp(lat + generator.gauss(0, LOCATION_SPREAD), -90, 90), 6))
+                row['LON'] = str(round(_clamp(lon + generator.gauss(0, LOCATION_SPREAD), -180, 180), 6))
+
+            writer.writerow([row[column] for column in source_dataset.columns])
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
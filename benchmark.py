@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# The Benchmark Utility
+#
+# Measures how the generator, the trimmer, saving and loading graphs and the explorer's queries behave as the data
+# grows. Synthetic datasets, shaped like pantheon.csv, are generated for each of the given sizes (see `bench/`), and
+# the time and peak memory usage of each stage are written into a JSON file.
+#
+# Results could be compared with the results of a previous run: any stage that became slower, or used more memory, by
+# more than the threshold is reported as a regression, and the utility exits with an error.
+#
+# With --calculators, the calculators are micro-benchmarked instead, each on its own: how many rows per second their
+# features are prepared at, and how many pairs per second they calculate, in blocks and pair by pair. Calculators are
+# given by name, or as weighted sums of calculators, so the cost of adding a term is seen before generating a graph
+# with it. All registered calculators are benchmarked if none are given.
+#
+# example: python benchmark.py results.json -s 1000 10000 100000 -mv 50 -p -wc time_and_space -c previous.json
+# example: python benchmark.py calculators.json -s 10000 --calculators time_and_space "time_and_space + 0.5 * popularity"
+#
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+
+import bench
+import calculators
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output', help='name of JSON file to write results into')
+    parser.add_argument('-s', '--sizes', help='amounts of rows of the synthetic datasets', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('-wc', '--weight-calculator', help='name of a calculator, or a weighted sum of calculators (see calculators/)', default='time_and_space')
+    parser.add_argument('-mv', '--max-vertices', help='maximal outgoing vertices per edge', type=int, default=50)
+    parser.add_argument('-p', '--pruned', help='build graphs with a pruned search', action='store_true')
+    parser.add_argument('-w', '--workers', help='number of processes to build graphs in', type=int, required=False)
+    parser.add_argument('-fl', '--full-limit', help='largest size for which a full graph is built and trimmed', type=int, default=5000)
+    parser.add_argument('-q', '--queries', help='amount of queries of each kind', type=int, default=1000)
+    parser.add_argument('--calculators', help='micro-benchmark these calculators, or weighted sums of calculators, rather than the generator. all registered calculators if none are given', nargs='*', required=False)
+    parser.add_argument('--pairs', help='amount of pairs each calculator calculates in blocks, with --calculators', type=int, default=2 ** 22)
+    parser.add_argument('--scalar-pairs', help='amount of pairs each calculator calculates pair by pair, with --calculators', type=int, default=10000)
+    parser.add_argument('--seed', help='seed of the synthetic datasets and queries', type=int, default=0)
+    parser.add_argument('--workdir', help='directory to write datasets and graphs into. temporary if not given', required=False)
+    parser.add_argument('-c', '--compare', help='results of a previous run to compare with', required=False)
+    parser.add_argument('-t', '--threshold', help='relative slowdown considered a regression', type=float, default=0.2)
+    parser.add_argument('--min-seconds', help='stages faster than this are not compared by time', type=float, default=0.05)
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='graphy-bench-')
+
+    options = {'workdir': workdir,
+               'calculator': args.weight_calculator,
+               'max_vertices': args.max_vertices,
+               'pruned': args.pruned,
+               'workers': args.workers,
+               'full_limit': args.full_limit,
+               'queries': args.queries,
+               'seed': args.seed}
+
+    try:
+        print('benchmarking {0} rows...'.format(', '.join(str(size) for size in args.sizes)))
+
+        if args.calculators is not None:
+            options = {'workdir': workdir, 'pairs': args.pairs, 'scalar_pairs': args.scalar_pairs, 'seed': args.seed}
+            results = bench.run_calculators(args.sizes, args.calculators or calculators.get_names(), options)
+        else:
+            results = bench.run(args.sizes, options)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # the working directory is only meaningful for this run
+    del results['options']['workdir']
+
+    for size, result in results['sizes'].items():
+        print('\n{0} rows:'.format(size))
+
+        width = max([16] + [len(name) + 2 for name in result['stages']])
+
+        for name, stage in result['stages'].items():
+            rate = ' ({0:.0f}/s)'.format(stage['per_second']) if stage.get('per_second') else ''
+            memory = '{0:>10.1f}MB'.format(stage['peak_rss_mb']) if 'peak_rss_mb' in stage else '{0:>12}'.format('-')
+            print('  {0:<{4}}{1:>10.3f}s{2}{3}'.format(name, stage['seconds'], memory, rate, width))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+        regressions = bench.compare(results, baseline, threshold=args.threshold, min_seconds=args.min_seconds)
+
+        if regressions:
+            print('\nregressions compared to {0}:'.format(args.compare))
+            for regression in regressions:
+                print('  {0}'.format(regression))
+
+            sys.exit(1)
+
+        print('\nno regressions compared to {0}'.format(args.compare))
+
+    print('\ndone')
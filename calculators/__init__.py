@@ -0,0 +1,296 @@
+'''
+Weight calculators, which graphs are built with (see `generator.py` for the interface a calculator implements).
+
+Calculators are found by name in a registry of:
+    - the modules of this package that have a WeightCalculator class, e.g. "time_and_space"
+    - calculators of installed packages, registered under the "graphy.calculators" entry point group, e.g. in their
+      setup.py: entry_points={'graphy.calculators': ['my_calculator = my_package.calculator:WeightCalculator']}
+    - calculators registered at runtime with `register`
+A path to a python file with a WeightCalculator class is loaded as well.
+
+Calculators declare the columns of the dataset they read, as `columns`, so a dataset that lacks them is rejected before
+anything is calculated, and whether they implement the batch interface, as `batch`.
+
+Several calculators are combined into one with an expression, such as "time_and_space + 0.5 * popularity", whose
+weight is the weighted sum of theirs (see `calculators.combined`).
+'''
+
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import os
+import pkgutil
+import re
+import sys
+
+from calculators import combined
+
+
+ENTRY_POINT_GROUP = 'graphy.calculators'
+
+# coefficient of a term, up to the sign of its exponent, e.g. "1e" of "1e+3 * popularity"
+_EXPONENT = re.compile(r'\s*[+-]?(?:\d+\.?\d*|\.\d+)[eE]$')
+
+# calculator classes registered at runtime, by name
+_registry = {}
+
+
+def register(name, calculator_class):
+    '''
+    :param name: name to find the calculator by
+    :param calculator_class: class of the calculator, created without arguments
+    '''
+    _registry[name] = calculator_class
+
+
+def get_names():
+    '''
+    :return: names of all the calculators in the registry
+    :rtype: list(str)
+    '''
+    names = set(_registry)
+    names.update(entry_point.name for entry_point in _iter_entry_points())
+
+    for module_info in pkgutil.iter_modules(__path__):
+        if not module_info.name.startswith('_') and hasattr(_import_module(module_info.name), 'WeightCalculator'):
+            names.add(module_info.name)
+
+    return sorted(names)
+
+
+def get_class(name):
+    '''
+    :param name: name of a calculator in the registry, or path of a python file with a WeightCalculator class
+    :return: class of the calculator
+    '''
+    if name in _registry:
+        return _registry[name]
+
+    if name.endswith('.py') or os.sep in name:
+        return load_file(name).WeightCalculator
+
+    if importlib.util.find_spec('{0}.{1}'.format(__name__, name)) is not None:
+        module = _import_module(name)
+        if hasattr(module, 'WeightCalculator'):
+            return module.WeightCalculator
+
+    for entry_point in _iter_entry_points():
+        if entry_point.name == name:
+            return entry_point.load()
+
+    raise Exception('No calculator named "{0}", the calculators are: {1}'.format(name, ', '.join(get_names())))
+
+
+def create(expression):
+    '''
+    :param expression: name of a calculator (see `get_class`), or a weighted sum of calculators, e.g.
+                       "time_and_space + 0.5 * popularity" (see `_split_terms`)
+    :return: the calculator
+    '''
+    terms = [_parse_term(term) for term in _split_terms(expression)]
+
+    if len(terms) == 1 and terms[0][0] == 1.0:
+        return get_class(terms[0][1])()
+
+    return combined.CombinedCalculator([(coefficient, get_class(name)()) for coefficient, name in terms])
+
+
+def supports_batch(calculator):
+    '''
+    :return: whether the calculator implements the batch interface, as it declares, or as its methods tell
+    :rtype: bool
+    '''
+    return bool(getattr(calculator, 'batch', hasattr(calculator, 'calculate_block')))
+
+
+def check_columns(calculator, columns):
+    '''
+    Raises an error if the calculator reads columns that are not in the dataset. Calculators that do not declare their
+    columns are not checked.
+
+    :param columns: titles of the columns of the dataset
+    '''
+    missing = [column for column in getattr(calculator, 'columns', ()) if column not in columns]
+
+    if missing:
+        raise Exception('The dataset has no {0} column, which the calculator reads'.format(', '.join(missing)))
+
+
+def get_name(calculator):
+    '''
+    :return: name of the calculator, as it declares, or the name of its source file
+    :rtype: str
+    '''
+    name = getattr(calculator, 'name', None)
+    if name is not None:
+        return name
+
+    return os.path.splitext(os.path.basename(inspect.getfile(type(calculator))))[0]
+
+
+def get_digest(calculator):
+    '''
+    :return: hash of the source files of the calculator, and of its terms and their coefficients if it combines
+             others, or None if any of them has none
+    :rtype: str
+    '''
+    try:
+        with open(inspect.getfile(type(calculator)), 'rb') as f:
+            digest = hashlib.sha1(f.read())
+    except TypeError:
+        return None
+
+    for coefficient, term in getattr(calculator, 'terms', ()):
+        term_digest = get_digest(term)
+        if term_digest is None:
+            return None
+
+        digest.update('{0!r}:{1}'.format(coefficient, term_digest).encode())
+
+    return digest.hexdigest()
+
+
+def get_sources(calculator):
+    '''
+    :return: modules of the classes of the calculator, and of its terms if it combines others, with their source files
+    :rtype: list(tuple(str, str))
+    '''
+    calculator_type = type(calculator)
+    sources = [(calculator_type.__module__, inspect.getfile(calculator_type))]
+
+    for _, term in getattr(calculator, 'terms', ()):
+        sources.extend(get_sources(term))
+
+    return sources
+
+
+def load_sources(sources):
+    '''
+    Loads the modules of calculators in a process that does not have them yet, e.g. a worker process, so they could be
+    unpickled in it.
+
+    :param sources: as returned by `get_sources`
+    '''
+    for module_name, filename in sources:
+        if module_name in sys.modules:
+            continue
+
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            load_file(filename, module_name)
+
+
+def load_file(filename, module_name=None):
+    '''
+    :param filename: python file to load
+    :param module_name: name of the module to load it as. derived from the name of the file if not given. optional
+    :return: the loaded module
+    '''
+    if module_name is None:
+        module_name = 'calculator_{0}'.format(os.path.splitext(os.path.basename(filename))[0])
+
+    spec = importlib.util.spec_from_file_location(module_name, filename)
+    if spec is None:
+        raise Exception('Could not load a calculator from "{0}"'.format(filename))
+
+    module = importlib.util.module_from_spec(spec)
+
+    # the module is registered before it's executed, so its classes could be pickled by name
+    sys.modules[module_name] = module
+
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        del sys.modules[module_name]
+        raise
+
+    return module
+
+
+def _import_module(name):
+    return importlib.import_module('{0}.{1}'.format(__name__, name))
+
+
+def _iter_entry_points():
+    '''
+    :return: entry points of the calculators of installed packages
+    '''
+    try:
+        from importlib import metadata
+    except ImportError:
+        return []
+
+    try:
+        return list(metadata.entry_points(group=ENTRY_POINT_GROUP))
+    except TypeError:
+        return list(metadata.entry_points().get(ENTRY_POINT_GROUP, []))
+
+
+def _split_terms(expression):
+    '''
+    Splits a weighted sum of calculators into its terms, on each "+" between them. The "+" of the exponent of a
+    coefficient does not split terms, and neither does a "+" within the path of a python file that exists.
+
+    >>> _split_terms('time_and_space + 0.5 * popularity')
+    ['time_and_space', '0.5 * popularity']
+    >>> _split_terms('time_and_space + 1e+3 * popularity')
+    ['time_and_space', '1e+3 * popularity']
+    >>> _split_terms('time_and_space+popularity')
+    ['time_and_space', 'popularity']
+
+    :param expression: as given to `create`
+    :return: the terms
+    :rtype: list(str)
+    '''
+    ends = [i for i, char in enumerate(expression) if char == '+'] + [len(expression)]
+
+    terms = []
+    start = 0
+
+    for i, end in enumerate(ends[:-1]):
+        if _EXPONENT.match(expression[start:end]) or _continues_path(expression, start, end, ends[i + 1:]):
+            continue
+
+        terms.append(expression[start:end].strip())
+        start = end + 1
+
+    terms.append(expression[start:].strip())
+
+    return terms
+
+
+def _continues_path(expression, start, end, later_ends):
+    '''
+    :return: whether the term that starts at <start> is the path of a python file, which does not exist if it ends at
+             <end>, but does once it ends at any of <later_ends>
+    :rtype: bool
+    '''
+    def get_path(stop):
+        return expression[start:stop].rpartition('*')[2].strip()
+
+    path = get_path(end)
+    if not (path.endswith('.py') or os.sep in path) or os.path.isfile(path):
+        return False
+
+    return any(os.path.isfile(get_path(stop)) for stop in later_ends)
+
+
+def _parse_term(term):
+    '''
+    :param term: "<name>" or "<coefficient> * <name>"
+    :return: the coefficient and the name
+    :rtype: tuple(float, str)
+    '''
+    coefficient, _, name = term.strip().rpartition('*')
+
+    try:
+        coefficient = float(coefficient) if coefficient else 1.0
+    except ValueError:
+        raise Exception('Invalid coefficient in calculator term "{0}"'.format(term.strip()))
+
+    if not name.strip():
+        raise Exception('Missing calculator in term "{0}"'.format(term.strip()))
+
+    return coefficient, name.strip()
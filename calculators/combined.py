@@ -0,0 +1,104 @@
+'''
+Weighted sum of several calculators, such as time_and_space along with a popularity term.
+'''
+
+import numpy
+
+import calculators
+
+
+class CombinedCalculator(object):
+    '''
+    Combined calculator.
+
+    The weight between two rows is the sum of the weights of its terms, each multiplied by its coefficient. Implements
+    the batch interface if all of its terms do, in which case each block is calculated by all terms and summed up in
+    place, in a single pass over the block.
+    '''
+
+    def __init__(self, terms):
+        '''
+        :param terms: calculators, each with its coefficient
+        :type terms: list(tuple(float, object))
+        '''
+        if not terms:
+            raise Exception('A combined calculator needs at least one term')
+
+        self.terms = [(float(coefficient), calculator) for coefficient, calculator in terms]
+
+        columns = []
+        for _, calculator in self.terms:
+            columns.extend(column for column in getattr(calculator, 'columns', ()) if column not in columns)
+
+        self.columns = tuple(columns)
+        self.batch = all(calculators.supports_batch(calculator) for _, calculator in self.terms)
+
+    @property
+    def name(self):
+        '''
+        :return: names of the terms. coefficients are left out, as the features of the terms do not depend on them
+        :rtype: str
+        '''
+        return '+'.join(calculators.get_name(calculator) for _, calculator in self.terms)
+
+    def calculate(self, a, b):
+        weight = 0.0
+
+        for coefficient, calculator in self.terms:
+            weight += coefficient * calculator.calculate(a, b)
+
+        return weight
+
+    def prepare(self, rows):
+        '''
+        Prepares the features of all terms.
+
+        :param rows: rows of the dataset
+        :return: features of each term, by its index. terms whose features are dicts of arrays have them flattened
+                 into "<index>/<name>", so the features could be cached as any other
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        features = {}
+
+        for i, (_, calculator) in enumerate(self.terms):
+            term_features = calculator.prepare(rows)
+
+            if isinstance(term_features, dict):
+                features.update(('{0}/{1}'.format(i, name), array) for name, array in term_features.items())
+            else:
+                features[str(i)] = term_features
+
+        return features
+
+    def calculate_block(self, features, a, b):
+        '''
+        Calculates the weights of all pairs between two sets of rows at once.
+
+        Gives the exact same results as calling `calculate` on each pair.
+
+        :param features: features returned by `prepare`
+        :param a: indices of the first rows
+        :param b: indices of the second rows
+        :return: matrix where [i][j] = weight between rows a[i] and b[j]
+        :rtype: numpy.ndarray
+        '''
+        weights = numpy.zeros((len(a), len(b)))
+
+        for i, (coefficient, calculator) in enumerate(self.terms):
+            block = calculator.calculate_block(_get_term_features(features, i), a, b)
+
+            block *= coefficient
+            weights += block
+
+        return weights
+
+
+def _get_term_features(features, i):
+    '''
+    :return: features of the i-th term, out of the features of all terms
+    '''
+    if str(i) in features:
+        return features[str(i)]
+
+    prefix = '{0}/'.format(i)
+    return {name[len(prefix):]: array for name, array in features.items() if name.startswith(prefix)}
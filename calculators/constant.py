@@ -3,5 +3,8 @@ class WeightCalculator(object):
     Constant value calculator.
     '''
 
+    columns = ()
+    batch = False
+
     def calculate(self, a, b):
         return 1.0
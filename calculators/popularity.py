@@ -0,0 +1,74 @@
+import math
+
+import numpy
+
+
+# columns read by the calculator
+COLUMNS = ('HPI', 'TotalPageViews')
+
+# typed record of the features of a single row
+FEATURES = numpy.dtype([('hpi', numpy.float64), ('views', numpy.float64)])
+
+# weight of a difference of a single order of magnitude of page views, relative to a single point of HPI
+VIEWS_SCALE = 10.0
+
+
+class WeightCalculator(object):
+    '''
+    Popularity calculator.
+
+    Takes into account how popular the two records are: the difference between their historical popularity index
+    (HPI), and the difference between the orders of magnitude of their total page views.
+
+    Weights are on the scale of the time_and_space calculator for records of the same categories, so the two could be
+    combined, e.g. "time_and_space + 0.5 * popularity".
+    '''
+
+    columns = COLUMNS
+    batch = True
+
+    def calculate(self, a, b):
+        a_hpi, a_views = self._get_popularity(a)
+        b_hpi, b_views = self._get_popularity(b)
+
+        # calculate weight as distance
+        return (abs(a_hpi - b_hpi) + VIEWS_SCALE * abs(a_views - b_views)) / 1000
+
+    def prepare(self, rows):
+        '''
+        :param rows: rows of the dataset
+        :return: features, as an array of records with the fields of FEATURES
+        :rtype: numpy.ndarray
+        '''
+        features = numpy.empty(len(rows), dtype=FEATURES)
+
+        for i, row in enumerate(rows):
+            features[i] = self._get_popularity(row)
+
+        return features
+
+    def calculate_block(self, features, a, b):
+        '''
+        Calculates the weights of all pairs between two sets of rows at once.
+
+        Gives the exact same results as calling `calculate` on each pair.
+
+        :param features: records returned by `prepare`
+        :param a: indices of the first rows
+        :param b: indices of the second rows
+        :return: matrix where [i][j] = weight between rows a[i] and b[j]
+        :rtype: numpy.ndarray
+        '''
+        hpi_distance = numpy.abs(features['hpi'][a][:, numpy.newaxis] - features['hpi'][b][numpy.newaxis, :])
+        views_distance = numpy.abs(features['views'][a][:, numpy.newaxis] - features['views'][b][numpy.newaxis, :])
+
+        # calculate weight as distance
+        return (hpi_distance + VIEWS_SCALE * views_distance) / 1000
+
+    def _get_popularity(self, row):
+        '''
+        :param row: row to get the popularity of
+        :return: HPI of the row, and the order of magnitude of its page views
+        :rtype: tuple(float, float)
+        '''
+        return float(row['HPI']), math.log10(max(float(row['TotalPageViews']), 1.0))
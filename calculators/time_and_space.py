@@ -1,6 +1,33 @@
 import math
 import re
 
+import numpy
+
+import spatial
+from graph import components
+
+
+# matches the numeric prefix of a string
+NUMBER_PATTERN = re.compile(r'\-{0,1}\d*\.{0,1}\d*')
+
+# categorical features. rows whose categories mismatch are punished
+CATEGORIES = ('occupation', 'industry', 'domain')
+
+# columns read by the calculator
+COLUMNS = ('LAT', 'LON', 'countryCode', 'birthyear') + CATEGORIES
+
+# typed record of the features of a single row
+FEATURES = numpy.dtype([('lat', numpy.float64), ('lon', numpy.float64), ('birthyear', numpy.float64)] +
+                       [(column, numpy.int32) for column in CATEGORIES])
+
+# the weight as components: the sum of the geographic and the time distance, multiplied by 100 for each mismatching
+# category, so graphs could be ranked again with other balances and punishments (see `graph.components`)
+COMPONENT_MODEL = components.ComponentModel(terms=('geo', 'time'),
+                                            penalties=CATEGORIES,
+                                            defaults=dict([('geo', 1.0), ('time', 1.0)] +
+                                                          [(column, 100.0) for column in CATEGORIES]),
+                                            scale=1.0 / 1000)
+
 
 class WeightCalculator(object):
     '''
@@ -14,23 +41,19 @@ class WeightCalculator(object):
     lat\long values specified.
     '''
 
+    columns = COLUMNS
+    batch = True
+    component_model = COMPONENT_MODEL
+
     def __init__(self):
         super(WeightCalculator, self).__init__()
         self._geocoder = self._initialize_geocoder()
 
     def calculate(self, a, b):
 
-        # get lat\long values for a, use the geocoder as a fallback
-        try:
-            a_lat, a_long = self._numify(a['LAT']), self._numify(a['LON'])
-        except:
-            a_lat, a_long = self._geocoder[a['countryCode']]
-
-        # get lat\long values for b, use the geocoder as a fallback
-        try:
-            b_lat, b_long = self._numify(b['LAT']), self._numify(b['LON'])
-        except:
-            b_lat, b_long = self._geocoder[b['countryCode']]
+        # get lat\long values for a and b, use the geocoder as a fallback
+        a_lat, a_long = self._locate(a)
+        b_lat, b_long = self._locate(b)
 
         # calculate geographic distance
         geographic_distance = math.sqrt((a_lat - b_lat) ** 2 + (a_long - b_long) ** 2)
@@ -49,6 +72,100 @@ class WeightCalculator(object):
         # return calculated value
         return distance
 
+    def prepare(self, rows):
+        '''
+        Turns each row into a typed record of the features used by the calculator, so that pairs are calculated over
+        records rather than by parsing strings over and over again.
+
+        Categories (occupation, industry and domain) are interned as integer ids.
+
+        :param rows: rows of the dataset
+        :return: features, as an array of records with the fields of FEATURES
+        :rtype: numpy.ndarray
+        '''
+        features = numpy.empty(len(rows), dtype=FEATURES)
+        ids = {column: {} for column in CATEGORIES}
+
+        for i, row in enumerate(rows):
+            lat, lon = self._locate(row)
+            categories = tuple(ids[column].setdefault(row[column], len(ids[column])) for column in CATEGORIES)
+
+            features[i] = (lat, lon, self._numify(row['birthyear'])) + categories
+
+        return features
+
+    def calculate_block(self, features, a, b):
+        '''
+        Calculates the weights of all pairs between two sets of rows at once.
+
+        Gives the exact same results as calling `calculate` on each pair.
+
+        :param features: records returned by `prepare`
+        :param a: indices of the first rows
+        :param b: indices of the second rows
+        :return: matrix where [i][j] = weight between rows a[i] and b[j]
+        :rtype: numpy.ndarray
+        '''
+        geographic_distance, time_distance, mismatches = self._calculate_distances(features, a, b)
+
+        # create multiplier punishments for mismatching occupations, industries and domains
+        occupation_mult = numpy.where(mismatches['occupation'], 100.0, 1.0)
+        industry_mult = numpy.where(mismatches['industry'], 100.0, 1.0)
+        domain_mult = numpy.where(mismatches['domain'], 100.0, 1.0)
+
+        # calculate weight as distance
+        return (occupation_mult * industry_mult * domain_mult * 1.0) * (geographic_distance + time_distance) / 1000
+
+    def calculate_components(self, features, a, b):
+        '''
+        Calculates the components of the weights of all pairs between two sets of rows, as described by
+        COMPONENT_MODEL.
+
+        :param features: records returned by `prepare`
+        :param a: indices of the first rows
+        :param b: indices of the second rows
+        :return: matrices where [i][j] = component of the weight between rows a[i] and b[j], by name
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        geographic_distance, time_distance, mismatches = self._calculate_distances(features, a, b)
+        return COMPONENT_MODEL.create({'geo': geographic_distance, 'time': time_distance}, mismatches)
+
+    def _calculate_distances(self, features, a, b):
+        '''
+        :return: matrices of the geographic distance, the time distance and the mismatch of each category, between
+                 rows a[i] and b[j]
+        '''
+        def column(name, indices, axis):
+            values = features[name][indices]
+            return values[:, numpy.newaxis] if axis == 0 else values[numpy.newaxis, :]
+
+        # calculate geographic distance. float_power goes through the same pow() as python's `**` operator,
+        # while numpy's own `**` squares by multiplication, which is rounded differently
+        geographic_distance = numpy.sqrt(numpy.float_power(column('lat', a, 0) - column('lat', b, 1), 2) +
+                                         numpy.float_power(column('lon', a, 0) - column('lon', b, 1), 2))
+
+        # calculate time distance
+        time_distance = numpy.abs(column('birthyear', a, 0) - column('birthyear', b, 1))
+
+        mismatches = {name: column(name, a, 0) != column(name, b, 1) for name in CATEGORIES}
+
+        return geographic_distance, time_distance, mismatches
+
+    def search_space(self, features):
+        '''
+        Describes the weights as distances in (lat, lon, birthyear): each mismatching category multiplies the sum of
+        the geographic and the time distance by 100, so rows are most likely to be close to rows in their own bucket
+        of categories.
+
+        :param features: records returned by `prepare`
+        :rtype: spatial.SearchSpace
+        '''
+        points = numpy.column_stack([features['lat'], features['lon'], features['birthyear']])
+        categories = numpy.column_stack([features[column] for column in CATEGORIES])
+        scales = [100.0 ** mismatches / 1000 for mismatches in range(len(CATEGORIES) + 1)]
+
+        return spatial.SearchSpace(points, norms=[(0, 1), (2,)], categories=categories, scales=scales)
+
     def _initialize_geocoder(self):
         '''
         Loads the country geocoding dataset into memory, to be used as fallback.
@@ -69,6 +186,19 @@ class WeightCalculator(object):
 
         return geocoder
 
+    def _locate(self, row):
+        '''
+        :param row: row to locate
+        :return: lat\long values of the row, using the geocoder as a fallback if they are not specified
+        :rtype: tuple(float, float)
+        '''
+        lat, lon = self._parse_number(row['LAT']), self._parse_number(row['LON'])
+
+        if lat is None or lon is None:
+            return self._geocoder[row['countryCode']]
+
+        return lat, lon
+
     def _numify(self, val):
         '''
         Extracts float value from string. More robust than the default "float" casting.
@@ -76,5 +206,21 @@ class WeightCalculator(object):
         :param val: value to convert to float
         :return: float value
         '''
-        matcher = re.compile('\-{0,1}\d*\.{0,1}\d*')
-        return float(matcher.match(val).group())
+        number = self._parse_number(val)
+
+        if number is None:
+            raise ValueError('could not convert string to float: {0!r}'.format(val))
+
+        return number
+
+    def _parse_number(self, val):
+        '''
+        :param val: value to convert to float
+        :return: float value, or None if the value does not start with a number
+        '''
+        match = NUMBER_PATTERN.match(val).group()
+
+        if not any(c.isdigit() for c in match):
+            return None
+
+        return float(match)
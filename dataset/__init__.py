@@ -0,0 +1,269 @@
+'''
+Columnar datasets, parsed from CSV files.
+
+Each column is stored as a single typed array rather than as a string per row (see `dataset.columns`). Parsed columns
+are cached in a binary file next to the CSV file, which is used as long as the CSV file is not changed.
+'''
+
+import collections.abc
+import csv
+import hashlib
+import itertools
+import json
+import os
+
+import numpy
+
+import instrument
+from dataset.columns import Column
+
+
+CACHE_VERSION = 1
+
+
+class RowsView(collections.abc.Sequence):
+    '''
+    Read-only view of the rows of a dataset, where each row is a dict of column titles to values, as read from the CSV
+    file. Rows are built on access, and slicing a view returns a view.
+    '''
+
+    def __init__(self, columns, indices=None):
+        '''
+        :param columns: columns of the dataset, by title, ordered as in the CSV file
+        :type columns: collections.OrderedDict
+        :param indices: positions of the rows in the view. all rows if not given. optional
+        '''
+        self._columns = columns
+        self._length = len(next(iter(columns.values()))) if columns else 0
+        self._indices = indices
+
+    def __len__(self):
+        return len(self._indices) if self._indices is not None else self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = self._indices if self._indices is not None else numpy.arange(self._length)
+            return RowsView(self._columns, indices[index])
+
+        position = int(self._indices[index]) if self._indices is not None else range(self._length)[index]
+        return {title: column.to_strings([position])[0] for title, column in self._columns.items()}
+
+    def __iter__(self):
+        titles = list(self._columns)
+        values = [column.to_strings(self._indices) for column in self._columns.values()]
+
+        for row_values in zip(*values):
+            yield dict(zip(titles, row_values))
+
+
+class Dataset(object):
+    '''
+    Parses CSV datasets and abstracts operations on top of them.
+
+    Each row in the parsed dataset is represented as a dict, where the keys are the column titles and the values
+    are the actual values of each row. Columns could also be accessed as typed arrays.
+    '''
+
+    def __init__(self, filename, sort_by=None, dtypes=None, use_cache=True):
+        '''
+        :param filename: name of csv file
+        :param sort_by: name of column to sort rows by. optional
+        :param dtypes: kinds of columns, by title, as one of dataset.columns.KINDS. kinds of other columns are
+                       inferred. optional
+        :param use_cache: whether to read and write the binary cache of the csv file. optional
+        '''
+        self._filename = filename
+        self._sort_by = sort_by
+        self._dtypes = dict(dtypes or {})
+
+        cache_filename = '{0}.dataset.npz'.format(filename)
+        stat = os.stat(filename)
+        source = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+        with instrument.stage('dataset.load', filename=filename) as stage:
+            with instrument.stage('dataset.read_cache'):
+                cached = _load_cache(cache_filename, source, self._dtypes, filename) if use_cache else None
+
+            if cached is not None:
+                columns, self._source_digest = cached
+            else:
+                with instrument.stage('dataset.parse', bytes=source['size']):
+                    columns, self._source_digest = self._parse()
+
+                if use_cache:
+                    with instrument.stage('dataset.write_cache'):
+                        _save_cache(cache_filename, columns, source, self._source_digest, self._dtypes)
+
+            if sort_by is not None:
+                with instrument.stage('dataset.sort', column=sort_by):
+                    # a stable sort of the values as strings, as rows were always sorted
+                    keys = columns[sort_by].to_strings()
+                    order = numpy.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=numpy.int64)
+                    columns = collections.OrderedDict((title, column.take(order)) for title, column in columns.items())
+
+            stage['cached'] = cached is not None
+            stage['rows'] = len(next(iter(columns.values()))) if columns else 0
+
+        self._columns = columns
+        self._rows = RowsView(columns)
+
+    def _parse(self):
+        '''
+        :return: columns of the csv file, and the hash of the file
+        '''
+        with open(self._filename, 'rb') as f:
+            source_digest = hashlib.sha1(f.read()).hexdigest()
+
+        with open(self._filename, 'r', encoding='utf-8-sig') as f:
+            reader = csv.reader(f, delimiter=',', dialect=csv.excel_tab)
+            field_names = next(reader)
+
+            # blank lines are skipped, and rows that are shorter than the title row are missing their last values
+            values = [[] for _ in field_names]
+            for row_values in reader:
+                if not row_values:
+                    continue
+
+                for column_values, row_value in itertools.zip_longest(values, row_values[:len(field_names)],
+                                                                     fillvalue=''):
+                    column_values.append(row_value)
+
+        columns = collections.OrderedDict()
+        for field_name, column_values in zip(field_names, values):
+            columns[field_name] = Column.from_strings(column_values, self._dtypes.get(field_name))
+
+        return columns, source_digest
+
+    @property
+    def filename(self):
+        '''
+        :return: name of the csv file
+        :rtype: str
+        '''
+        return self._filename
+
+    @property
+    def digest(self):
+        '''
+        :return: hash of the csv file and of the order of the rows, identifying the rows of the dataset
+        :rtype: str
+        '''
+        return hashlib.sha1('{0}:{1}'.format(self._source_digest, self._sort_by).encode()).hexdigest()
+
+    @property
+    def columns(self):
+        '''
+        :return: titles of the columns, ordered as in the csv file
+        :rtype: list(str)
+        '''
+        return list(self._columns)
+
+    @property
+    def rows(self):
+        '''
+        :return: rows of the dataset
+        :rtype: RowsView
+        '''
+        return self._rows
+
+    @property
+    def amount_of_pairs(self):
+        '''
+        :return: how many pairs of two different rows there could be
+        :rtype: int
+        '''
+        amount_of_rows = len(self._rows)
+        ncr_rows_choose_2 = amount_of_rows * (amount_of_rows - 1) / 2
+        return ncr_rows_choose_2
+
+    def get_dtype(self, column_name):
+        '''
+        :param column_name: name of the column
+        :return: kind of the column, one of dataset.columns.KINDS
+        :rtype: str
+        '''
+        return self._columns[column_name].kind
+
+    def get_array(self, column_name):
+        '''
+        :param column_name: name of the column
+        :return: all values of all rows for the given column, as numbers. missing values of float columns are NaN. for
+                 category columns, the codes of the values (see `get_categories`)
+        :rtype: numpy.ndarray
+        '''
+        return self._columns[column_name].values
+
+    def get_categories(self, column_name):
+        '''
+        :param column_name: name of a category column
+        :return: distinct values of the column, by code
+        :rtype: list(str)
+        '''
+        return self._columns[column_name].categories
+
+    def get_column(self, column_name):
+        '''
+        :param column_name: name of the column
+        :return: all values of all rows for the given column
+        '''
+        return self._columns[column_name].to_strings()
+
+    def map(self, fn, column_name):
+        '''
+        Applies a function to all rows in the dataset for a given column.
+
+        :param fn: function to apply
+        :param column_name: column to get data for
+        :return: the result of the map function
+        '''
+        return list(map(fn, self.get_column(column_name)))
+
+
+def _load_cache(cache_filename, source, dtypes, filename):
+    '''
+    Loads the parsed columns of a csv file from its cache. The cache is valid if the csv file has the same size and
+    modification time as when the cache was written, or failing that, the same hash.
+
+    :return: columns and hash of the csv file, or None if there's no valid cache
+    '''
+    try:
+        with numpy.load(cache_filename, allow_pickle=False) as cache:
+            arrays = dict(cache.items())
+            meta = json.loads(str(arrays['meta']))
+    except (IOError, ValueError, KeyError):
+        return None
+
+    if meta['version'] != CACHE_VERSION or meta['dtypes'] != dtypes:
+        return None
+
+    if meta['source'] != source:
+        with open(filename, 'rb') as f:
+            if hashlib.sha1(f.read()).hexdigest() != meta['digest']:
+                return None
+
+    columns = collections.OrderedDict()
+    for i, (title, kind) in enumerate(meta['columns']):
+        columns[title] = Column.from_arrays(kind, arrays, prefix='{0}_'.format(i))
+
+    # the file was touched but not changed, so the cache is valid again by its modification time
+    if meta['source'] != source:
+        _save_cache(cache_filename, columns, source, meta['digest'], dtypes)
+
+    return columns, meta['digest']
+
+
+def _save_cache(cache_filename, columns, source, source_digest, dtypes):
+    meta = {'version': CACHE_VERSION,
+            'source': source,
+            'digest': source_digest,
+            'dtypes': dtypes,
+            'columns': [[title, column.kind] for title, column in columns.items()]}
+
+    arrays = {}
+    for i, column in enumerate(columns.values()):
+        arrays.update(column.to_arrays(prefix='{0}_'.format(i)))
+
+    # written aside and then moved into place, so a cache is never read half written
+    temporary_filename = '{0}.tmp.npz'.format(cache_filename)
+    numpy.savez(temporary_filename, meta=numpy.array(json.dumps(meta)), **arrays)
+    os.replace(temporary_filename, cache_filename)
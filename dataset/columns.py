@@ -0,0 +1,209 @@
+'''
+Typed columns of a dataset.
+
+A column is stored either as numbers or dictionary-encoded, as integer codes into a table of its distinct values. A
+column is numeric only if every one of its values is written exactly as the number would be formatted back, so the
+original strings can always be restored from the numbers.
+'''
+
+import math
+
+import numpy
+
+
+KINDS = ('int', 'float', 'category')
+
+
+class Column(object):
+    '''
+    Values of a single column.
+
+    'int' columns are int64 arrays. 'float' columns are float64 arrays, along with masks of missing (empty) values,
+    which are NaN, and of values that are written as integers. 'category' columns are int32 codes into the list of
+    distinct values.
+    '''
+
+    def __init__(self, kind, values, categories=None, missing=None, integral=None):
+        '''
+        :param kind: one of KINDS
+        :param values: numbers, or codes of a 'category' column
+        :type values: numpy.ndarray
+        :param categories: distinct values of a 'category' column. optional
+        :param missing: mask of the missing values of a 'float' column. optional
+        :param integral: mask of the values of a 'float' column that are written as integers. optional
+        '''
+        self._kind = kind
+        self._values = values
+        self._categories = categories
+        self._missing = missing
+        self._integral = integral
+
+    @classmethod
+    def from_strings(cls, strings, kind=None):
+        '''
+        :param strings: values of the column, as read from the csv file
+        :param kind: one of KINDS. inferred from the values if not given. optional
+        :rtype: Column
+        '''
+        if kind is None:
+            kinds = [kind for kind in ('int', 'float') if _round_trips(strings, kind)]
+            kind = kinds[0] if kinds else 'category'
+        elif kind not in KINDS:
+            raise Exception('Unknown column kind "{0}"'.format(kind))
+        elif kind != 'category' and not _round_trips(strings, kind):
+            raise Exception('Values can\'t be stored as {0} without changing them'.format(kind))
+
+        if kind == 'int':
+            return cls(kind, numpy.array([int(x) for x in strings], dtype=numpy.int64))
+
+        if kind == 'float':
+            missing = numpy.array([x == '' for x in strings], dtype=bool)
+            integral = numpy.array([_is_integer(x) for x in strings], dtype=bool)
+            values = numpy.array([float(x) if x != '' else float('nan') for x in strings], dtype=numpy.float64)
+            return cls(kind, values, missing=missing, integral=integral)
+
+        ids = {}
+        codes = numpy.array([ids.setdefault(x, len(ids)) for x in strings], dtype=numpy.int32)
+        return cls(kind, codes, categories=list(ids))
+
+    @property
+    def kind(self):
+        '''
+        :return: one of KINDS
+        :rtype: str
+        '''
+        return self._kind
+
+    @property
+    def values(self):
+        '''
+        :return: numbers, or codes of a 'category' column
+        :rtype: numpy.ndarray
+        '''
+        return self._values
+
+    @property
+    def categories(self):
+        '''
+        :return: distinct values of a 'category' column, by code
+        :rtype: list(str)
+        '''
+        return self._categories
+
+    def __len__(self):
+        return len(self._values)
+
+    def take(self, indices):
+        '''
+        :param indices: positions of the values to take
+        :return: column of the values at the given positions
+        :rtype: Column
+        '''
+        def take(mask):
+            return mask[indices] if mask is not None else None
+
+        return Column(self._kind, self._values[indices], self._categories, take(self._missing), take(self._integral))
+
+    def to_strings(self, indices=None):
+        '''
+        :param indices: positions of the values to format. all of them if not given. optional
+        :return: the values, exactly as they were read from the csv file
+        :rtype: list(str)
+        '''
+        column = self.take(indices) if indices is not None else self
+
+        if self._kind == 'category':
+            categories = self._categories
+            return [categories[code] for code in column._values.tolist()]
+
+        if self._kind == 'int':
+            return [str(x) for x in column._values.tolist()]
+
+        return [_format_float(x, missing, integral) for x, missing, integral in
+                zip(column._values.tolist(), column._missing.tolist(), column._integral.tolist())]
+
+    def to_arrays(self, prefix):
+        '''
+        :param prefix: prefix of the names of the arrays
+        :return: arrays that store the column, by name
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        arrays = {'{0}values'.format(prefix): self._values}
+
+        if self._kind == 'category':
+            # as a string table of utf-8 data and offsets, since fixed width strings would be padded to the longest
+            encoded = [category.encode('utf-8') for category in self._categories]
+            offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+            numpy.cumsum([len(x) for x in encoded], out=offsets[1:])
+
+            arrays['{0}category_offsets'.format(prefix)] = offsets
+            arrays['{0}category_data'.format(prefix)] = numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+        if self._kind == 'float':
+            arrays['{0}missing'.format(prefix)] = self._missing
+            arrays['{0}integral'.format(prefix)] = self._integral
+
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, kind, arrays, prefix):
+        '''
+        :param kind: one of KINDS
+        :param arrays: arrays returned by `to_arrays`
+        :param prefix: prefix of the names of the arrays
+        :rtype: Column
+        '''
+        def get(name):
+            return arrays['{0}{1}'.format(prefix, name)]
+
+        if kind == 'category':
+            data = get('category_data').tobytes()
+            bounds = get('category_offsets').tolist()
+            categories = [data[start:stop].decode('utf-8') for start, stop in zip(bounds[:-1], bounds[1:])]
+            return cls(kind, get('values'), categories=categories)
+        if kind == 'float':
+            return cls(kind, get('values'), missing=get('missing'), integral=get('integral'))
+
+        return cls(kind, get('values'))
+
+
+def _is_integer(string):
+    try:
+        return str(int(string)) == string
+    except ValueError:
+        return False
+
+
+def _round_trips(strings, kind):
+    '''
+    :return: whether all values are written exactly as numbers of the given kind would be formatted
+    '''
+    if not strings:
+        return False
+
+    if kind == 'int':
+        return all(_is_integer(x) and -2 ** 63 <= int(x) < 2 ** 63 for x in strings)
+
+    for x in strings:
+        if x == '':
+            continue
+
+        try:
+            number = float(x)
+        except ValueError:
+            return False
+
+        if repr(number) == x:
+            continue
+
+        # integers are written without a fraction, and must be exactly representable
+        if not (_is_integer(x) and math.isfinite(number) and int(number) == int(x)):
+            return False
+
+    return True
+
+
+def _format_float(value, missing, integral):
+    if missing:
+        return ''
+
+    return str(int(value)) if integral else repr(value)
@@ -0,0 +1,217 @@
+'''
+Suggests people to join seed groups, for any amount of groups, with the suggestions streamed out as they are found.
+
+Groups are read one at a time, and are evaluated in blocks, so memory is bounded by the size of a block rather than by
+the amount of groups. There are two methods:
+    joint - joint neighbours of the members (see `graph.joint`). blocks are spread over a pool of worker processes,
+            each of which loads the graph on its own. graphs in the binary format are mapped into memory, so all
+            workers share the same pages of the graph file
+    pagerank - personalized pagerank from the members (see `graph.pagerank`). each block is scored at once, as the
+               columns of a single matrix, in this process
+
+Groups are dicts with the 'members' of the group, and optionally its 'name' and its own 'weights' (with the joint
+method). They are given back in order, with their 'neighbours', or with an 'error' if they could not be evaluated.
+'''
+
+import collections
+import json
+import multiprocessing
+
+import graph
+import instrument
+from graph import joint
+from graph import pagerank
+
+
+METHODS = ('joint', 'pagerank')
+
+# the graph of a worker process, and how to find the neighbours of groups in it
+_worker_graph = None
+_worker_options = None
+
+
+def _initialize_worker(graph_filename, options):
+    global _worker_graph
+    global _worker_options
+
+    _worker_graph = graph.Graph()
+    _worker_graph.load(graph_filename)
+    _worker_options = options
+
+
+def _descend_block(groups):
+    '''
+    :param groups: block of groups
+    :return: neighbours of each group, and an error for each group that could not be evaluated
+    :rtype: list(tuple(list(str), str))
+    '''
+    results = []
+
+    for group in groups:
+        with instrument.stage('descender.group', groups=1, members=len(group['members'])):
+            try:
+                neighbours = _worker_graph.get_joint_neighbours(group['members'],
+                                                                group_size=_worker_options['group_size'],
+                                                                mode=_worker_options['mode'],
+                                                                weights=group.get('weights',
+                                                                                  _worker_options['weights']))
+            except Exception as err:
+                results.append(([], str(err)))
+            else:
+                results.append((neighbours, None))
+
+    return results
+
+
+def read_groups(filename):
+    '''
+    :param filename: file of groups, either as JSON lines, one group per line, if its extension is .jsonl, or as a
+                     JSON list. only JSON lines are read one group at a time
+    :return: iterator over the groups
+    '''
+    with open(filename, 'r', encoding='utf-8') as f:
+        if not filename.endswith('.jsonl'):
+            for group in json.load(f):
+                yield group
+
+            return
+
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def strip_non_ascii(name):
+    '''
+    :param name: a name
+    :return: the name without any of its non-ASCII characters
+    :rtype: str
+    '''
+    return name.encode('ascii', 'ignore').decode('ascii')
+
+
+class Descender(object):
+    '''
+    Evaluates groups in blocks, over a graph file.
+    '''
+
+    # amount of groups evaluated at once
+    block_size = 256
+
+    def __init__(self, graph_filename, method='joint', group_size=50, mode='sum', weights=None, alpha=0.15,
+                 workers=1, precompute=False):
+        '''
+        :param graph_filename: file containing the graph
+        :param method: one of METHODS. optional
+        :param group_size: how many neighbours to find for each group. optional
+        :param mode: how to aggregate the distances from the members, with the joint method. see `graph.joint`.
+                     optional
+        :param weights: weight vector to rank neighbours by, for groups without their own, with the joint method.
+                        optional
+        :param alpha: probability of restarting a walk at the members, with the pagerank method. optional
+        :param workers: number of worker processes, with the joint method. if 1, groups are evaluated in this process.
+                        optional
+        :param precompute: precompute the scores of all edges of a small graph, with the pagerank method, which takes
+                           dense matrices of all edges by all edges (see `pagerank.Recommender`). optional
+        '''
+        if method not in METHODS:
+            raise Exception('Unknown method "{0}"'.format(method))
+
+        if mode not in joint.MODES:
+            raise Exception('Unknown mode "{0}"'.format(mode))
+
+        if method == 'pagerank' and weights is not None:
+            raise Exception('Weights only apply to the joint method')
+
+        self._graph_filename = graph_filename
+        self._method = method
+        self._alpha = alpha
+        self._precompute = precompute
+        self._workers = workers
+        self._options = {'group_size': group_size, 'mode': mode, 'weights': weights}
+
+    def run(self, groups):
+        '''
+        :param groups: iterator over groups
+        :return: iterator over the groups, in order, with their neighbours, as they are found
+        '''
+        blocks = _iter_blocks(groups, self.block_size)
+        pool = None
+
+        if self._method == 'pagerank':
+            results = self._run_pagerank(blocks)
+        elif self._workers > 1:
+            pool = multiprocessing.Pool(self._workers, initializer=_initialize_worker,
+                                        initargs=(self._graph_filename, self._options))
+            results = _imap_bounded(pool, _descend_block, blocks, 2 * self._workers)
+        else:
+            _initialize_worker(self._graph_filename, self._options)
+            results = ((block, _descend_block(block)) for block in blocks)
+
+        try:
+            for block, block_results in results:
+                for group, (neighbours, error) in zip(block, block_results):
+                    group['neighbours'] = neighbours
+
+                    if error is not None:
+                        group['error'] = error
+
+                    yield group
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def _run_pagerank(self, blocks):
+        '''
+        :return: iterator over (block, results of each of its groups)
+        '''
+        loaded_graph = graph.Graph()
+        loaded_graph.load(self._graph_filename)
+
+        with instrument.stage('descender.pagerank.matrix'):
+            recommender = pagerank.Recommender(loaded_graph, alpha=self._alpha, precompute=self._precompute)
+
+        for block in blocks:
+            with instrument.stage('descender.pagerank', groups=len(block)):
+                neighbours = recommender.recommend_groups([group['members'] for group in block],
+                                                          group_size=self._options['group_size'])
+
+            yield block, [(group_neighbours, None) for group_neighbours in neighbours]
+
+
+def _iter_blocks(items, block_size):
+    '''
+    :return: iterator over lists of at most <block_size> consecutive items
+    '''
+    block = []
+
+    for item in items:
+        block.append(item)
+
+        if len(block) >= block_size:
+            yield block
+            block = []
+
+    if block:
+        yield block
+
+
+def _imap_bounded(pool, function, items, pending_limit):
+    '''
+    Same as `pool.imap`, only at most <pending_limit> items are sent to the pool ahead of the results that were
+    returned, so the items are read as they are needed rather than all at once.
+
+    :return: iterator over (item, result)
+    '''
+    pending = collections.deque()
+
+    for item in items:
+        pending.append((item, pool.apply_async(function, (item,))))
+
+        if len(pending) >= pending_limit:
+            item, result = pending.popleft()
+            yield item, result.get()
+
+    while pending:
+        item, result = pending.popleft()
+        yield item, result.get()
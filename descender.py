@@ -1,37 +1,85 @@
 #!/usr/bin/env python
+#
+# The Descender Utility
+#
+# Suggests people to join each of the seed groups in a groups file, and renders them as an HTML page.
+#
+# Groups are given as a JSON list, or as JSON lines (a .jsonl file, one group per line) for large amounts of groups,
+# which are then read one at a time:
+#   {"name": "Physicists", "members": ["Albert Einstein", "Max Born"]}
+# Groups are evaluated in blocks, either over a pool of -j workers, or, with --method pagerank, a whole block at once.
+# The page is rendered while the groups are evaluated, and, with -o, the results are written as JSON lines as well, so
+# any amount of groups is gone over in bounded memory (see descend).
+#
+# example: python descender.py groups.jsonl -g graph.bin -o results.jsonl -j 4 --no-open
+#
+
 import argparse
 import json
 import jinja2
+import os
 import webbrowser
 
-import graph
+import descend
+import instrument
+from graph import joint
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument('groups', help='json file describing seed groups')
+    parser.add_argument('groups', help='json file describing seed groups, or a .jsonl file with a group per line. a group could have its own "weights"')
+    parser.add_argument('-g', '--graph', help='file containing the graph information', default='./graph.pickle')
+    parser.add_argument('-o', '--output', help='file to write the results into, as JSON lines', required=False)
+    parser.add_argument('--html', help='file to render the results into', default='/tmp/descender.results.html')
+    parser.add_argument('--no-open', help='do not open the rendered results in a browser', action='store_true')
+    parser.add_argument('-n', '--group-size', help='amount of neighbours to find for each group', type=int, default=50)
+    parser.add_argument('-w', '--weights', help='weight vector to rank neighbours by, as a json object, e.g. {"time": 2.0}. requires a graph generated with --components', type=json.loads, required=False)
+    parser.add_argument('-m', '--method', help='how to find neighbours of groups: joint neighbours of the members, or personalized pagerank, which looks several hops out', choices=descend.METHODS, default='joint')
+    parser.add_argument('--mode', help='how to aggregate the distances from the members, with --method joint', choices=joint.MODES, default='sum')
+    parser.add_argument('-a', '--alpha', help='probability of restarting a walk at the members, with --method pagerank', type=float, default=0.15)
+    parser.add_argument('-j', '--workers', help='number of processes to evaluate groups in, with --method joint', type=int, default=1)
+    parser.add_argument('--precompute', help='precompute the pagerank scores of all people of a graph of up to 4096 people, with --method pagerank, which takes about 40 bytes of memory per pair of people', action='store_true')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    # load group from file
-    with open(args.groups, 'rb') as f:
-        groups = json.loads(f.read())
+    if args.method == 'pagerank' and args.weights is not None:
+        parser.error('--weights only apply to --method joint')
+
+    instrument.start(args)
 
     # load template from file
-    with open('descender.html.jinja', 'rb') as f:
+    with open('descender.html.jinja', 'r', encoding='utf-8') as f:
         template = jinja2.Template(f.read())
 
-    # load graph from file
-    graph = graph.Graph()
-    graph.load('./graph.pickle')
+    descender = descend.Descender(args.graph, method=args.method, group_size=args.group_size, mode=args.mode,
+                                  weights=args.weights, alpha=args.alpha, workers=args.workers,
+                                  precompute=args.precompute)
+
+    output_file = open(args.output, 'w', encoding='utf-8') if args.output is not None else None
+
+    def write_results(groups):
+        '''
+        Writes each group as a JSON line once it's evaluated, and passes it on to be rendered.
+        '''
+        for group in groups:
+            if output_file is not None:
+                output_file.write(json.dumps(group))
+                output_file.write('\n')
+
+            yield dict(group, neighbours=[descend.strip_non_ascii(name) for name in group['neighbours']])
 
-    # find neighbours using the given groups and weight vector
-    for group in groups:
-        group['neighbours'] = graph.get_joint_neighbours(group['members'], group_size=50)
-        group['neighbours'] = [''.join([c for c in x if ord(c) < 128]) for x in group['neighbours']]
+    # find neighbours of the groups, and render them as they are found
+    try:
+        with instrument.stage('descender.run', method=args.method, workers=args.workers):
+            with open(args.html, 'w', encoding='utf-8') as f:
+                for chunk in template.generate(groups=write_results(descender.run(descend.read_groups(args.groups)))):
+                    f.write(chunk)
+    finally:
+        if output_file is not None:
+            output_file.close()
 
-    # generate output file
-    with open('/tmp/descender.results.html', 'wb') as f:
-        f.write(template.render({'groups': groups}))
+    instrument.finish(args)
 
     # open it
-    webbrowser.open('file:///tmp/descender.results.html')
+    if not args.no_open:
+        webbrowser.open('file://{0}'.format(os.path.abspath(args.html)))
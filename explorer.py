@@ -5,87 +5,117 @@
 # Lets you explore a generated graph by querying it: for a given person name, it returns the ten closest neighbours.
 #
 # Available queries and commands are:
-# 1. <Person Name>[:x] - searches for that person. case insensitive. must be spelled exactly as it is in the graph.
-#                        optionally followed by :x where x is the desired number of results to display.
+# 1. <Person Name>[:x] - searches for that person. case and accent insensitive. must otherwise be spelled as it is in
+#                        the graph. optionally followed by :x where x is the desired number of results to display.
 #    example a: Ariel Sharon
 #    example b: Ariel Sharon:20
 #
-# 2. ~<String> - searches for people whose names contain the given string.
+# 2. ~<String> - searches for people whose names start with or contain the given string. if there are none, shows
+#                people whose names are similar to it.
 #    example: ~sharon
 #
-# 3. [<Person Name>, ...<Person Name>] - searches for joint neighbours of specified people. case insensitive.
-#                                        must be spelled exactly as it is in the graph.
+# 3. [<Person Name>, ...<Person Name>] - searches for joint neighbours of specified people. case and accent insensitive.
+#                                        must otherwise be spelled as it is in the graph.
 #    example: [Ariel Sharon, Ehud Barak]
 #
 # 4. exit - closes the explorer app
 #
+# The explorer could also answer a batch of queries, given as a JSONL file (or - for stdin) with -b. Each line is either
+# a query in the syntax above, or a JSON object such as:
+#   {"id": 1, "type": "neighbours", "name": "Ariel Sharon", "limit": 20}
+#   {"id": 2, "type": "search", "query": "sharon"}
+#   {"id": 3, "type": "joint", "names": ["Ariel Sharon", "Ehud Barak"], "group_size": 10, "mode": "sum"}
+#   {"id": 4, "type": "reverse", "name": "Ariel Sharon", "limit": 20}
+# Queries are answered by a pool of -w workers, and the answers are written as JSONL, in order, along with how long each
+# query took. A summary with the throughput and latency percentiles is printed once all queries are answered.
+#
+# example: python explorer.py graph.bin -b queries.jsonl -o answers.jsonl -w 4
+#
 
 import argparse
+import json
+import sys
 
 import graph
+import instrument
+import query
+import query.batch
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('graph', help='file containing the graph information', default='graph.pickle')
+    parser.add_argument('-b', '--batch', help='JSONL file of queries to answer, or - for stdin', required=False)
+    parser.add_argument('-o', '--output', help='file to write the answers of a batch into. stdout if not given', required=False)
+    parser.add_argument('-w', '--workers', help='number of processes to answer a batch with', type=int, default=1)
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
+    instrument.start(args)
+
+    # answer a batch of queries. answers go to the output, and the summary to stderr, so answers could be piped
+    if args.batch is not None:
+        queries_file = sys.stdin if args.batch == '-' else open(args.batch, 'r', encoding='utf-8')
+        output_file = sys.stdout if args.output is None else open(args.output, 'w', encoding='utf-8')
+
+        try:
+            summary = query.batch.run(args.graph, query.batch.read_lines(queries_file), output_file,
+                                      workers=args.workers)
+        finally:
+            if queries_file is not sys.stdin:
+                queries_file.close()
+            if output_file is not sys.stdout:
+                output_file.close()
+
+        print(json.dumps(summary, indent=2), file=sys.stderr)
+        instrument.finish(args)
+        sys.exit(0)
+
     # load graph from file
     graph = graph.Graph()
     graph.load(args.graph)
 
     # main loop
     while True:
-        query = input('query> ')
+        text = input('query> ')
 
         # break the loop
-        if query == 'exit':
+        if text == 'exit':
             break
 
-        # return all relevant edges which contain the query's string
-        elif query[0] == '~':
-            results = [x for x in graph.edges if query[1:] in x.lower()]
-            print(', '.join(results))
+        if not text.strip():
+            continue
 
-        # return all relevant edges which contain the query's string
-        elif query[0] == '[' and query[-1] == ']':
-            names = [word.strip().title() for word in query[1:-1].split(',')]
+        request = query.parse_text(text)
+        response = query.answer(graph, request)
 
-            try:
-                result = graph.get_joint_neighbours(names, group_size=20)
-            except Exception as err:
+        # all relevant edges which contain the query's string, or similar ones if there are none
+        if request['type'] == 'search':
+            print(', '.join(response['results']))
+
+        # joint neighbours of all given edges
+        elif request['type'] == 'joint':
+            if 'error' in response:
                 print('Query failed: probably one of the queries did not yield results')
                 continue
 
-            for res in result:
-                print(res)
+            for name, _ in response['results']:
+                print(name)
 
-        # find closest neighbours for the given name
+        # closest neighbours for the given name, sorted by proximity (lower weight = higher proximity)
         else:
+            if 'error' in response:
+                print('Query failed: no entry named "{0}"'.format(request['name']))
+
+                if response['suggestions']:
+                    print('Did you mean: {0}?'.format(', '.join(response['suggestions'])))
 
-            # try to extract limit from query. if it fails, it means that the user did not
-            # specify it - so use the default limit value
-            try:
-                query, limit = query.split(':')
-                limit = int(limit)
-            except:
-                limit = 10
-
-            # normalize and capitalize query
-            query = query.title()
-
-            # find neighbours if query exists in graph
-            try:
-                neighbours = graph.get_neighbours(query)
-            except:
-                print('Query failed: no entry named "{0}"'.format(query))
                 continue
 
-            # sort neighbours by proximity (lower weight = higher proximity)
-            result = sorted(list(neighbours.items()), key=lambda x: x[1])
+            # print first results
+            for name, weight in response['results']:
+                print('{0} :: {1}'.format(name, weight))
 
-            # print first ten results
-            for res in result[:limit]:
-                print('{0} :: {1}'.format(res[0], res[1]))
+    instrument.finish(args)
 
     print('bye')
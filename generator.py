@@ -7,104 +7,440 @@
 # to them.
 #
 # The calculations used are interchangeable, and you can add your own method of calculation by implementing a python
-# file with WeightCalculator class (see examples under `calculators/`)
+# file with WeightCalculator class (see examples under `calculators/`), either as a module of the calculators package,
+# as a package of its own that registers it as an entry point, or as a file that's given by its path. Calculators could
+# also be combined into a weighted sum of them, e.g. -wc "time_and_space + 0.5 * popularity" (see `calculators`)
+#
+# A WeightCalculator must implement `calculate(a, b)`, which returns the weight between two rows, and should declare
+# `columns`, the columns of the dataset it reads. It can also implement the batch interface, which is used instead
+# whenever it's available, and declare that it does with `batch = True`:
+#   prepare(rows) - returns features of the given rows, e.g. a dict of numpy arrays, one per column
+#   calculate_block(features, a, b) - given two arrays of row indices, returns a matrix where [i][j] is the weight
+#                                     between rows a[i] and b[j]
+#
+# The cost of a calculator, in pairs per second, is measured with `benchmark.py --calculators`
+#
+# A batch calculator whose weights are bounded by a distance between the rows can also implement
+#   search_space(features) - returns a spatial.SearchSpace, which lets graphs with --max-vertices be built with a
+#                            pruned search, rather than by calculating every pair (see `spatial`)
+#
+# A batch calculator whose weights are made of per-feature components can also implement
+#   calculate_components(features, a, b) - returns matrices of the components of the weights between rows a[i] and
+#                                          b[j], as described by the calculator's `component_model`, which lets graphs
+#                                          with --max-vertices keep them with --components, so their neighbours could be
+#                                          ranked again with another weight vector without building them again (see
+#                                          `graph/components.py`)
+#
+# A graph whose output has a database extension (.sqlite, .sqlite3 or .db) is built straight into a SQLite database,
+# rather than in memory, so it could be larger than memory (see `graph/sqlite.py`)
+#
+# A full graph built with --tiled is calculated one tile of rows x rows at a time, and the vertices of each tile are
+# spilled into the given directory, so memory is bounded by the size of a tile. A build that's interrupted resumes from
+# the tiles that were finished, when it's run again with the same directory. Once all tiles are finished, they are
+# merged straight into the output, which is a binary graph file (see `tiles`)
 #
 
-import csv
+import hashlib
+import heapq
 import itertools
 import argparse
-import imp
+import json
+import multiprocessing
+import os
+import pickle
+import numpy
 import progressbar
 
+import calculators
 import graph
-import trim
+import instrument
+import spatial
+import tiles
+from dataset import Dataset
 
 
-class Dataset(object):
+class GraphBuilder(object):
     '''
-    Parses CSV datasets and abstracts operations on top of them.
-
-    Each row in the parsed dataset is represented as a dict, where the keys are the column titles and the values
-    are the actual values of each row.
+    Used to build a weighted graph between all rows in a given dataset, using a given calculator.
     '''
 
-    def __init__(self, filename, sort_by=None):
+    # approximate amount of pairs calculated at once by batch calculators, or by each worker
+    block_size = 2 ** 20
+
+    def build_graph(self, dataset, calculator, notice_interval=10000, limit_rows=None, threshold=None,
+                    max_vertices=None, workers=None, pruned=False, database=None, components=False):
         '''
-        :param filename: name of csv file
-        :param sort_by: name of column to sort rows by. optional
+        :param dataset: dataset object to build graph from
+        :param calculator: calculator class to use for calculating weight of each vertex
+        :param notice_interval: how many iterations should pass before updating the user. optional
+        :param limit_rows: use only first n rows of the dataset. optional
+        :param threshold: discard vertex if its weight is above this threshold. optional
+        :param max_vertices: keep only the <max_vertices> lightest outgoing vertices of each edge, without ever holding
+                             the full graph in memory. the result is the same as trimming the full graph. optional
+        :param workers: number of processes to calculate pairs in. the result is the same as with a single one. optional
+        :param pruned: find the lightest outgoing vertices of each edge with a pruned search over the calculator's
+                       search space, instead of calculating all pairs. the result is the same. optional
+        :param database: SQLite database to build the graph into, rather than in memory, so it does not have to fit in
+                         memory. it's finished once the graph is saved (see `graph.Graph.create_database`). optional
+        :param components: keep the components of the weights of the selected vertices, as calculated by the
+                           calculator's `calculate_components`. requires max_vertices. optional
+        :return: weighted graph where rows['name'] are the edges
         '''
-        self._rows = []
+        _validate_pruned(calculator, max_vertices, pruned)
+        _validate_components(calculator, max_vertices, components)
+        calculators.check_columns(calculator, dataset.columns)
 
-        with open('pantheon.csv', 'r', encoding='utf-8-sig') as f:
-            reader = csv.reader(f, delimiter=',', dialect=csv.excel_tab)
-            field_names = next(reader)
+        # a graph that's built with a threshold keeps few of all pairs
+        data_graph = graph.Graph(sparse=threshold is not None)
+        if database is not None:
+            data_graph.create_database(database)
 
-            for row_values in reader:
-                row = {field_name: row_value for field_name, row_value in zip(field_names, row_values)}
-                self._rows.append(row)
+        rows = dataset.rows
+        if limit_rows is not None:
+            rows = rows[:limit_rows]
 
-            if sort_by is not None:
-                self._rows = sorted(self._rows, key=lambda x: x[sort_by])
+        bar = progressbar.ProgressBar(max_value=(len(rows) * (len(rows) - 1) / 2))
+        bar.update(0)
 
-    @property
-    def rows(self):
-        '''
-        :return: rows of the dataset
-        :rtype: list(dict)
-        '''
-        return self._rows
+        with instrument.stage('build.graph', rows=len(rows), pairs=len(rows) * (len(rows) - 1) // 2,
+                              max_vertices=max_vertices, workers=workers, pruned=pruned) as stage:
+            if (workers is not None and workers > 1) or calculators.supports_batch(calculator):
+                features = self._prepare_features(dataset, rows, calculator)
+                self._build_shards(data_graph, rows, calculator, features, bar, threshold, max_vertices, workers,
+                                   pruned, components)
+            elif max_vertices is not None:
+                self._build_top_k_pairs(data_graph, rows, calculator, bar, notice_interval, threshold, max_vertices)
+            else:
+                self._build_pairs(data_graph, rows, calculator, bar, notice_interval, threshold)
 
-    @property
-    def amount_of_pairs(self):
-        '''
-        :return: how many pairs of two different rows there could be
-        :rtype: int
-        '''
-        amount_of_rows = len(self._rows)
-        ncr_rows_choose_2 = amount_of_rows * (amount_of_rows - 1) / 2
-        return ncr_rows_choose_2
+            # rows are added along with their first vertex that survives the threshold, so equal weights of a full graph
+            # are ordered by row once they are numbered in the order of the rows
+            data_graph.order_edges([row['wikiquotes_names'] for row in rows])
 
-    def get_column(self, column_name):
-        '''
-        :param column_name: name of the column
-        :return: all values of all rows for the given column
-        '''
-        return [row[column_name] for row in self._rows]
+            stage['edges'] = len(data_graph.edges)
+
+        bar.finish()
+
+        data_graph.manifest = self._create_manifest(rows, calculator, threshold, max_vertices)
 
-    def map(self, fn, column_name):
+        return data_graph
+
+    def build_tiled(self, dataset, calculator, output, directory, limit_rows=None, threshold=None, workers=None,
+                    tile_size=2 ** 11, weights_dtype=numpy.float32):
         '''
-        Applies a function to all rows in the dataset for a given column.
+        Builds a full graph straight into a binary graph file, one tile of pairs at a time, spilling the vertices of
+        each tile into a directory, so the pairs never have to fit in memory, and a build that was interrupted resumes
+        from the tiles it did not finish (see `tiles`). Each edge has the same neighbours, in the same order, as in the
+        graph built by `build_graph` and saved with the same weights dtype.
 
-        :param fn: function to apply
-        :param column_name: column to get data for
-        :return: the result of the map function
+        :param dataset: dataset object to build graph from
+        :param calculator: calculator class to use for calculating weight of each vertex
+        :param output: binary graph file to write the graph into
+        :param directory: directory to spill tiles into. it's removed once the graph is written
+        :param limit_rows: use only first n rows of the dataset. optional
+        :param threshold: discard vertex if its weight is above this threshold. optional
+        :param workers: number of processes to calculate tiles in. the result is the same as with a single one. optional
+        :param tile_size: amount of rows in each block, so tiles are of <tile_size> x <tile_size> pairs. optional
+        :param weights_dtype: dtype to store weights as. optional
+        :return: amount of tiles that were calculated, rather than resumed
+        :rtype: int
         '''
-        return list(map(fn, self.get_column(column_name)))
+        calculators.check_columns(calculator, dataset.columns)
+
+        rows = dataset.rows
+        if limit_rows is not None:
+            rows = rows[:limit_rows]
 
+        manifest = self._create_manifest(rows, calculator, threshold, None)
+        key = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()
 
-class GraphBuilder(object):
-    '''
-    Used to build a weighted graph between all rows in a given dataset, using a given calculator.
-    '''
+        build = tiles.TiledBuild(directory, key, len(rows), tile_size)
+        pending = build.pending
 
-    def build_graph(self, dataset, calculator, notice_interval=10000, limit_rows=None, threshold=None):
+        bar = progressbar.ProgressBar(max_value=(len(rows) * (len(rows) - 1) / 2))
+        iterations = sum(build.get_pairs(tile) for tile in build.finished)
+        bar.update(iterations)
+
+        with instrument.stage('build.tiled', rows=len(rows), tiles=len(build.tiles), pending=len(pending),
+                              tile_size=tile_size, workers=workers) as stage:
+            features = self._prepare_features(dataset, rows, calculator)
+
+            if workers is not None and workers > 1:
+                pool = multiprocessing.Pool(workers,
+                                            initializer=_initialize_worker,
+                                            initargs=(rows,
+                                                      calculators.get_sources(calculator),
+                                                      pickle.dumps(calculator),
+                                                      features,
+                                                      threshold,
+                                                      None,
+                                                      False))
+
+                # tiles are finished in any order, as each of them is spilled on its own
+                results = pool.imap_unordered(_spill_tile, [(build, tile) for tile in pending])
+            else:
+                pool = None
+                builder = _ShardBuilder(rows, calculator, threshold, None, features)
+                results = ((tile, build.spill_tile(tile, builder.calculate_block, threshold),
+                            builder.take_calculated_pairs()) for tile in pending)
+
+            try:
+                for tile, amount_of_vertices, calculated_pairs in results:
+                    build.finish_tile(tile, amount_of_vertices)
+                    instrument.count('build.calculated_pairs', calculated_pairs)
+
+                    iterations += build.get_pairs(tile)
+                    bar.update(iterations)
+            finally:
+                if pool is not None:
+                    pool.terminate()
+
+            bar.finish()
+
+            with instrument.stage('build.tiled.merge', tiles=len(build.tiles)):
+                encoded_manifest = numpy.frombuffer(json.dumps(manifest).encode('utf-8'), dtype=numpy.uint8)
+                stage['vertices'] = build.merge(output, [row['wikiquotes_names'] for row in rows], weights_dtype,
+                                                arrays={'manifest': encoded_manifest})
+
+        build.remove()
+
+        return len(pending)
+
+    def update_graph(self, previous_graph, dataset, calculator, limit_rows=None, threshold=None, max_vertices=None,
+                     pruned=False, components=False):
         '''
-        :param dataset: dataset object to build graph from
+        Updates a trimmed graph that was built from a previous version of the dataset, so it matches the current one.
+
+        Rows are matched by their `en_curid` and compared by a hash of their values, as recorded in the manifest of the
+        previous graph. Only changed rows, and rows that had changed or removed rows among their neighbours, are
+        calculated against all other rows. Other rows are only calculated against the changed rows. Saving the
+        result gives the same file as building the graph from scratch.
+
+        :param previous_graph: graph built with max_vertices from the previous version of the dataset
+        :param dataset: dataset object to update graph from
         :param calculator: calculator class to use for calculating weight of each vertex
-        :param notice_interval: how many iterations should pass before updating the user. optional
         :param limit_rows: use only first n rows of the dataset. optional
         :param threshold: discard vertex if its weight is above this threshold. optional
-        :return: weighted graph where rows['name'] are the edges
+        :param max_vertices: maximal outgoing vertices per edge
+        :param pruned: find the lightest outgoing vertices of recalculated rows with a pruned search. optional
+        :param components: keep the components of the weights of the selected vertices. optional
+        :return: the updated graph, and the amount of rows that were calculated against all other rows
+        :rtype: tuple(graph.Graph, int)
         '''
-        data_graph = graph.Graph()
+        _validate_pruned(calculator, max_vertices, pruned)
+        _validate_components(calculator, max_vertices, components)
+        calculators.check_columns(calculator, dataset.columns)
 
         rows = dataset.rows
         if limit_rows is not None:
             rows = rows[:limit_rows]
 
-        bar = progressbar.ProgressBar(max_value=(len(rows) * (len(rows) - 1) / 2))
-        bar.update(0)
+        manifest = self._create_manifest(rows, calculator, threshold, max_vertices)
+
+        previous_manifest = previous_graph.manifest
+        if previous_manifest is None:
+            raise Exception('Graph has no manifest, so it can only be built from scratch')
+
+        for key in ('calculator', 'threshold', 'max_vertices'):
+            if previous_manifest[key] != manifest[key]:
+                raise Exception('Graph was built with a different {0}'.format(key))
+
+        names = [row['wikiquotes_names'] for row in rows]
+        ids = {name: i for i, name in enumerate(names)}
+
+        # find rows that were added or changed, and names of rows that were removed or changed
+        previous_rows = {key: (digest, name) for key, digest, name in previous_manifest['rows']}
+        current_rows = {(key, digest) for key, digest, _ in manifest['rows']}
+
+        changed = [i for i, (key, digest, _) in enumerate(manifest['rows'])
+                   if previous_rows.get(key, (None, None))[0] != digest]
+        stale_names = {name for key, (digest, name) in previous_rows.items() if (key, digest) not in current_rows}
+
+        # rows whose previous neighbours are all still valid only need to be compared with the changed rows
+        recalculated = set(changed)
+        unchanged = []
+
+        for i, name in enumerate(names):
+            if i in recalculated:
+                continue
 
+            try:
+                previous_neighbours = previous_graph.get_sorted_neighbours(name)
+            except Exception:
+                previous_neighbours = []
+
+            if any(neighbour in stale_names for neighbour, _ in previous_neighbours):
+                recalculated.add(i)
+            else:
+                unchanged.append((i, previous_neighbours))
+
+        features = self._prepare_features(dataset, rows, calculator)
+        builder = _ShardBuilder(rows, calculator, threshold, max_vertices, features=features, pruned=pruned)
+
+        with instrument.stage('build.recalculate', rows=len(recalculated)):
+            top_k = builder.build_rows(sorted(recalculated))
+
+        with instrument.stage('build.update', rows=len(unchanged), changed=len(changed)):
+            if changed:
+                top_k.extend(self._update_rows(builder, unchanged, numpy.array(changed), ids, threshold, max_vertices))
+            else:
+                top_k.extend(_previous_top_k(i, previous_neighbours, ids) for i, previous_neighbours in unchanged
+                             if previous_neighbours)
+
+        instrument.count('build.calculated_pairs', builder.take_calculated_pairs())
+
+        data_graph = graph.Graph()
+        _set_top_k(data_graph, names, top_k, calculator if components else None, features)
+        data_graph.manifest = manifest
+
+        return data_graph, len(recalculated)
+
+    def _update_rows(self, builder, unchanged, changed, ids, threshold, max_vertices):
+        '''
+        Updates the neighbours of rows whose previous neighbours are all still valid, with the changed rows.
+
+        :param builder: shard builder of the current rows
+        :param unchanged: list of (row, previous sorted neighbours)
+        :param changed: indices of the changed rows
+        :param ids: indices of the rows by name
+        :return: list of (row, index of first neighbour, indices of selected neighbours, weights of selected neighbours)
+        '''
+        block = builder.calculate_block(numpy.array([i for i, _ in unchanged], dtype=numpy.int64), changed)
+        top_k = []
+
+        for (i, previous_neighbours), weights in zip(unchanged, block):
+            mask = changed != i
+            if threshold is not None:
+                mask &= ~(weights > threshold)
+
+            # previous weights may have been saved with less precision. a changed row can only make it into a full
+            # list of neighbours if it's not clearly farther than the farthest of them
+            if len(previous_neighbours) == max_vertices:
+                farthest = previous_neighbours[-1][1]
+                mask &= weights <= farthest + abs(farthest) * 1e-6
+
+            if not mask.any():
+                if previous_neighbours:
+                    top_k.append(_previous_top_k(i, previous_neighbours, ids))
+                continue
+
+            # merge the changed rows with the previous neighbours, whose weights are calculated again to be exact
+            previous_indices = numpy.array([ids[neighbour] for neighbour, _ in previous_neighbours], dtype=numpy.int64)
+            previous_weights = builder.calculate_block(numpy.array([i]), previous_indices)[0]
+
+            candidates = numpy.concatenate([previous_indices, changed[mask]])
+            candidate_weights = numpy.concatenate([previous_weights, weights[mask]])
+
+            order = numpy.argsort(candidates, kind='stable')
+            indices, kept_weights = _select_top_k(candidates[order], candidate_weights[order], max_vertices)
+            top_k.append((i, int(candidates.min()), indices.tolist(), kept_weights.tolist()))
+
+        return top_k
+
+    def _create_manifest(self, rows, calculator, threshold, max_vertices):
+        '''
+        Describes the data a graph is built from, so it could be updated later on.
+
+        :return: the calculator and parameters used, and for each row its `en_curid`, a hash of its values and its name
+        :rtype: dict
+        '''
+        calculator_digest = calculators.get_digest(calculator)
+
+        return {'calculator': {'name': type(calculator).__name__, 'digest': calculator_digest},
+                'threshold': threshold,
+                'max_vertices': max_vertices,
+                'rows': [[row['en_curid'], _hash_row(row), row['wikiquotes_names']] for row in rows]}
+
+    def _prepare_features(self, dataset, rows, calculator):
+        '''
+        Prepares the features of the rows with the calculator, if it implements the batch interface.
+
+        Prepared features are cached on disk next to the dataset, keyed by the hash of the dataset, the source of the
+        calculator and the amount of rows, so they are only prepared once for the same rows.
+
+        :return: features returned by the calculator's `prepare`, or None if it does not implement it
+        '''
+        if not calculators.supports_batch(calculator):
+            return None
+
+        calculator_digest = calculators.get_digest(calculator)
+        if calculator_digest is None:
+            with instrument.stage('build.features', rows=len(rows), cached=False):
+                return calculator.prepare(rows)
+
+        cache_filename = '{0}.{1}.features.npz'.format(dataset.filename, calculators.get_name(calculator))
+        key = hashlib.sha1('{0}:{1}:{2}'.format(dataset.digest, calculator_digest, len(rows)).encode()).hexdigest()
+
+        with instrument.stage('build.features', rows=len(rows)) as stage:
+            features = _load_features(cache_filename, key)
+            stage['cached'] = features is not None
+
+            if features is None:
+                features = calculator.prepare(rows)
+                _save_features(cache_filename, key, features)
+
+        return features
+
+    def _build_shards(self, data_graph, rows, calculator, features, bar, threshold, max_vertices, workers, pruned,
+                      components):
+        '''
+        Builds the graph one shard of rows at a time, either in this process or in a pool of worker processes.
+
+        Shards are merged in order, and vertices are added in the same order as in `_build_pairs`, so the result does
+        not depend on the amount of workers.
+        '''
+        names = [row['wikiquotes_names'] for row in rows]
+        shards = _split_shards(len(rows), self.block_size, triangular=max_vertices is None)
+
+        if workers is not None and workers > 1:
+            pool = multiprocessing.Pool(workers,
+                                        initializer=_initialize_worker,
+                                        initargs=(rows,
+                                                  calculators.get_sources(calculator),
+                                                  pickle.dumps(calculator),
+                                                  features,
+                                                  threshold,
+                                                  max_vertices,
+                                                  pruned))
+            results = pool.imap(_build_shard, shards)
+        else:
+            pool = None
+            builder = _ShardBuilder(rows, calculator, threshold, max_vertices, features, pruned)
+            results = ((builder.build(shard), builder.take_calculated_pairs()) for shard in shards)
+
+        top_k = []
+        iterations = 0
+
+        # shards are calculated while the previous ones are merged, so the time spent merging is accumulated apart
+        merging = instrument.accumulator('build.merge_shard')
+
+        try:
+            with instrument.stage('build.shards', shards=len(shards), workers=workers) as stage:
+                for (start, stop), (shard_rows, calculated_pairs) in zip(shards, results):
+                    with merging:
+                        if max_vertices is not None:
+                            top_k.extend(shard_rows)
+                        else:
+                            for i, indices, weights in shard_rows:
+                                data_graph.add_vertices(names[i], [names[j] for j in indices], weights)
+
+                    instrument.count('build.calculated_pairs', calculated_pairs)
+
+                    iterations += (stop - start) * (2 * len(rows) - start - stop - 1) // 2
+                    bar.update(iterations)
+
+                stage['pairs'] = iterations
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        if max_vertices is not None:
+            _set_top_k(data_graph, names, top_k, calculator if components else None, features)
+
+    def _build_pairs(self, data_graph, rows, calculator, bar, notice_interval, threshold):
+        '''
+        Builds the graph by calling the calculator on every pair of rows.
+        '''
         iterations = 0
         for a, b in itertools.combinations(rows, 2):
             iterations += 1
@@ -118,9 +454,383 @@ class GraphBuilder(object):
 
             data_graph.add_vertex(a['wikiquotes_names'], b['wikiquotes_names'], w)
 
-        bar.finish()
+    def _build_top_k_pairs(self, data_graph, rows, calculator, bar, notice_interval, threshold, max_vertices):
+        '''
+        Builds a trimmed graph by calling the calculator on every pair of rows, keeping a bounded heap of the lightest
+        vertices for each row.
+        '''
+        names = [row['wikiquotes_names'] for row in rows]
 
-        return data_graph
+        # each heap keeps (-weight, -index) of the lightest vertices, so the heaviest one is on top
+        heaps = [[] for _ in rows]
+        first_neighbours = [None] * len(rows)
+
+        iterations = 0
+        for (i, a), (j, b) in itertools.combinations(enumerate(rows), 2):
+            iterations += 1
+            if iterations % notice_interval == 0:
+                bar.update(iterations)
+
+            w = calculator.calculate(a, b)
+
+            if threshold is not None and w > threshold:
+                continue
+
+            for edge, neighbour in ((i, j), (j, i)):
+                if first_neighbours[edge] is None:
+                    first_neighbours[edge] = neighbour
+
+                heap = heaps[edge]
+                if len(heap) < max_vertices:
+                    heapq.heappush(heap, (-w, -neighbour))
+                elif (w, neighbour) < (-heap[0][0], -heap[0][1]):
+                    heapq.heapreplace(heap, (-w, -neighbour))
+
+        top_k = []
+        for i, heap in enumerate(heaps):
+            if first_neighbours[i] is not None:
+                kept = sorted((-w, -j) for w, j in heap)
+                top_k.append((i, first_neighbours[i], [j for w, j in kept], [w for w, j in kept]))
+
+        _set_top_k(data_graph, names, top_k)
+
+
+class _ShardBuilder(object):
+    '''
+    Calculates the vertices of a shard of rows, i.e. a range of consecutive rows.
+
+    For a full graph, a row's shard holds its vertices to all of the rows that come after it. For a trimmed graph,
+    it holds its lightest vertices to all other rows.
+    '''
+
+    def __init__(self, rows, calculator, threshold, max_vertices, features=None, pruned=False):
+        '''
+        :param features: features of the rows, if the calculator implements the batch interface. prepared if not given
+        :param pruned: whether to find the lightest vertices of a trimmed graph with a pruned search
+        '''
+        self._rows = rows
+        self._calculator = calculator
+        self._threshold = threshold
+        self._max_vertices = max_vertices
+        self._features = features
+
+        if self._features is None and calculators.supports_batch(calculator):
+            self._features = calculator.prepare(rows)
+
+        # calculators without the batch interface are called with the same rows over and over, so they are built once
+        if self._features is None:
+            self._rows = list(rows)
+
+        self._search = spatial.BucketedSearch(calculator.search_space(self._features)) if pruned else None
+
+        # pairs calculated since they were last taken
+        self._calculated_pairs = 0
+
+    @property
+    def threshold(self):
+        '''
+        :return: weight above which vertices are discarded, or None
+        :rtype: float
+        '''
+        return self._threshold
+
+    def build(self, shard):
+        '''
+        :param shard: range of rows as (start, stop)
+        :return: for a full graph, list of (row, indices of neighbours, weights). for a trimmed graph, see `build_rows`
+        '''
+        start, stop = shard
+
+        if self._max_vertices is not None:
+            return self.build_rows(numpy.arange(start, stop))
+
+        # a full graph only needs each pair once
+        columns = numpy.arange(start, len(self._rows))
+        block = self.calculate_block(numpy.arange(start, stop), columns)
+
+        shard_rows = []
+
+        for i in range(start, stop):
+            weights = block[i - start]
+
+            # only pairs (i, j) where j > i are relevant
+            mask = columns > i
+            if self._threshold is not None:
+                mask &= ~(weights > self._threshold)
+
+            if mask.any():
+                shard_rows.append((i, columns[mask].tolist(), weights[mask].tolist()))
+
+        return shard_rows
+
+    def build_rows(self, row_indices):
+        '''
+        Selects the lightest vertices of the given rows of a trimmed graph, out of their vertices to all other rows.
+
+        :param row_indices: indices of the rows
+        :return: list of (row, index of first neighbour, indices of selected neighbours, weights of selected neighbours)
+        '''
+        row_indices = numpy.asarray(row_indices, dtype=numpy.int64)
+        if self._search is not None:
+            return self._search_rows(row_indices)
+
+        columns = numpy.arange(len(self._rows))
+        block = self.calculate_block(row_indices, columns)
+
+        shard_rows = []
+
+        for i, weights in zip(row_indices.tolist(), block):
+
+            # a row is never its own neighbour
+            mask = columns != i
+            if self._threshold is not None:
+                mask &= ~(weights > self._threshold)
+
+            candidates = columns[mask]
+            if len(candidates) > 0:
+                indices, kept_weights = _select_top_k(candidates, weights[mask], self._max_vertices)
+                shard_rows.append((i, int(candidates[0]), indices.tolist(), kept_weights.tolist()))
+
+        return shard_rows
+
+    def _search_rows(self, row_indices):
+        '''
+        Same as `build_rows`, but only calculates the vertices to the candidates found by the pruned search.
+        '''
+        shard_rows = []
+
+        for i in row_indices.tolist():
+            a = numpy.array([i])
+            candidates, weights = self._search.search(i, self._max_vertices,
+                                                      lambda b: self.calculate_block(a, b)[0],
+                                                      limit=self._threshold)
+
+            if len(candidates) == 0:
+                continue
+
+            # without a threshold, the first neighbour of a row is the first other row. with one, it's only known to
+            # be among the candidates if it's light enough, but the first neighbour only decides the order in which
+            # rows are set in the graph, which saving it does not keep
+            if self._threshold is None:
+                first = 1 if i == 0 else 0
+            else:
+                first = int(candidates[0])
+
+            indices, kept_weights = _select_top_k(candidates, weights, self._max_vertices)
+            shard_rows.append((i, first, indices.tolist(), kept_weights.tolist()))
+
+        return shard_rows
+
+    def take_calculated_pairs(self):
+        '''
+        Counters of worker processes are not recorded, so the pairs calculated by a builder are counted by the process
+        that merges its results.
+
+        :return: amount of pairs calculated since the last call
+        :rtype: int
+        '''
+        calculated_pairs, self._calculated_pairs = self._calculated_pairs, 0
+        return calculated_pairs
+
+    def calculate_block(self, a, b):
+        '''
+        :return: matrix where [i][j] = weight between rows a[i] and b[j]
+        '''
+        self._calculated_pairs += len(a) * len(b)
+
+        if self._features is not None:
+            return self._calculator.calculate_block(self._features, a, b)
+
+        rows = self._rows
+
+        def calculate(i, j):
+
+            # calculators without the batch interface are always called with the rows in dataset order, and a full
+            # graph never needs pairs where j <= i
+            if i < j:
+                return self._calculator.calculate(rows[i], rows[j])
+            elif i > j and self._max_vertices is not None:
+                return self._calculator.calculate(rows[j], rows[i])
+            else:
+                return 0.0
+
+        return numpy.array([[calculate(i, j) for j in b.tolist()] for i in a.tolist()], dtype=float)
+
+
+# the shard builder of a worker process
+_worker_builder = None
+
+
+def _initialize_worker(rows, calculator_sources, pickled_calculator, features, threshold, max_vertices, pruned):
+    '''
+    Initializes a worker process of the pool. Calculators loaded from source files are loaded again, so they could be
+    unpickled in workers that do not share the memory of the main process.
+    '''
+    global _worker_builder
+
+    calculators.load_sources(calculator_sources)
+
+    _worker_builder = _ShardBuilder(rows, pickle.loads(pickled_calculator), threshold, max_vertices, features, pruned)
+
+
+def _build_shard(shard):
+    return _worker_builder.build(shard), _worker_builder.take_calculated_pairs()
+
+
+def _spill_tile(task):
+    build, tile = task
+    amount_of_vertices = build.spill_tile(tile, _worker_builder.calculate_block, _worker_builder.threshold)
+
+    return tile, amount_of_vertices, _worker_builder.take_calculated_pairs()
+
+
+def _validate_pruned(calculator, max_vertices, pruned):
+    if pruned and max_vertices is None:
+        raise Exception('A pruned search only finds the lightest vertices, so it requires max_vertices')
+
+    if pruned and not (calculators.supports_batch(calculator) and hasattr(calculator, 'search_space')):
+        raise Exception('The calculator does not describe a search space, so it can\'t be searched')
+
+
+def _validate_components(calculator, max_vertices, components):
+    if components and max_vertices is None:
+        raise Exception('Components are only kept for the selected vertices, so they require max_vertices')
+
+    if components and not (calculators.supports_batch(calculator) and hasattr(calculator, 'calculate_components')):
+        raise Exception('The calculator does not calculate the components of its weights')
+
+
+def _split_shards(amount_of_rows, block_size, triangular):
+    '''
+    Splits the rows into ranges of consecutive rows, with roughly <block_size> pairs in each range.
+
+    :param amount_of_rows: amount of rows
+    :param block_size: amount of pairs per shard
+    :param triangular: whether each row is paired only with the rows that come after it, or with all other rows
+    :return: list of (start, stop)
+    :rtype: list(tuple(int, int))
+    '''
+    shards = []
+    start = 0
+    pairs = 0
+
+    for i in range(amount_of_rows):
+        pairs += amount_of_rows - 1 - i if triangular else amount_of_rows - 1
+
+        if pairs >= block_size or i == amount_of_rows - 1:
+            shards.append((start, i + 1))
+            start = i + 1
+            pairs = 0
+
+    return shards
+
+
+def _select_top_k(indices, weights, k):
+    '''
+    Selects the <k> lightest weights without fully sorting all of them. Ties are broken by index, same as a stable
+    sort over the weights would do.
+
+    :param indices: indices of the candidates, ascending
+    :param weights: weight of each candidate
+    :param k: how many candidates to select
+    :return: indices and weights of the selected candidates, sorted by weight
+    :rtype: tuple(numpy.ndarray, numpy.ndarray)
+    '''
+    if len(weights) > k:
+        kth_weight = numpy.partition(weights, k - 1)[k - 1]
+        mask = weights <= kth_weight
+        indices = indices[mask]
+        weights = weights[mask]
+
+    order = numpy.argsort(weights, kind='stable')[:k]
+    return indices[order], weights[order]
+
+
+def _load_features(filename, key):
+    '''
+    :param filename: file the features are cached in
+    :param key: key the features must have been cached with
+    :return: cached features, or None if they are not cached under the given key
+    '''
+    try:
+        with numpy.load(filename, allow_pickle=False) as cached:
+            if str(cached['key']) != key:
+                return None
+
+            if 'features' in cached:
+                return cached['features']
+
+            return {name.split(':', 1)[1]: cached[name] for name in cached.files if name.startswith('column:')}
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def _save_features(filename, key, features):
+    '''
+    Caches features on disk. Features are either a single array, or a dict of arrays.
+
+    :param filename: file to cache the features in
+    :param key: key to cache the features under
+    :param features: features to cache
+    '''
+    if isinstance(features, dict):
+        arrays = {'column:{0}'.format(name): array for name, array in features.items()}
+    else:
+        arrays = {'features': features}
+
+    temporary_filename = '{0}.tmp.npz'.format(filename)
+    numpy.savez(temporary_filename, key=numpy.array(key), **arrays)
+    os.replace(temporary_filename, filename)
+
+
+def _hash_row(row):
+    '''
+    :return: hash of all the values of a row
+    :rtype: str
+    '''
+    values = '\x1f'.join('{0}={1}'.format(column, row[column]) for column in sorted(row))
+    return hashlib.sha1(values.encode('utf-8')).hexdigest()
+
+
+def _previous_top_k(edge, previous_neighbours, ids):
+    '''
+    :return: selected neighbours of a row, as they were in the previous graph
+    '''
+    indices = [ids[neighbour] for neighbour, _ in previous_neighbours]
+    return edge, min(indices), indices, [weight for _, weight in previous_neighbours]
+
+
+def _set_top_k(data_graph, names, top_k, calculator=None, features=None):
+    '''
+    Sets the selected neighbours of each row in the graph.
+
+    Rows are set in the order in which they would have first appeared in a full graph, so the result is identical to
+    trimming one: a row first appears with its first vertex, which is the one to its first neighbour.
+
+    :param data_graph: graph to set neighbours in
+    :param names: names of all rows
+    :param top_k: list of (row, index of first neighbour, indices of selected neighbours, weights of selected neighbours)
+    :param calculator: calculator to calculate the components of the selected vertices with, if they are kept. optional
+    :param features: features of the rows, as prepared by the calculator. optional
+    '''
+    def appearance(item):
+        edge, first_neighbour = item[0], item[1]
+        return min(edge, first_neighbour), max(edge, first_neighbour), edge > first_neighbour
+
+    if calculator is not None:
+        data_graph.component_model = calculator.component_model
+
+    with instrument.stage('build.set_neighbours', edges=len(top_k), components=calculator is not None):
+        for edge, first_neighbour, indices, weights in sorted(top_k, key=appearance):
+            edge_components = None
+
+            # components are only calculated for the selected vertices, which are few
+            if calculator is not None:
+                matrices = calculator.calculate_components(features, numpy.array([edge]),
+                                                           numpy.array(indices, dtype=numpy.int64))
+                edge_components = {key: matrix[0] for key, matrix in matrices.items()}
+
+            data_graph.set_neighbours(names[edge], {names[j]: w for j, w in zip(indices, weights)}, edge_components)
 
 
 if __name__ == '__main__':
@@ -131,35 +841,96 @@ if __name__ == '__main__':
     parser.add_argument('-lr', '--limit-rows', help='limits the number of rows used', type=int, required=False)
     parser.add_argument('-t', '--threshold', help='threshold weight. values larger than threshold are discarded', type=float, required=False)
     parser.add_argument('-mv', '--max-vertices', help='maximal outgoing vertices per edge', type=int, required=False)
-    parser.add_argument('-wc', '--weight-calculator', help='name of file containing the WeightCalculator implementation', default='constant')
+    parser.add_argument('-wc', '--weight-calculator', help='name of a calculator (see calculators/), a python file containing a WeightCalculator implementation, or a weighted sum of them, e.g. "time_and_space + 0.5 * popularity"', default='constant')
+    parser.add_argument('-w', '--workers', help='number of processes to calculate pairs in', type=int, required=False)
+    parser.add_argument('-u', '--update', help='graph previously built with --max-vertices to update incrementally', required=False)
+    parser.add_argument('-p', '--pruned', help='find the lightest vertices with a pruned search, rather than calculating all pairs. requires --max-vertices', action='store_true')
+    parser.add_argument('-c', '--components', help='keep the components of the weights, so neighbours could be ranked with other weight vectors at query time. requires --max-vertices', action='store_true')
+    parser.add_argument('--tiled', help='build the full graph tile by tile, spilling the tiles into this directory, so it does not have to fit in memory. an interrupted build resumes from the same directory', required=False)
+    parser.add_argument('--tile-size', help='amount of rows in each block of a tiled build', type=int, default=2 ** 11)
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
+    if args.tiled is not None and (args.max_vertices is not None or args.update is not None):
+        parser.error('--tiled builds a full graph, so it does not apply to --max-vertices or --update')
+
+    if args.tiled is not None and graph.sqlite.is_database_filename(args.output):
+        parser.error('--tiled builds a binary graph file')
+
+    if args.update is not None and args.max_vertices is None:
+        parser.error('--update requires --max-vertices')
+
+    if args.pruned and args.max_vertices is None:
+        parser.error('--pruned requires --max-vertices')
+
+    if args.components and args.max_vertices is None:
+        parser.error('--components requires --max-vertices')
+
+    if args.components and graph.sqlite.is_database_filename(args.output):
+        parser.error('--components are only kept in binary graph files')
+
+    instrument.start(args)
+
     # load dataset from csv
     csv_dataset = Dataset(args.dataset, sort_by='name')
 
-    # load calculator from python module
-    calculator = imp.load_source('calculator',
-                                 './calculators/{0}.py'.format(args.weight_calculator))
+    # create calculator from the registry, or from a python file
+    with instrument.stage('calculator.setup', calculator=args.weight_calculator):
+        weight_calculator = calculators.create(args.weight_calculator)
 
-    # build graph
-    graph = GraphBuilder().build_graph(csv_dataset,
-                                       calculator.WeightCalculator(),
-                                       notice_interval=args.notice_interval,
-                                       limit_rows=args.limit_rows,
-                                       threshold=args.threshold)
+    # a graph that's saved as a SQLite database is built straight into it, next to the output until it's finished
+    database = '{0}.tmp'.format(args.output) if graph.sqlite.is_database_filename(args.output) else None
 
-    # if max_vertices were passed, trim graph so each edge has at most <max_vertices>, ordered by weight
+    # build graph. if max_vertices were passed, each edge keeps at most <max_vertices>, ordered by weight, while
+    # the graph is being built
     if args.max_vertices is not None:
-        print('trimming graph to have {0} outgoing vertices per edge at most'.format(args.max_vertices))
-        trimming_bar = progressbar.ProgressBar(max_value=len(graph.edges))
-
-        graph = trim.GraphTrimmer().trim(graph, args.max_vertices, on_status_update=trimming_bar.update)
-
-        trimming_bar.finish()
+        print('building graph with {0} outgoing vertices per edge at most'.format(args.max_vertices))
+
+    if args.tiled is not None:
+        calculated = GraphBuilder().build_tiled(csv_dataset,
+                                                weight_calculator,
+                                                args.output,
+                                                args.tiled,
+                                                limit_rows=args.limit_rows,
+                                                threshold=args.threshold,
+                                                workers=args.workers,
+                                                tile_size=args.tile_size)
+
+        # the graph is written into the output as the tiles are merged
+        print('built graph, {0} tiles were calculated'.format(calculated))
+        graph = None
+    elif args.update is not None:
+        previous_graph = graph.Graph()
+        previous_graph.load(args.update)
+
+        graph, recalculated = GraphBuilder().update_graph(previous_graph,
+                                                          csv_dataset,
+                                                          weight_calculator,
+                                                          limit_rows=args.limit_rows,
+                                                          threshold=args.threshold,
+                                                          max_vertices=args.max_vertices,
+                                                          pruned=args.pruned,
+                                                          components=args.components)
+
+        print('updated graph, {0} rows were calculated again'.format(recalculated))
+    else:
+        graph = GraphBuilder().build_graph(csv_dataset,
+                                           weight_calculator,
+                                           notice_interval=args.notice_interval,
+                                           limit_rows=args.limit_rows,
+                                           threshold=args.threshold,
+                                           max_vertices=args.max_vertices,
+                                           workers=args.workers,
+                                           pruned=args.pruned,
+                                           database=database,
+                                           components=args.components)
 
     # save graph to disk
-    print('saving graph to disk...')
-    graph.save(args.output)
+    if graph is not None:
+        print('saving graph to disk...')
+        graph.save(args.output)
+
+    instrument.finish(args)
 
     # done
     print ('\ndone')
@@ -1,35 +1,216 @@
 # NOTE: I mistakenly switched between "edges" and "vertices". therefore, everything that's called an "edge" is
 #       actually a vertex, and vice versa.
 
+import heapq
+import json
 import pickle
 import math
 
+import numpy
+
+import instrument
+from graph import cache
+from graph import csr
+from graph import joint
+from graph import names
+from graph import sqlite
+from graph import symmetric
+
 
 class Graph(object):
     '''
     Represents a directed, weighted, serializable graph.
+
+    As long as vertices are only added with `add_vertex` and `add_vertices`, which add them in both directions, the
+    graph is undirected, and each pair of edges is stored once (see `graph.symmetric`), in a packed triangle, or in a
+    list of pairs if the graph is sparse. It's converted into its dict representation, which is directed, once its
+    neighbours are set or its vertices are accessed as a whole.
+
+    A graph loaded from a binary graph file is backed by the mapped file itself, and is only converted to its dict
+    representation once it's mutated or its vertices are accessed as a whole. An undirected graph is loaded undirected.
+    A graph loaded from a SQLite database is backed by the database in the same way (see `graph.sqlite`).
+
+    A graph could also be built straight into a new SQLite database with `create_database`, so it does not have to fit
+    in memory.
+
+    A graph could keep per-feature components of its weights, which let its neighbours be ranked again with another
+    weight vector at query time (see `graph.components`). Components are set along with the neighbours of each edge,
+    and are dropped as a whole once any edge is set without them, or vertices are added. Only binary graph files keep
+    them.
+
+    Once it's trimmed, the graph is directed, so an edge could be in the neighbours of edges that are not in its own.
+    Those are found with `get_reverse_neighbours`, in time that depends on their amount alone: binary graph files and
+    databases keep a reverse index of their vertices, and a graph in its dict representation keeps the in-neighbours of
+    each edge, built on first use and kept up to date as vertices are added and neighbours are set.
+
+    Sorted neighbours and joint neighbours are cached until the graph is mutated.
     '''
 
-    def __init__(self):
-        self._edges = set()
-        self._vertices = {}
+    def __init__(self, cache_size=1024, cache_ttl=None, sparse=False):
+        '''
+        :param cache_size: maximal amount of cached query results. optional
+        :param cache_ttl: seconds after which a cached query result expires. optional
+        :param sparse: keep the pairs of the undirected graph in a list rather than a packed triangle, so it takes
+                       memory by the amount of its pairs rather than the amount of its edges squared, e.g. if it's
+                       built with a threshold. optional
+        '''
+        self._edges = None
+        self._vertices = None
+        self._store = None
+        self._database = None
+        self._symmetric = symmetric.SymmetricStore(sparse=sparse)
+        self._cache = cache.QueryCache(cache_size, cache_ttl)
+        self._name_index = None
+        self._edge_ids = None
+        self._manifest = None
+        self._stored_manifest = None
+        self._components = None
+        self._component_model = None
+        self._reverse = None
+
+    @property
+    def manifest(self):
+        '''
+        :return: description of the data the graph was generated from, saved along with it. None if there's none
+        :rtype: dict
+        '''
+        if self._manifest is None and self._stored_manifest is not None:
+            self._manifest = json.loads(bytes(self._stored_manifest).decode('utf-8'))
+
+        return self._manifest
+
+    @manifest.setter
+    def manifest(self, manifest):
+        self._manifest = manifest
+
+    @property
+    def component_model(self):
+        '''
+        :return: model of the components of the weights, or None if the graph does not keep them
+        :rtype: components.ComponentModel
+        '''
+        if self._store is not None and self._database is None:
+            return self._store.component_model
+
+        return self._component_model
+
+    @component_model.setter
+    def component_model(self, component_model):
+        if len(self.edges) > 0:
+            raise Exception('Components could only be kept by a graph that\'s built from scratch')
+
+        self._component_model = component_model
+        self._components = {} if component_model is not None else None
+
+    @property
+    def cache(self):
+        '''
+        :return: cache of query results. see its `stats` for hit rate
+        :rtype: cache.QueryCache
+        '''
+        return self._cache
 
     @property
     def edges(self):
         '''
-        :return: edges of the graph
+        :return: edges of the graph, as a set or a set-like view
         :rtype: set(str)
         '''
+        if self._symmetric is not None:
+            return self._symmetric.ids.keys()
+
+        if self._database is not None:
+            return self._database.ids.keys()
+
         return self._edges
 
+    @property
+    def is_symmetric(self):
+        '''
+        :return: whether the graph is undirected, and stores each pair of edges once
+        :rtype: bool
+        '''
+        return self._symmetric is not None
+
+    def create_database(self, filename):
+        '''
+        Backs an empty graph by a new SQLite database, replacing any existing one. Vertices that are added or set are
+        written into the database, rather than kept in memory, and saving the graph as a database finishes it.
+
+        :param filename: file to create the database in
+        '''
+        if len(self.edges) > 0:
+            raise Exception('Only an empty graph could be built into a database')
+
+        self._invalidate(keep_symmetric=True)
+        self._symmetric = None
+        self._edges = None
+
+        # the database serves queries as well, like any other store
+        self._database = self._store = sqlite.SQLiteStore.create(filename)
+
     @property
     def vertices(self):
         '''
+        Converts the graph into its dict representation. see `iter_neighbours` to go over large graphs without
+        converting them.
+
         :return: vertices of the graph, where [a][b] = weight of the vertex (a, b)
         :rtype: dict(str, dict(str, float))
         '''
+        self._materialize()
         return self._vertices
 
+    def iter_neighbours(self):
+        '''
+        :return: iterator over (edge, neighbours) for all edges that have outgoing vertices, where neighbours are as
+                 returned by `get_neighbours`. the graph is not converted
+        '''
+        if self._symmetric is not None:
+            return self._symmetric.iter_neighbours()
+
+        if self._store is not None:
+            return self._store.iter_neighbours()
+
+        return iter(self._vertices.items())
+
+    def iter_neighbour_ids(self, start=0, stop=None):
+        '''
+        Same as `iter_neighbours`, with edges identified by integer ids, and the neighbours of each edge as arrays
+        rather than dicts, so large graphs are gone over without building a dict for each edge. Ids do not change until
+        the graph is mutated, so ranges of them could be gone over apart, e.g. by several processes.
+
+        :param start: id of the first edge to go over. optional
+        :param stop: id after the last edge to go over. all edges from the first one if not given. optional
+        :return: names of all edges, by id, and an iterator over (edge id, ids of neighbours, weights) for the edges in
+                 range that have outgoing vertices, where neighbours are ordered as they are by `iter_neighbours`
+        :rtype: tuple(list(str), iterator)
+        '''
+        edge_names, ids = self._get_edge_ids()
+
+        if self._symmetric is not None:
+            return edge_names, self._symmetric.iter_neighbour_ids(start, stop)
+
+        if isinstance(self._store, csr.CSRStore):
+            return edge_names, self._store.iter_neighbour_ids(start, stop)
+
+        def iterate():
+            for edge_id, edge in enumerate(edge_names[start:stop], start):
+                if self._store is not None:
+                    neighbours = self._store.get_neighbours(edge) if self._store.has_neighbours(edge) else None
+                else:
+                    neighbours = self._vertices.get(edge)
+
+                if neighbours is None:
+                    continue
+
+                yield (edge_id,
+                       numpy.fromiter((ids[neighbour] for neighbour in neighbours), dtype=numpy.int64,
+                                      count=len(neighbours)),
+                       numpy.fromiter(neighbours.values(), dtype=numpy.float64, count=len(neighbours)))
+
+        return edge_names, iterate()
+
     def add_vertex(self, a, b, weight):
         '''
         Adds a new vertex to the graph, and possibly new edges.
@@ -38,6 +219,18 @@ class Graph(object):
         :param b: second edge
         :param weight: weight of the vertex
         '''
+        self._invalidate(keep_symmetric=a != b)
+
+        if self._database is not None:
+            self._database.add_vertices(a, [b], [weight])
+            return
+
+        self._drop_components()
+
+        if self._symmetric is not None:
+            self._symmetric.set_weight(self._symmetric.add_edge(a), self._symmetric.add_edge(b), weight)
+            return
+
         self._edges.add(a)
         self._edges.add(b)
 
@@ -47,6 +240,65 @@ class Graph(object):
         self._vertices[a][b] = weight
         self._vertices[b][a] = weight
 
+        if self._reverse is not None:
+            self._reverse.setdefault(b, {})[a] = weight
+            self._reverse.setdefault(a, {})[b] = weight
+
+    def add_vertices(self, a, neighbours, weights):
+        '''
+        Adds new vertices between an edge and each of the given edges. Same as calling `add_vertex` for each of them,
+        only faster.
+
+        :param a: first edge
+        :param neighbours: second edges
+        :param weights: weight of each vertex, ordered as the neighbours
+        '''
+        self._invalidate(keep_symmetric=a not in neighbours)
+
+        if self._database is not None:
+            self._database.add_vertices(a, neighbours, weights)
+            return
+
+        self._drop_components()
+
+        if self._symmetric is not None:
+            self._symmetric.set_weights(self._symmetric.add_edge(a), self._symmetric.add_edges(neighbours),
+                                        numpy.asarray(weights, dtype=numpy.float64))
+            return
+
+        self._edges.add(a)
+        self._edges.update(neighbours)
+
+        a_vertices = self._vertices.setdefault(a, {})
+
+        for b, weight in zip(neighbours, weights):
+            b_vertices = self._vertices.get(b)
+
+            if b_vertices is None:
+                b_vertices = self._vertices[b] = {}
+
+            a_vertices[b] = weight
+            b_vertices[a] = weight
+
+        if self._reverse is not None:
+            a_reverse = self._reverse.setdefault(a, {})
+
+            for b, weight in zip(neighbours, weights):
+                self._reverse.setdefault(b, {})[a] = weight
+                a_reverse[b] = weight
+
+    def order_edges(self, edges):
+        '''
+        Numbers the edges of an undirected graph in the order of the given edges, e.g. the rows of the dataset, so equal
+        weights are ordered by it, as they are in a graph that's kept as dicts. Edges that are not given keep their
+        order, after the given ones. Other graphs order equal weights by the order in which they were added anyway.
+
+        :param edges: names of edges, in order. ones that are not in the graph are skipped
+        '''
+        if self._symmetric is not None:
+            self._invalidate(keep_symmetric=True)
+            self._symmetric.order_edges(edges)
+
     def get_neighbours(self, edge):
         '''
         Get all neighbouring edges (as vertices) for a given edge.
@@ -55,12 +307,42 @@ class Graph(object):
         :return: all vertices which come out of the edge, where [edge_2] = weight of the vertex (edge, edge_2)
         :rtype: dict(str, float)
         '''
+        if self._store is not None:
+            return self._store.get_neighbours(edge)
+
+        if self._symmetric is not None:
+            if not self._symmetric.has_neighbours(edge):
+                raise Exception('No such edge')
+
+            return self._symmetric.get_neighbours(edge)
+
         try:
             return self._vertices[edge]
         except:
             raise Exception('No such edge')
 
-    def set_neighbours(self, edge, neighbours):
+    def get_weight(self, edge, neighbour):
+        '''
+        Gets the weight of a single vertex, without reading all of the edge's neighbours where it could be looked up
+        by itself.
+
+        :param edge: relevant edge
+        :param neighbour: edge the vertex goes into
+        :return: weight of the vertex (edge, neighbour), or None if there's no such vertex
+        :rtype: float
+        '''
+        if self._store is not None:
+            return self._store.get_weight(edge, neighbour)
+
+        if self._symmetric is not None:
+            if not self._symmetric.has_neighbours(edge):
+                raise Exception('No such edge')
+
+            return self._symmetric.get_weight(edge, neighbour)
+
+        return self.get_neighbours(edge).get(neighbour)
+
+    def set_neighbours(self, edge, neighbours, components=None):
         '''
         Changes all outgoing vertices of a given edge to connect to the given neighbours with the given weights.
 
@@ -68,35 +350,430 @@ class Graph(object):
 
         :param edge: relevant edge
         :param neighbours: neighbouring edges and their vertices
+        :param components: components of the vertices, by name, ordered as the neighbours (see `component_model`).
+                           the graph drops all of its components if they are not given. optional
+        :type components: dict(str, numpy.ndarray)
         '''
+        self._invalidate()
+
+        if self._database is not None:
+            self._database.set_neighbours(edge, neighbours)
+            return
+
+        if components is None:
+            self._drop_components()
+        elif self._components is not None:
+            self._components[edge] = components
+
         self._edges.add(edge)
 
         for neighbour in neighbours.keys():
             self._edges.add(neighbour)
 
+        if self._reverse is not None:
+            for neighbour in self._vertices.get(edge, {}):
+                del self._reverse[neighbour][edge]
+
+            for neighbour, weight in neighbours.items():
+                self._reverse.setdefault(neighbour, {})[edge] = weight
+
         self._vertices[edge] = neighbours
 
-    def get_sorted_neighbours(self, edge):
+    def get_sorted_neighbours(self, edge, limit=None, weights=None):
         '''
+        :param edge: relevant edge
+        :param limit: return only the first <limit> neighbours. optional
+        :param weights: weight vector to rank the neighbours by, out of their components, rather than by the weights
+                        they were built with, by name of coefficient or penalty (see `component_model`). optional
+        :type weights: dict(str, float)
         :return: neighbours as sorted list of tuples (name, score)
         '''
+        if weights is None:
+            key = ('sorted', edge, limit)
+        else:
+            key = ('reweighted', edge, limit, tuple(sorted(weights.items())))
+
+        result = self._cache.get(key)
+        if result is None:
+            if weights is None:
+                result = tuple(self._find_sorted_neighbours(edge, limit))
+            else:
+                result = tuple(self._find_reweighted_neighbours(edge, limit, weights))
+
+            self._cache.put(key, result)
+
+        return list(result)
+
+    def _find_sorted_neighbours(self, edge, limit):
+        '''
+        Same as `get_sorted_neighbours`, without the cache.
+        '''
+        if self._store is not None:
+            return self._store.get_sorted_neighbours(edge, limit)
+
+        if self._symmetric is not None:
+            if not self._symmetric.has_neighbours(edge):
+                raise Exception('No such edge')
+
+            return self._symmetric.get_sorted_neighbours(edge, limit)
+
         neighbours = self.get_neighbours(edge)
+
+        if limit is not None:
+            return heapq.nsmallest(limit, neighbours.items(), key=lambda x: x[1])
+
         return sorted(neighbours.items(), key=lambda x: x[1])
 
-    def save(self, filename):
+    def _find_reweighted_neighbours(self, edge, limit, weights):
+        '''
+        Same as `get_sorted_neighbours` with a weight vector, without the cache. The weights of all neighbours are
+        combined at once, and neighbours with equal weights keep their order.
+        '''
+        component_model = self.component_model
+        if component_model is None:
+            raise Exception('Graph keeps no components, so its neighbours could not be ranked by other weights')
+
+        if self._store is not None:
+            names = [name for name, _ in self._store.get_sorted_neighbours(edge)]
+            edge_components = self._store.get_components(edge)
+        else:
+            names = list(self.get_neighbours(edge))
+            edge_components = self._components[edge]
+
+        combined = component_model.combine(edge_components, weights)
+        order = numpy.argsort(combined, kind='stable')[:limit]
+
+        return [(names[i], weight) for i, weight in zip(order.tolist(), combined[order].tolist())]
+
+    def get_reverse_neighbours(self, edge, limit=None):
+        '''
+        Finds the edges that have a given edge among their neighbours, e.g. whose trimmed neighbours it's in.
+
+        :param edge: relevant edge
+        :param limit: return only the first <limit> neighbours. optional
+        :return: the edges, as sorted list of tuples (name, weight of their vertex into the edge)
+        '''
+        key = ('reverse', edge, limit)
+
+        result = self._cache.get(key)
+        if result is None:
+            result = tuple(self._find_reverse_neighbours(edge, limit))
+            self._cache.put(key, result)
+
+        return list(result)
+
+    def _find_reverse_neighbours(self, edge, limit):
+        '''
+        Same as `get_reverse_neighbours`, without the cache. Equal weights are ordered by name, or by rank in databases.
+        '''
+        if self._store is not None:
+            return self._store.get_reverse_neighbours(edge, limit)
+
+        # an undirected graph's reverse neighbours are its neighbours
+        if self._symmetric is not None:
+            return self._find_sorted_neighbours(edge, limit)
+
+        if edge not in self._edges:
+            raise Exception('No such edge')
+
+        if self._reverse is None:
+            self._reverse = {}
+
+            for source, neighbours in self._vertices.items():
+                for neighbour, weight in neighbours.items():
+                    self._reverse.setdefault(neighbour, {})[source] = weight
+
+        reverse = self._reverse.get(edge, {})
+
+        if limit is not None:
+            return heapq.nsmallest(limit, reverse.items(), key=lambda x: (x[1], x[0]))
+
+        return sorted(reverse.items(), key=lambda x: (x[1], x[0]))
+
+    def get_mutual_neighbours(self, edge, limit=None):
+        '''
+        Finds the neighbours of a given edge that have it among their neighbours as well.
+
+        :param edge: relevant edge
+        :param limit: return only the first <limit> neighbours. optional
+        :return: the neighbours, as sorted list of tuples (name, weight of the vertex into them)
+        '''
+        key = ('mutual', edge, limit)
+
+        result = self._cache.get(key)
+        if result is None:
+            reverse = {name for name, _ in self.get_reverse_neighbours(edge)}
+            result = tuple([item for item in self.get_sorted_neighbours(edge) if item[0] in reverse][:limit])
+            self._cache.put(key, result)
+
+        return list(result)
+
+    def get_joint_neighbours(self, edges, group_size=10, mode='sum', with_scores=False, weights=None):
+        '''
+        Finds the edges that are closest to a group of edges as a whole. see `graph.joint` for how they are ranked.
+
+        :param edges: members of the group
+        :param group_size: how many edges to return. optional
+        :param mode: how to aggregate the weights from the members: 'sum', 'max' or 'rank'. optional
+        :param with_scores: return tuples of (name, score) rather than names. optional
+        :param weights: weight vector to rank the neighbours of the members by. see `get_sorted_neighbours`. optional
+        :type weights: dict(str, float)
+        :return: closest edges which are not members, sorted by proximity
+        :rtype: list(str)
+        '''
+        key = ('joint', tuple(sorted(set(edges))), group_size, mode,
+               tuple(sorted(weights.items())) if weights is not None else None)
+
+        result = self._cache.get(key)
+        if result is None:
+            result = tuple(joint.get_joint_neighbours(self, edges, group_size, mode, weights))
+            self._cache.put(key, result)
+
+        if with_scores:
+            return list(result)
+
+        return [name for name, _ in result]
+
+    def find_names(self, query, limit=10):
         '''
-        Saves graph to disk.
+        Searches edges by name, regardless of case and accents. see `names.NameIndex.search` for how they are ranked.
+
+        :param query: text to search for
+        :param limit: maximal amount of names to return. if None, returns all names that contain the query. optional
+        :return: matching names
+        :rtype: list(str)
+        '''
+        return self._get_name_index().search(query, limit)
+
+    def resolve_name(self, query):
+        '''
+        :param query: name of an edge, spelled in any case and with or without accents
+        :return: the name of the edge as it is in the graph, or None if there's no such edge
+        :rtype: str
+        '''
+        return self._get_name_index().lookup(query)
+
+    def _get_name_index(self):
+        '''
+        :return: index over the names of the edges, built on first use
+        :rtype: names.NameIndex
+        '''
+        if self._name_index is None:
+            self._name_index = names.NameIndex(self.edges)
+
+        return self._name_index
+
+    def _get_edge_ids(self):
+        '''
+        :return: names of all edges, by id, and their ids by name, or None if the neighbours are found by id anyway.
+                 kept until the graph is mutated
+        :rtype: tuple(list(str), dict(str, int))
+        '''
+        if self._edge_ids is None:
+            if self._symmetric is not None:
+                self._edge_ids = (self._symmetric.names, None)
+            elif isinstance(self._store, csr.CSRStore):
+                self._edge_ids = (self._store.names.tolist(), None)
+            elif self._store is not None:
+                self._edge_ids = (self._store.names, self._store.ids)
+            else:
+                edge_names = sorted(self._edges)
+                self._edge_ids = (edge_names, {name: i for i, name in enumerate(edge_names)})
+
+        return self._edge_ids
+
+    def save(self, filename, weights_dtype=numpy.float32):
+        '''
+        Saves graph to disk, in the binary graph format, or as a SQLite database if the file has a database extension
+        (see `sqlite.EXTENSIONS`). An undirected graph is saved with each pair of edges once in the binary graph
+        format if it's dense, and in CSR layout marked as undirected otherwise (see `symmetric.DENSE_FRACTION`). A
+        graph that's built into a database is finished, and moved into the file if it's another one.
 
         :param filename: file to save graph into
+        :param weights_dtype: dtype to store weights as. use numpy.float64 to keep them exact. databases always keep
+                              them exact. optional
+        '''
+        with instrument.stage('graph.save', filename=filename, edges=len(self.edges)):
+            manifest = self.manifest
+
+            if sqlite.is_database_filename(filename):
+                encoded_manifest = json.dumps(manifest).encode('utf-8') if manifest is not None else None
+
+                if self._database is not None:
+                    self._database.finish(encoded_manifest)
+                    self._database.move(filename)
+                else:
+                    # edges keep their ids, so equal weights are ordered as they are in the graph
+                    edge_names, _ = self._get_edge_ids()
+                    sqlite.write(filename, edge_names, self.iter_neighbours(), encoded_manifest)
+
+                return
+
+            if self._symmetric is not None:
+                arrays, meta = self._symmetric.to_arrays(weights_dtype)
+            else:
+                store = self._store
+                if not isinstance(store, csr.CSRStore):
+                    with instrument.stage('graph.to_csr'):
+                        vertices = self.vertices
+                        store = csr.CSRStore.from_vertices(self._edges, vertices, weights_dtype, self._components,
+                                                           self._component_model)
+
+                arrays = dict(store.arrays)
+                arrays.pop('manifest', None)
+                meta = store.meta
+
+                # weights are only cast once they are written. weights that become equal once cast are ordered by
+                # source in the reverse index, so it's built again
+                if arrays['weights'].dtype != numpy.dtype(weights_dtype):
+                    arrays['weights'] = arrays['weights'].astype(weights_dtype)
+
+                    if 'reverse_offsets' in arrays:
+                        arrays.update(csr.build_reverse(arrays['offsets'], arrays['indices'], arrays['weights']))
+
+                # files written by older versions have no reverse index, while undirected ones need none
+                if 'reverse_offsets' not in arrays and not meta.get('undirected'):
+                    arrays.update(csr.build_reverse(arrays['offsets'], arrays['indices'], arrays['weights']))
+
+            if manifest is not None:
+                arrays['manifest'] = numpy.frombuffer(json.dumps(manifest).encode('utf-8'), dtype=numpy.uint8)
+
+            csr.write(filename, arrays, meta)
+
+    def use_store(self, store):
+        '''
+        Backs the graph by a CSR store, e.g. one that was built in memory by the trimmer, replacing all of its vertices.
+
+        :param store: store to back the graph by
+        :type store: csr.CSRStore
         '''
-        with open(filename, 'wb') as f:
-            pickle.dump((self._vertices, self._edges), f)
+        self._reset()
+        self._store = store
+        self._edges = set(store.names.tolist())
+        self._vertices = None
 
-    def load(self, filename):
+    def load(self, filename, max_vertices=None):
         '''
-        Loads graph from disk.
+        Loads graph from disk, either a binary graph file or a SQLite database. Graphs saved as pickles by older
+        versions are loaded as well.
 
         :param filename: file to load graph from
+        :param max_vertices: keep only the lightest <max_vertices> vertices of each edge, i.e. load one of the levels
+                             of a graph that was trimmed for several levels at once. only binary graph files in CSR
+                             layout could be loaded this way, and without copying them. optional
         '''
-        with open(filename, 'rb') as f:
-            self._vertices, self._edges = pickle.load(f)
+        self._reset()
+
+        with instrument.stage('graph.load', filename=filename) as stage:
+            if csr.is_csr_file(filename):
+                arrays, meta = csr.read(filename)
+                self._stored_manifest = arrays.get('manifest')
+                self._edges = None
+                self._vertices = None
+
+                if meta.get('layout') == 'symmetric':
+                    _check_max_vertices(max_vertices, None)
+                    self._symmetric = symmetric.SymmetricStore.from_arrays(arrays)
+                else:
+                    _check_max_vertices(max_vertices, meta.get('levels', []))
+                    self._store = csr.CSRStore(arrays, meta, max_vertices)
+                    self._edges = set(self._store.names.tolist())
+
+                stage['format'] = meta.get('layout', 'csr')
+            elif sqlite.is_sqlite_file(filename):
+                _check_max_vertices(max_vertices, None)
+                self._store = sqlite.SQLiteStore(filename)
+                self._stored_manifest = self._store.get_meta('manifest')
+                self._edges = set(self._store.names)
+                self._vertices = None
+
+                stage['format'] = 'sqlite'
+            else:
+                _check_max_vertices(max_vertices, None)
+
+                with open(filename, 'rb') as f:
+                    self._vertices, self._edges = pickle.load(f)
+
+                stage['format'] = 'pickle'
+
+            stage['edges'] = len(self.edges)
+
+    def _reset(self):
+        '''
+        Drops everything the graph holds, before it's backed by something else.
+        '''
+        self._cache.clear()
+        self._name_index = None
+        self._edge_ids = None
+        self._manifest = None
+        self._stored_manifest = None
+        self._store = None
+        self._database = None
+        self._symmetric = None
+        self._components = None
+        self._component_model = None
+        self._reverse = None
+
+    def _invalidate(self, keep_symmetric=False):
+        '''
+        Prepares the graph to be mutated.
+
+        :param keep_symmetric: whether the mutation keeps an undirected graph undirected. optional
+        '''
+        if self._database is None and (not keep_symmetric or self._symmetric is None):
+            self._materialize()
+
+        self._cache.clear()
+        self._name_index = None
+        self._edge_ids = None
+
+    def _materialize(self):
+        '''
+        Converts a graph that's backed by a store, or that's undirected, into its dict representation, so it could be
+        mutated as a directed graph.
+        '''
+        if self._store is not None:
+            with instrument.stage('graph.materialize', edges=len(self.edges)):
+                self._manifest = self.manifest
+                self._edges = set(self.edges)
+                self._vertices = dict(self._store.iter_neighbours())
+
+                self._component_model = self.component_model
+                if self._component_model is not None:
+                    self._components = {edge: {key: numpy.array(array)
+                                               for key, array in self._store.get_components(edge).items()}
+                                        for edge in self._vertices}
+
+                self._store = None
+                self._database = None
+
+        if self._symmetric is not None:
+            with instrument.stage('graph.materialize', edges=len(self._symmetric.names)):
+                self._manifest = self.manifest
+                self._edges = set(self._symmetric.names)
+                self._vertices = dict(self._symmetric.iter_neighbours())
+                self._symmetric = None
+
+    def _drop_components(self):
+        '''
+        Drops the components of all edges, once they could no longer be kept for all of them.
+        '''
+        self._components = None
+        self._component_model = None
+
+
+def _check_max_vertices(max_vertices, levels):
+    '''
+    Raises an error if a graph file could not be loaded with the given maximal amount of vertices per edge.
+
+    :param levels: levels the graph was trimmed for, or None if it could not be loaded at a level at all
+    '''
+    if max_vertices is None:
+        return
+
+    if levels is None:
+        raise Exception('Only binary graph files in CSR layout could be loaded with max_vertices')
+
+    # a graph that was trimmed misses the vertices beyond its largest level
+    if levels and max_vertices > max(levels):
+        raise Exception('Graph was only trimmed up to {0} vertices per edge'.format(max(levels)))
@@ -0,0 +1,84 @@
+import collections
+import time
+
+
+class QueryCache(object):
+    '''
+    Bounded cache of query results, evicting the least recently used entry once full.
+
+    Entries optionally expire after a given amount of seconds. Counts hits, misses, evictions and expirations, so the
+    hit rate of the cache could be monitored.
+    '''
+
+    def __init__(self, max_size=1024, ttl=None):
+        '''
+        :param max_size: maximal amount of entries. 0 disables the cache. optional
+        :param ttl: seconds after which an entry expires. optional
+        '''
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        '''
+        :return: counters of the cache, its size and its hit rate
+        :rtype: dict
+        '''
+        stats = dict(self._counters)
+        lookups = stats['hits'] + stats['misses']
+
+        stats['size'] = len(self._entries)
+        stats['max_size'] = self._max_size
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+        return stats
+
+    def get(self, key, default=None):
+        '''
+        :param key: key of the entry
+        :param default: value to return if there's no such entry. optional
+        :return: the cached value
+        '''
+        entry = self._entries.get(key)
+
+        if entry is not None and self._ttl is not None and time.monotonic() - entry[1] > self._ttl:
+            del self._entries[key]
+            self._counters['expirations'] += 1
+            entry = None
+
+        if entry is None:
+            self._counters['misses'] += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self._counters['hits'] += 1
+
+        return entry[0]
+
+    def put(self, key, value):
+        '''
+        :param key: key of the entry
+        :param value: value to cache
+        '''
+        if self._max_size <= 0:
+            return
+
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+    def clear(self):
+        '''
+        Invalidates all entries.
+        '''
+        if self._entries:
+            self._entries.clear()
+            self._counters['invalidations'] += 1
@@ -0,0 +1,141 @@
+'''
+Per-feature components of the weights of a graph, which let neighbours be ranked again with another weight vector,
+without building the graph again.
+
+A calculator that implements `calculate_components` describes its weights with a ComponentModel. A weight is the sum of
+its terms (e.g. geographic and time distance), each multiplied by its coefficient, times the penalty of each of its
+mismatch bits that's set (e.g. mismatching occupations), times a constant scale:
+
+    weight = scale * product(penalty[k] for each set bit k) * sum(coefficient[j] * term[j])
+
+A weight vector holds the coefficients and the penalties by name. Names that are not given keep the model's defaults,
+with which the components give back the original weights, up to the precision they are kept in: terms are kept as
+float32, and the mismatch bits as a single uint8 per vertex.
+'''
+
+import numpy
+
+
+MISMATCH = 'mismatch'
+
+TERM_DTYPE = numpy.float32
+MISMATCH_DTYPE = numpy.uint8
+
+
+class ComponentModel(object):
+    '''
+    Describes how the components of a vertex are combined into its weight.
+    '''
+
+    def __init__(self, terms, penalties, defaults, scale=1.0):
+        '''
+        :param terms: names of the terms, which are summed
+        :param penalties: names of the mismatch bits, by bit, which multiply the sum
+        :param defaults: coefficient of each term and penalty of each bit, with which the components give the original
+                         weights
+        :type defaults: dict(str, float)
+        :param scale: constant the weights are multiplied by. optional
+        '''
+        if len(penalties) > 8 * numpy.dtype(MISMATCH_DTYPE).itemsize:
+            raise Exception('Too many penalties')
+
+        self._terms = tuple(terms)
+        self._penalties = tuple(penalties)
+        self._defaults = {name: float(defaults[name]) for name in self._terms + self._penalties}
+        self._scale = float(scale)
+
+    @classmethod
+    def from_meta(cls, meta):
+        '''
+        :param meta: description of the model, as returned by `to_meta`
+        :rtype: ComponentModel
+        '''
+        return cls(meta['terms'], meta['penalties'], meta['defaults'], meta['scale'])
+
+    def to_meta(self):
+        '''
+        :return: json serializable description of the model, to store along with the components
+        :rtype: dict
+        '''
+        return {'terms': list(self._terms),
+                'penalties': list(self._penalties),
+                'defaults': dict(self._defaults),
+                'scale': self._scale}
+
+    @property
+    def names(self):
+        '''
+        :return: names of the component arrays of the vertices
+        :rtype: tuple(str)
+        '''
+        return self._terms + (MISMATCH,)
+
+    def dtype(self, name):
+        '''
+        :param name: name of a component array
+        :return: dtype the component is kept as
+        :rtype: numpy.dtype
+        '''
+        return numpy.dtype(MISMATCH_DTYPE if name == MISMATCH else TERM_DTYPE)
+
+    @property
+    def defaults(self):
+        '''
+        :return: the default weight vector
+        :rtype: dict(str, float)
+        '''
+        return dict(self._defaults)
+
+    def create(self, terms, mismatches):
+        '''
+        :param terms: values of each term, by name
+        :type terms: dict(str, numpy.ndarray)
+        :param mismatches: whether each penalty applies, by name
+        :type mismatches: dict(str, numpy.ndarray)
+        :return: compact components, by name
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        components = {name: numpy.asarray(terms[name], dtype=TERM_DTYPE) for name in self._terms}
+
+        bits = numpy.zeros(numpy.shape(terms[self._terms[0]]), dtype=MISMATCH_DTYPE)
+        for bit, name in enumerate(self._penalties):
+            bits |= numpy.asarray(mismatches[name], dtype=MISMATCH_DTYPE) << bit
+
+        components[MISMATCH] = bits
+        return components
+
+    def resolve(self, weights=None):
+        '''
+        :param weights: coefficients and penalties to change, by name. optional
+        :return: the full weight vector
+        :rtype: dict(str, float)
+        '''
+        vector = dict(self._defaults)
+
+        for name, value in (weights or {}).items():
+            if name not in vector:
+                raise Exception('Unknown weight "{0}", should be one of {1}'.format(name, ', '.join(sorted(vector))))
+
+            vector[name] = float(value)
+
+        return vector
+
+    def combine(self, components, weights=None):
+        '''
+        :param components: components of some vertices, by name, as returned by `create`
+        :param weights: coefficients and penalties to change, by name. optional
+        :return: the weights of the vertices
+        :rtype: numpy.ndarray
+        '''
+        vector = self.resolve(weights)
+
+        total = numpy.zeros(numpy.shape(components[MISMATCH]), dtype=numpy.float64)
+        for name in self._terms:
+            total += vector[name] * components[name].astype(numpy.float64)
+
+        # the product of the penalties of every combination of bits, looked up by the bits themselves
+        products = numpy.ones(2 ** len(self._penalties), dtype=numpy.float64)
+        for bit, name in enumerate(self._penalties):
+            products[(numpy.arange(len(products)) >> bit) & 1 == 1] *= vector[name]
+
+        return self._scale * products[components[MISMATCH]] * total
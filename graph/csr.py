@@ -0,0 +1,530 @@
+'''
+Compact binary graph format.
+
+A graph file holds a string table of the edges' names, and their vertices in CSR layout: the outgoing vertices of edge
+i are indices[offsets[i]:offsets[i + 1]] with the matching weights, pre-sorted by weight. Graphs that keep per-feature
+components of their weights hold them alongside, as component:<name> arrays (see `graph.components`). A dense
+undirected graph is held with the 'symmetric' layout instead, where each pair of edges is stored once in pair_weights
+(see `graph.symmetric`).
+
+As the neighbours of each edge are sorted, the graph trimmed to its lightest k vertices per edge is a prefix of each
+edge's neighbours, for any k. A file made by the trimmer lists the levels it was trimmed for in its meta, and a store
+could be opened at any of them with `max_vertices`, without copying anything.
+
+A trimmed graph is directed, so an edge could be in the neighbours of edges that are not in its own. The file holds a
+reverse index of the vertices into each edge as well: reverse_positions[reverse_offsets[i]:reverse_offsets[i + 1]] are
+the positions of the vertices into edge i, sorted by weight and then by source. The source of a vertex, and its rank
+among the source's neighbours, are found from its position, so the reverse index holds true for any level. It's built
+on first use for files that do not have it. A graph that's marked as 'undirected' in its meta, such as a sparse full
+graph or one made by a tiled build (see `tiles`), has no reverse index, as the edges that have an edge among their
+neighbours are its own neighbours.
+
+The file starts with a magic string and a JSON directory, followed by the arrays themselves, each aligned so it can be
+viewed in place through mmap without copying:
+
+    MAGIC | uint64 length of directory | directory (json) | arrays...
+'''
+
+import json
+import mmap
+import os
+import struct
+
+import numpy
+
+from graph import components as graph_components
+
+MAGIC = b'GRAPHCSR'
+VERSION = 2
+
+_ALIGNMENT = 64
+
+# amount of bytes of an array written at once
+_WRITE_SIZE = 2 ** 24
+
+
+def is_csr_file(filename):
+    '''
+    :param filename: file to check
+    :return: whether the file is in the binary graph format
+    :rtype: bool
+    '''
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write(filename, arrays, meta=None):
+    '''
+    Writes arrays into a binary graph file. The file is written aside and then moved into place, so readers that
+    have the old file mapped are not affected.
+
+    :param filename: file to write into
+    :param arrays: arrays to write, by name
+    :type arrays: dict(str, numpy.ndarray)
+    :param meta: json serializable information to store along. optional
+    '''
+    arrays = {name: numpy.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # the directory holds the offsets of the arrays, which depend on the size of the directory itself. reserve some
+    # room for the offsets' digits, and pad the directory to its reserved size
+    directory = {'version': VERSION, 'meta': meta or {}, 'arrays': {}}
+    for name, array in arrays.items():
+        directory['arrays'][name] = {'offset': 0, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    reserved = len(json.dumps(directory).encode()) + 24 * len(arrays)
+    offset = _align(len(MAGIC) + 8 + reserved)
+
+    for name, array in arrays.items():
+        directory['arrays'][name]['offset'] = offset
+        offset = _align(offset + array.nbytes)
+
+    encoded_directory = json.dumps(directory).encode().ljust(reserved)
+
+    temporary_filename = '{0}.tmp'.format(filename)
+    with open(temporary_filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(encoded_directory)))
+        f.write(encoded_directory)
+
+        for name, array in arrays.items():
+            f.write(b'\0' * (directory['arrays'][name]['offset'] - f.tell()))
+
+            # arrays could be mapped from files larger than memory, so they are written a part at a time
+            flat = array.reshape(-1)
+            step = max(1, _WRITE_SIZE // max(1, array.itemsize))
+            for start in range(0, len(flat), step):
+                f.write(flat[start:start + step].tobytes())
+
+    os.replace(temporary_filename, filename)
+
+
+def read(filename):
+    '''
+    Maps a binary graph file into memory.
+
+    :param filename: file to read
+    :return: read-only arrays by name, viewed in place over the mapped file, and the stored information
+    :rtype: tuple(dict(str, numpy.ndarray), dict)
+    '''
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception('Not a graph file')
+
+        directory_length, = struct.unpack('<Q', f.read(8))
+        directory = json.loads(f.read(directory_length).decode())
+
+        if directory['version'] > VERSION:
+            raise Exception('Unsupported graph file version')
+
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    arrays = {}
+    for name, description in directory['arrays'].items():
+        dtype = numpy.dtype(description['dtype'])
+        count = int(numpy.prod(description['shape']))
+        array = numpy.frombuffer(mapped, dtype=dtype, count=count, offset=description['offset'])
+        arrays[name] = array.reshape(description['shape'])
+
+    return arrays, directory['meta']
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def build_reverse(offsets, indices, weights):
+    '''
+    :param offsets: offsets of the vertices of each edge
+    :param indices: target of each vertex
+    :param weights: weight of each vertex
+    :return: arrays of the reverse index of the vertices, by name
+    :rtype: dict(str, numpy.ndarray)
+    '''
+    amount_of_edges = len(offsets) - 1
+    sources = numpy.repeat(numpy.arange(amount_of_edges), numpy.diff(offsets))
+
+    # by target, then by weight, then by source
+    positions = numpy.lexsort((sources, weights, indices))
+
+    reverse_offsets = numpy.zeros(amount_of_edges + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(indices, minlength=amount_of_edges), out=reverse_offsets[1:])
+
+    return {'reverse_offsets': reverse_offsets, 'reverse_positions': positions.astype(numpy.int64)}
+
+
+def encode_names(names):
+    '''
+    :param names: list of names
+    :return: string table of the names, as (offsets, utf-8 data)
+    :rtype: tuple(numpy.ndarray, numpy.ndarray)
+    '''
+    encoded = [name.encode('utf-8') for name in names]
+
+    offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(x) for x in encoded], out=offsets[1:])
+
+    return offsets, numpy.frombuffer(b''.join(encoded), dtype=numpy.uint8)
+
+
+def decode_names(offsets, data):
+    '''
+    :param offsets: offsets of the string table
+    :param data: utf-8 data of the string table
+    :return: list of names
+    :rtype: list(str)
+    '''
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    return [raw[start:stop].decode('utf-8') for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+class CSRStore(object):
+    '''
+    Read-only neighbours of a graph, in CSR layout.
+
+    Edges are identified by integer ids, which are their positions in the names table. Each edge's neighbours are
+    sorted by weight, ascending.
+    '''
+
+    def __init__(self, arrays, meta=None, max_vertices=None):
+        '''
+        :param arrays: arrays as returned by `read` or `from_vertices`
+        :param meta: stored information. optional
+        :param max_vertices: keep only the lightest <max_vertices> vertices of each edge. optional
+        '''
+        self._arrays = arrays
+        self._meta = meta or {}
+        self._max_vertices = max_vertices
+        self._truncated = None
+        self._reverse = None
+        self._names = numpy.array(decode_names(arrays['name_offsets'], arrays['name_data']), dtype=object)
+        self._ids = None
+
+        model = self._meta.get('components')
+        self._component_model = graph_components.ComponentModel.from_meta(model) if model is not None else None
+
+    @classmethod
+    def from_vertices(cls, edges, vertices, weights_dtype=numpy.float32, components=None, component_model=None):
+        '''
+        Builds a store from the dict representation of a graph.
+
+        :param edges: all edges of the graph
+        :param vertices: vertices of the graph, where [a][b] = weight of the vertex (a, b)
+        :param weights_dtype: dtype to store weights as. optional
+        :param components: components of the vertices of each edge, by name, ordered as its vertices. optional
+        :type components: dict(str, dict(str, numpy.ndarray))
+        :param component_model: model of the components, if they are given. optional
+        :type component_model: graph_components.ComponentModel
+        :rtype: CSRStore
+        '''
+        names = sorted(edges)
+        ids = {name: i for i, name in enumerate(names)}
+
+        has_neighbours = numpy.zeros(len(names), dtype=numpy.uint8)
+        degrees = numpy.zeros(len(names), dtype=numpy.int64)
+        indices = []
+        weights = []
+        sorted_components = []
+
+        for i, name in enumerate(names):
+            neighbours = vertices.get(name)
+            if neighbours is None:
+                continue
+
+            # a stable sort, so neighbours with equal weights keep their order
+            items = list(neighbours.items())
+            order = sorted(range(len(items)), key=lambda x: items[x][1])
+
+            has_neighbours[i] = 1
+            degrees[i] = len(items)
+            indices.extend(ids[items[x][0]] for x in order)
+            weights.extend(items[x][1] for x in order)
+
+            if components is not None:
+                sorted_components.append({key: array[order] for key, array in components[name].items()})
+
+        offsets = numpy.zeros(len(names) + 1, dtype=numpy.int64)
+        numpy.cumsum(degrees, out=offsets[1:])
+
+        name_offsets, name_data = encode_names(names)
+
+        arrays = {'name_offsets': name_offsets,
+                  'name_data': name_data,
+                  'has_neighbours': has_neighbours,
+                  'offsets': offsets,
+                  'indices': numpy.array(indices, dtype=numpy.int32),
+                  'weights': numpy.array(weights, dtype=weights_dtype)}
+        arrays.update(build_reverse(offsets, arrays['indices'], arrays['weights']))
+        meta = {}
+
+        if components is not None:
+            for key in component_model.names:
+                empty = numpy.zeros(0, dtype=component_model.dtype(key))
+                arrays['component:{0}'.format(key)] = numpy.concatenate(
+                    [empty] + [edge_components[key] for edge_components in sorted_components])
+
+            meta['components'] = component_model.to_meta()
+
+        return cls(arrays, meta)
+
+    @property
+    def arrays(self):
+        '''
+        :return: the arrays backing the store, by name. a store that's opened with `max_vertices` returns copies that
+                 only hold the lightest vertices of each edge
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        if self._max_vertices is None:
+            return self._arrays
+
+        if self._truncated is None:
+            self._truncated = self._truncate()
+
+        return self._truncated
+
+    @property
+    def meta(self):
+        '''
+        :return: information stored along with the arrays
+        :rtype: dict
+        '''
+        if self._max_vertices is None:
+            return self._meta
+
+        # a graph that's trimmed is no longer undirected
+        meta = dict(self._meta)
+        meta.pop('undirected', None)
+
+        if 'levels' in self._meta:
+            meta['levels'] = [level for level in self._meta['levels'] if level <= self._max_vertices]
+
+        return meta
+
+    @property
+    def max_vertices(self):
+        '''
+        :return: maximal amount of vertices of each edge, or None if they are all kept
+        :rtype: int
+        '''
+        return self._max_vertices
+
+    @property
+    def names(self):
+        '''
+        :return: names of all edges, by id
+        :rtype: numpy.ndarray
+        '''
+        return self._names
+
+    @property
+    def component_model(self):
+        '''
+        :return: model of the components of the vertices, or None if they are not kept
+        :rtype: graph_components.ComponentModel
+        '''
+        return self._component_model
+
+    def get_id(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: id of the edge, or None if there's no such edge
+        :rtype: int
+        '''
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self._names.tolist())}
+
+        return self._ids.get(edge)
+
+    def has_neighbours(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: whether the edge has a (possibly empty) set of outgoing vertices
+        :rtype: bool
+        '''
+        edge_id = self.get_id(edge)
+        return edge_id is not None and bool(self._arrays['has_neighbours'][edge_id])
+
+    def get_neighbour_ids(self, edge_id, limit=None):
+        '''
+        :param edge_id: id of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: ids of the neighbours of the edge, and their weights, sorted by weight
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        '''
+        start, stop = self._get_bounds(edge_id)
+
+        if limit is not None:
+            stop = min(stop, start + limit)
+
+        return self._arrays['indices'][start:stop], self._arrays['weights'][start:stop]
+
+    def get_sorted_neighbours(self, edge, limit=None):
+        '''
+        :param edge: name of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: neighbours as sorted list of tuples (name, score)
+        '''
+        if not self.has_neighbours(edge):
+            raise Exception('No such edge')
+
+        indices, weights = self.get_neighbour_ids(self.get_id(edge), limit)
+        return list(zip(self._names[indices].tolist(), weights.tolist()))
+
+    def get_neighbours(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: all vertices which come out of the edge, where [edge_2] = weight of the vertex (edge, edge_2)
+        :rtype: dict(str, float)
+        '''
+        return dict(self.get_sorted_neighbours(edge))
+
+    def get_weight(self, edge, neighbour):
+        '''
+        :param edge: name of the edge
+        :param neighbour: name of the edge the vertex goes into
+        :return: weight of the vertex (edge, neighbour), or None if there's no such vertex
+        :rtype: float
+        '''
+        if not self.has_neighbours(edge):
+            raise Exception('No such edge')
+
+        neighbour_id = self.get_id(neighbour)
+        if neighbour_id is None:
+            return None
+
+        # the neighbours are sorted by weight rather than by id, so the vertex is searched for
+        start, stop = self._get_bounds(self.get_id(edge))
+        positions = numpy.flatnonzero(self._arrays['indices'][start:stop] == neighbour_id)
+
+        return self._arrays['weights'][start + positions[0]].item() if len(positions) > 0 else None
+
+    def get_reverse_neighbour_ids(self, edge_id, limit=None):
+        '''
+        :param edge_id: id of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: ids of the edges that have the edge among their neighbours, and the weights of their vertices into
+                 it, sorted by weight
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        '''
+        if self._meta.get('undirected') and self._max_vertices is None:
+            return self.get_neighbour_ids(edge_id, limit)
+
+        reverse_offsets, reverse_positions = self._get_reverse()
+        offsets = self._arrays['offsets']
+
+        start, stop = reverse_offsets[edge_id:edge_id + 2].tolist()
+        positions = reverse_positions[start:stop]
+        sources = numpy.searchsorted(offsets, positions, side='right') - 1
+
+        # vertices beyond the kept ones of their source are not in the graph
+        if self._max_vertices is not None:
+            kept = positions - offsets[sources] < self._max_vertices
+            positions = positions[kept]
+            sources = sources[kept]
+
+        return sources[:limit], self._arrays['weights'][positions[:limit]]
+
+    def get_reverse_neighbours(self, edge, limit=None):
+        '''
+        :param edge: name of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: edges that have the edge among their neighbours, as sorted list of tuples (name, score)
+        '''
+        edge_id = self.get_id(edge)
+        if edge_id is None:
+            raise Exception('No such edge')
+
+        sources, weights = self.get_reverse_neighbour_ids(edge_id, limit)
+        return list(zip(self._names[sources].tolist(), weights.tolist()))
+
+    def get_components(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: components of the vertices which come out of the edge, by name, ordered as its sorted neighbours
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        if not self.has_neighbours(edge):
+            raise Exception('No such edge')
+
+        start, stop = self._get_bounds(self.get_id(edge))
+
+        return {key: self._arrays['component:{0}'.format(key)][start:stop] for key in self._component_model.names}
+
+    def iter_neighbours(self):
+        '''
+        :return: iterator over (edge, neighbours) for all edges that have outgoing vertices
+        '''
+        has_neighbours = self._arrays['has_neighbours']
+
+        for edge_id, name in enumerate(self._names.tolist()):
+            if has_neighbours[edge_id]:
+                yield name, self.get_neighbours(name)
+
+    def iter_neighbour_ids(self, start=0, stop=None):
+        '''
+        :param start: id of the first edge to go over. optional
+        :param stop: id after the last edge to go over. all edges from the first one if not given. optional
+        :return: iterator over (edge id, ids of neighbours, weights) for the edges in range that have outgoing vertices
+        '''
+        has_neighbours = self._arrays['has_neighbours'][start:stop]
+
+        for edge_id in (numpy.flatnonzero(has_neighbours) + start).tolist():
+            yield (edge_id,) + self.get_neighbour_ids(edge_id)
+
+    def save(self, filename):
+        '''
+        Writes the store into a binary graph file.
+
+        :param filename: file to write into
+        '''
+        write(filename, self.arrays, self.meta)
+
+    def _get_bounds(self, edge_id):
+        '''
+        :return: range of the vertices of the edge that are kept
+        :rtype: tuple(int, int)
+        '''
+        start, stop = self._arrays['offsets'][edge_id:edge_id + 2].tolist()
+
+        if self._max_vertices is not None:
+            stop = min(stop, start + self._max_vertices)
+
+        return start, stop
+
+    def _get_reverse(self):
+        '''
+        :return: offsets and positions of the reverse index of all vertices, as stored or built on first use
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        '''
+        if self._reverse is None:
+            if 'reverse_offsets' in self._arrays:
+                reverse = self._arrays
+            else:
+                reverse = build_reverse(self._arrays['offsets'], self._arrays['indices'], self._arrays['weights'])
+
+            self._reverse = (reverse['reverse_offsets'], reverse['reverse_positions'])
+
+        return self._reverse
+
+    def _truncate(self):
+        '''
+        :return: copies of the arrays, with only the vertices of each edge that are kept
+        :rtype: dict(str, numpy.ndarray)
+        '''
+        offsets = self._arrays['offsets']
+        degrees = numpy.minimum(numpy.diff(offsets), self._max_vertices)
+
+        truncated_offsets = numpy.zeros(len(offsets), dtype=numpy.int64)
+        numpy.cumsum(degrees, out=truncated_offsets[1:])
+
+        # position of each kept vertex in the full arrays: the start of its edge, plus its rank within the edge
+        positions = numpy.repeat(offsets[:-1] - truncated_offsets[:-1], degrees) + numpy.arange(truncated_offsets[-1])
+
+        arrays = dict(self._arrays)
+        arrays['offsets'] = truncated_offsets
+
+        for name in ['indices', 'weights'] + [name for name in self._arrays if name.startswith('component:')]:
+            arrays[name] = self._arrays[name][positions]
+
+        arrays.update(build_reverse(truncated_offsets, arrays['indices'], arrays['weights']))
+        return arrays
@@ -0,0 +1,201 @@
+'''
+Joint neighbours of a group of edges.
+
+Ranks candidates by aggregating their distances from each member of the group, using Fagin's threshold algorithm:
+the members' neighbours are read in sorted order, one depth at a time, and every newly seen candidate is scored
+exactly by looking its distances up. Reading stops once the best <group_size> scores can't be beaten by any candidate
+that wasn't seen yet, so usually only the first few neighbours of each member are ever read.
+
+A candidate that's missing from a member's neighbours (as happens in trimmed graphs) is considered to be as far from
+it as the member's farthest neighbour.
+'''
+
+import heapq
+
+
+MODES = ('sum', 'max', 'rank')
+
+# smoothing constant of reciprocal rank fusion
+RANK_CONSTANT = 60
+
+# amount of neighbours that are fetched in order at about the cost of looking a single one up by itself
+LOOKUP_COST = 8
+
+
+class _SortedNeighbours(object):
+    '''
+    Sorted neighbours of a single member of the group, fetched lazily in growing chunks. Only the fetched neighbours are
+    indexed, and the weights of the others are looked up by themselves.
+    '''
+
+    def __init__(self, graph, edge, chunk_size, weights=None):
+        self._graph = graph
+        self._edge = edge
+        self._weights = weights
+        self._items = []
+        self._positions = {}
+        self._lookups = 0
+        self._fetch(chunk_size)
+
+    def _fetch(self, limit):
+        '''
+        Fetches the first <limit> neighbours, or all of them if it's None, and indexes the ones that are new.
+        '''
+        items = self._graph.get_sorted_neighbours(self._edge, limit=limit, weights=self._weights)
+        self._positions.update((name, i) for i, (name, _) in enumerate(items[len(self._items):], len(self._items)))
+
+        self._items = items
+        self._limit = limit
+        self._exhausted = limit is None or len(items) < limit
+
+    def get(self, depth):
+        '''
+        :param depth: position in the sorted neighbours
+        :return: (name, weight) at the given position, or None if there are not as many neighbours
+        '''
+        while depth >= len(self._items) and not self._exhausted:
+            self._fetch(2 * self._limit)
+
+        return self._items[depth] if depth < len(self._items) else None
+
+    def weight(self, name):
+        '''
+        :return: weight of the vertex to the given neighbour, or of the farthest one if it's not a neighbour
+        '''
+        position = self._positions.get(name)
+
+        # neighbours that were not fetched yet are looked up by themselves, as long as the lookups cost less than the
+        # neighbours that were fetched. past that, the search goes deep, and all of them are fetched at once
+        if position is None and not self._exhausted and self._lookups * LOOKUP_COST >= len(self._items):
+            self._fetch(None)
+            position = self._positions.get(name)
+
+        if position is not None:
+            return self._items[position][1]
+
+        # neighbours ranked by a weight vector are combined all at once anyway
+        if not self._exhausted and self._weights is None and name is not None:
+            self._lookups += 1
+
+            weight = self._graph.get_weight(self._edge, name)
+            if weight is not None:
+                return weight
+
+        if not self._exhausted:
+            self._fetch(None)
+
+            position = self._positions.get(name)
+            if position is not None:
+                return self._items[position][1]
+
+        # the farthest neighbour is the last one
+        return self._items[-1][1] if self._items else float('inf')
+
+    def rank(self, name):
+        '''
+        :return: position of the given neighbour, or the amount of neighbours if it's not a neighbour
+        '''
+        position = self._positions.get(name)
+
+        # ranks are only known for fetched neighbours, so the rest of them are fetched once a rank beyond them is needed
+        if position is None and not self._exhausted:
+            self._fetch(None)
+            position = self._positions.get(name)
+
+        return position if position is not None else len(self._items)
+
+    def worst(self, mode):
+        '''
+        :return: value of a candidate that's not a neighbour
+        '''
+        if mode == 'rank':
+            return self.rank(None)
+
+        return self.weight(None)
+
+
+def _aggregate(values, mode):
+    '''
+    Aggregates the values of a candidate for all members into a single score. lower is better.
+
+    :param values: weights of the candidate from each member, or its ranks in the 'rank' mode
+    :param mode: one of MODES
+    '''
+    if mode == 'sum':
+        return sum(values)
+    elif mode == 'max':
+        return max(values)
+    else:
+        return -sum(1.0 / (RANK_CONSTANT + rank + 1) for rank in values)
+
+
+def get_joint_neighbours(graph, edges, group_size, mode='sum', weights=None):
+    '''
+    Finds the best candidates to join a group of edges.
+
+    :param graph: graph to search in
+    :param edges: members of the group
+    :param group_size: how many candidates to return
+    :param mode: how to aggregate the distances from the members: 'sum' of weights, 'max' weight, or 'rank' for
+                 reciprocal rank fusion of the members' sorted neighbours. optional
+    :param weights: weight vector to rank the members' neighbours by, rather than by their weights. optional
+    :return: best candidates, which are not members, as sorted list of tuples (name, score). lower scores are better
+    '''
+    if mode not in MODES:
+        raise Exception('Unknown mode "{0}"'.format(mode))
+
+    # members are sorted, so the order in which they are given does not affect the order of equally scored candidates
+    members = sorted(set(edges))
+    lists = [_SortedNeighbours(graph, edge, chunk_size=2 * group_size + len(members), weights=weights)
+             for edge in members]
+
+    # members without any neighbours say nothing about the candidates
+    lists = [sorted_neighbours for sorted_neighbours in lists if sorted_neighbours.get(0) is not None]
+    if not lists:
+        return []
+
+    def value(sorted_neighbours, name):
+        return sorted_neighbours.rank(name) if mode == 'rank' else sorted_neighbours.weight(name)
+
+    # heap of the best candidates seen so far, as (-score, -order, name), so the worst of them is on top. among equal
+    # scores, candidates that were seen first are preferred
+    best = []
+    seen = set(members)
+    order = 0
+    depth = 0
+
+    while group_size > 0:
+        frontier = []
+        exhausted = True
+
+        for sorted_neighbours in lists:
+            item = sorted_neighbours.get(depth)
+
+            # once a member's neighbours are all read, any other candidate is missing from them
+            if item is None:
+                frontier.append(sorted_neighbours.worst(mode))
+                continue
+
+            exhausted = False
+            name, weight = item
+            frontier.append(depth if mode == 'rank' else weight)
+
+            if name in seen:
+                continue
+
+            seen.add(name)
+            order += 1
+            score = _aggregate([value(x, name) for x in lists], mode)
+
+            if len(best) < group_size:
+                heapq.heappush(best, (-score, -order, name))
+            elif (score, order) < (-best[0][0], -best[0][1]):
+                heapq.heapreplace(best, (-score, -order, name))
+
+        # no unseen candidate can score better than the values at the current depth
+        if exhausted or (len(best) == group_size and -best[0][0] <= _aggregate(frontier, mode)):
+            break
+
+        depth += 1
+
+    return [(name, -score) for score, _, name in sorted(best, reverse=True)]
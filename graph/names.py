@@ -0,0 +1,153 @@
+'''
+Index over the names of a graph's edges, for lookups that don't depend on the exact spelling of a name.
+
+Names are folded before being indexed: case-folded, stripped of accents and with whitespace collapsed, so "mcdonald"
+finds "McDonald" and "sorensen" finds "Sørensen" alike.
+'''
+
+import bisect
+import collections
+import unicodedata
+
+
+# length of the n-grams used for substring and fuzzy search
+GRAM_SIZE = 3
+
+# minimal similarity of a fuzzy match, as the jaccard index of the n-grams of the query and the name
+FUZZY_THRESHOLD = 0.3
+
+# letters that are not decomposed into a base letter and an accent by unicode normalization
+_LETTERS = str.maketrans({'ø': 'o', 'æ': 'ae', 'œ': 'oe', 'ß': 'ss', 'đ': 'd', 'ł': 'l', 'ı': 'i', 'þ': 'th'})
+
+
+def fold(text):
+    '''
+    :param text: text to fold
+    :return: case-folded text without accents, where all whitespace is collapsed into single spaces
+    :rtype: str
+    '''
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.translate(_LETTERS).split())
+
+
+def _grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class NameIndex(object):
+    '''
+    Exact, prefix, substring and fuzzy search over a set of names.
+    '''
+
+    def __init__(self, names):
+        '''
+        :param names: names to index
+        '''
+        self._names = sorted(names, key=lambda name: (fold(name), name))
+        self._folded = [fold(name) for name in self._names]
+
+        self._exact = {}
+        for name, folded in zip(self._names, self._folded):
+            self._exact.setdefault(folded, []).append(name)
+
+        self._postings = collections.defaultdict(list)
+        self._gram_counts = []
+        for i, folded in enumerate(self._folded):
+            grams = _grams(folded)
+            self._gram_counts.append(len(grams))
+
+            for gram in grams:
+                self._postings[gram].append(i)
+
+    def lookup(self, query):
+        '''
+        :param query: name to look up, spelled in any case and with or without accents
+        :return: the indexed name, or None if there's no such name. if several names are folded the same, the one
+                 spelled exactly as the query is preferred
+        :rtype: str
+        '''
+        names = self._exact.get(fold(query))
+        if not names:
+            return None
+
+        return query if query in names else names[0]
+
+    def search(self, query, limit=10):
+        '''
+        Searches names by a query. Names that match exactly come first, then names that start with the query, then
+        names that contain it, and finally names that are similar to it.
+
+        :param query: text to search for
+        :param limit: maximal amount of names to return. if not given, all exact, prefix and substring matches are
+                      returned, and no fuzzy ones. optional
+        :return: matching names
+        :rtype: list(str)
+        '''
+        folded = fold(query)
+        if not folded:
+            return []
+
+        result = list(self._exact.get(folded, []))
+        found = set(result)
+
+        def extend(ids):
+            for i in ids:
+                if limit is not None and len(result) >= limit:
+                    return
+
+                if self._names[i] not in found:
+                    found.add(self._names[i])
+                    result.append(self._names[i])
+
+        # prefix matches are a contiguous range of the sorted folded names
+        start = bisect.bisect_left(self._folded, folded)
+        stop = bisect.bisect_left(self._folded, folded + '\uffff', lo=start)
+        extend(range(start, stop))
+
+        # substring matches, ordered by where they match and then alphabetically
+        substring_ids = [i for i in self._candidates(folded) if folded in self._folded[i]]
+        extend(sorted(substring_ids, key=lambda i: (self._folded[i].index(folded), i)))
+
+        if limit is not None and len(result) < limit:
+            extend(self._similar(folded))
+
+        return result[:limit]
+
+    def _candidates(self, folded):
+        '''
+        :return: ids of names that contain all n-grams of the query, i.e. might contain the query itself
+        '''
+        grams = _grams(folded)
+
+        # n-grams can't narrow down short queries
+        if not grams:
+            return range(len(self._names))
+
+        postings = sorted((self._postings.get(gram, []) for gram in grams), key=len)
+        candidates = set(postings[0])
+
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+
+        return sorted(candidates)
+
+    def _similar(self, folded):
+        '''
+        :return: ids of names that share enough n-grams with the query, most similar first
+        '''
+        grams = _grams(folded)
+        shared = collections.Counter()
+
+        for gram in grams:
+            shared.update(self._postings.get(gram, []))
+
+        similarities = []
+        for i, count in shared.items():
+            similarity = count / (len(grams) + self._gram_counts[i] - count)
+            if similarity >= FUZZY_THRESHOLD:
+                similarities.append((-similarity, i))
+
+        return [i for _, i in sorted(similarities)]
@@ -0,0 +1,436 @@
+'''
+Graph stored in a SQLite database, so it could be larger than memory, and read by several processes at once.
+
+    people(id, name, has_neighbours)   edges, with integer ids in the order in which they were added
+    pairs(src, dst, weight, rank)      vertices, keyed by (src, dst), with indexes over (src, weight, rank) and
+                                       (dst, weight, rank)
+    meta(key, value)                   e.g. the manifest of the graph
+
+Each vertex is stored in its own direction, so a vertex that's added in both directions is stored twice. The sorted
+neighbours of an edge are read straight off the (src, weight, rank) index, which also holds dst, so the lightest <limit>
+neighbours are found without reading the others. Equal weights are ordered by rank, which is the sequence in which the
+vertices were added, so they are ordered as in a graph in memory, which keeps its neighbours in the order they were
+added or set in as well. Databases written by older versions have no rank, and order equal weights by id. The edges
+that have an edge among their neighbours are read off the (dst, weight, rank) index in the same way.
+
+A database is built in WAL mode, so it could be read while it's written. Vertices are inserted in batches, in large
+transactions, and the indexes are only created once they were all inserted, which is much faster than maintaining them.
+Once finished, it's switched back to a rollback journal, so it's a single file that any amount of processes could read
+at once.
+'''
+
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+
+HEADER = b'SQLite format 3\0'
+EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+
+_SCHEMA = '''
+CREATE TABLE people (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, has_neighbours INTEGER NOT NULL);
+CREATE TABLE pairs (src INTEGER NOT NULL, dst INTEGER NOT NULL, weight REAL NOT NULL, rank INTEGER NOT NULL,
+                    PRIMARY KEY (src, dst)) WITHOUT ROWID;
+CREATE TABLE meta (key TEXT PRIMARY KEY, value BLOB);
+'''
+
+_INDEXES = ('CREATE INDEX IF NOT EXISTS pairs_by_weight ON pairs (src, weight, rank)',
+            'CREATE INDEX IF NOT EXISTS pairs_by_target ON pairs (dst, weight, rank)')
+
+
+def is_sqlite_file(filename):
+    '''
+    :param filename: file to check
+    :return: whether the file is a SQLite database
+    :rtype: bool
+    '''
+    with open(filename, 'rb') as f:
+        return f.read(len(HEADER)) == HEADER
+
+
+def is_database_filename(filename):
+    '''
+    :param filename: name of a graph file
+    :return: whether a graph saved into the file is saved as a SQLite database, by its extension
+    :rtype: bool
+    '''
+    return os.path.splitext(filename)[1].lower() in EXTENSIONS
+
+
+def write(filename, names, neighbours, manifest=None):
+    '''
+    Writes a graph into a new database. The database is written aside and then moved into place, so readers that have
+    the old one open are not affected.
+
+    :param filename: file to write into
+    :param names: names of all edges, in the order of their ids
+    :param neighbours: iterator over (edge, neighbours) for all edges that have outgoing vertices
+    :param manifest: json encoded manifest to store along. optional
+    :type manifest: bytes
+    '''
+    temporary_filename = '{0}.tmp'.format(filename)
+    store = SQLiteStore.create(temporary_filename)
+
+    try:
+        store.add_edges(names)
+
+        for edge, edge_neighbours in neighbours:
+            store.set_neighbours(edge, edge_neighbours)
+
+        store.finish(manifest)
+        store.move(filename)
+    finally:
+        store.close()
+
+
+class SQLiteStore(object):
+    '''
+    Neighbours of a graph, in a SQLite database. Read-only, unless it was created with `create`.
+
+    The names of the edges are held in memory, while the vertices are only read when they are queried. The store could
+    be queried from several threads.
+    '''
+
+    # amount of vertices inserted at once, and at least in each transaction
+    batch_size = 2 ** 16
+    transaction_size = 2 ** 22
+
+    def __init__(self, filename, writable=False):
+        '''
+        :param filename: database to open
+        :param writable: whether vertices could be added. optional
+        '''
+        self._filename = filename
+        self._writable = writable
+        self._lock = threading.RLock()
+        self._pending_pairs = []
+        self._pending_people = set()
+        self._uncommitted = 0
+
+        # rank of the next vertex that's added
+        self._sequence = 0
+
+        self._connect()
+
+        with self._lock:
+            people = self._connection.execute('SELECT id, name, has_neighbours FROM people ORDER BY id').fetchall()
+
+            columns = [column[1] for column in self._connection.execute('PRAGMA table_info(pairs)').fetchall()]
+
+        self._names = [name for _, name, _ in people]
+        self._ids = {name: i for i, name, _ in people}
+        self._has_neighbours = bytearray(has_neighbours for _, _, has_neighbours in people)
+
+        # equal weights of databases written by older versions, which have no rank, are ordered by id
+        self._neighbours_query = 'SELECT dst, weight FROM pairs WHERE src = ? ORDER BY weight, {0} LIMIT ?'.format(
+            'rank' if 'rank' in columns else 'dst')
+        self._reverse_query = 'SELECT src, weight FROM pairs WHERE dst = ? ORDER BY weight, {0} LIMIT ?'.format(
+            'rank' if 'rank' in columns else 'src')
+
+    @classmethod
+    def create(cls, filename):
+        '''
+        Creates an empty database to build a graph into, replacing any existing one.
+
+        :param filename: file to create
+        :rtype: SQLiteStore
+        '''
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(filename + suffix):
+                os.remove(filename + suffix)
+
+        connection = sqlite3.connect(filename)
+        connection.executescript(_SCHEMA)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.close()
+
+        return cls(filename, writable=True)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def writable(self):
+        return self._writable
+
+    @property
+    def names(self):
+        '''
+        :return: names of all edges, by id
+        :rtype: list(str)
+        '''
+        return self._names
+
+    @property
+    def ids(self):
+        '''
+        :return: ids of all edges, by name
+        :rtype: dict(str, int)
+        '''
+        return self._ids
+
+    @property
+    def component_model(self):
+        '''
+        :return: None, as databases do not keep components of the weights
+        '''
+        return None
+
+    def get_meta(self, key):
+        '''
+        :param key: key of the stored value
+        :return: the value, or None if there's none
+        '''
+        with self._lock:
+            self._reconnect_if_forked()
+            row = self._connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def has_neighbours(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: whether the edge has a (possibly empty) set of outgoing vertices
+        :rtype: bool
+        '''
+        edge_id = self._ids.get(edge)
+        return edge_id is not None and bool(self._has_neighbours[edge_id])
+
+    def get_sorted_neighbours(self, edge, limit=None):
+        '''
+        :param edge: name of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: neighbours as sorted list of tuples (name, score). equal weights are ordered by rank
+        '''
+        if not self.has_neighbours(edge):
+            raise Exception('No such edge')
+
+        with self._lock:
+            self._reconnect_if_forked()
+            self._flush()
+            rows = self._connection.execute(self._neighbours_query,
+                                            (self._ids[edge], -1 if limit is None else limit)).fetchall()
+
+        return [(self._names[dst], weight) for dst, weight in rows]
+
+    def get_neighbours(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: all vertices which come out of the edge, where [edge_2] = weight of the vertex (edge, edge_2)
+        :rtype: dict(str, float)
+        '''
+        return dict(self.get_sorted_neighbours(edge))
+
+    def get_weight(self, edge, neighbour):
+        '''
+        :param edge: name of the edge
+        :param neighbour: name of the edge the vertex goes into
+        :return: weight of the vertex (edge, neighbour), or None if there's no such vertex
+        :rtype: float
+        '''
+        if not self.has_neighbours(edge):
+            raise Exception('No such edge')
+
+        if neighbour not in self._ids:
+            return None
+
+        with self._lock:
+            self._reconnect_if_forked()
+            self._flush()
+            row = self._connection.execute('SELECT weight FROM pairs WHERE src = ? AND dst = ?',
+                                           (self._ids[edge], self._ids[neighbour])).fetchone()
+
+        return row[0] if row is not None else None
+
+    def get_reverse_neighbours(self, edge, limit=None):
+        '''
+        :param edge: name of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: edges that have the edge among their neighbours, as sorted list of tuples (name, score). equal weights
+                 are ordered by rank
+        '''
+        if edge not in self._ids:
+            raise Exception('No such edge')
+
+        with self._lock:
+            self._reconnect_if_forked()
+            self._flush()
+            rows = self._connection.execute(self._reverse_query,
+                                            (self._ids[edge], -1 if limit is None else limit)).fetchall()
+
+        return [(self._names[src], weight) for src, weight in rows]
+
+    def iter_neighbours(self):
+        '''
+        :return: iterator over (edge, neighbours) for all edges that have outgoing vertices, by id
+        '''
+        for edge_id, name in enumerate(self._names):
+            if self._has_neighbours[edge_id]:
+                yield name, self.get_neighbours(name)
+
+    def add_edges(self, edges):
+        '''
+        Adds edges that are new, without any vertices.
+
+        :param edges: names of the edges
+        :return: ids of the edges
+        :rtype: list(int)
+        '''
+        with self._lock:
+            return [self._add_name(edge) for edge in edges]
+
+    def add_vertices(self, a, neighbours, weights):
+        '''
+        Adds vertices between an edge and each of the given edges, in both directions.
+
+        :param a: first edge
+        :param neighbours: second edges
+        :param weights: weight of each vertex, ordered as the neighbours
+        '''
+        with self._lock:
+            a_id = self._add_name(a)
+            self._set_has_neighbours(a_id)
+
+            for b, weight in zip(neighbours, weights):
+                b_id = self._add_name(b)
+                self._set_has_neighbours(b_id)
+
+                self._pending_pairs.append((a_id, b_id, weight, self._sequence))
+                self._pending_pairs.append((b_id, a_id, weight, self._sequence))
+                self._sequence += 1
+
+            if len(self._pending_pairs) >= self.batch_size:
+                self._flush()
+
+    def set_neighbours(self, edge, neighbours):
+        '''
+        Replaces all outgoing vertices of an edge.
+
+        :param edge: relevant edge
+        :param neighbours: neighbouring edges and their vertices
+        :type neighbours: dict(str, float)
+        '''
+        with self._lock:
+            edge_id = self._add_name(edge)
+
+            if self._has_neighbours[edge_id]:
+                self._flush()
+                self._connection.execute('DELETE FROM pairs WHERE src = ?', (edge_id,))
+
+            self._set_has_neighbours(edge_id)
+
+            for neighbour, weight in neighbours.items():
+                self._pending_pairs.append((edge_id, self._add_name(neighbour), weight, self._sequence))
+                self._sequence += 1
+
+            if len(self._pending_pairs) >= self.batch_size:
+                self._flush()
+
+    def finish(self, manifest=None):
+        '''
+        Writes all pending vertices, creates the indexes and commits, so the database could be read by other processes.
+
+        :param manifest: json encoded manifest to store along. optional
+        :type manifest: bytes
+        '''
+        with self._lock:
+            self._flush()
+
+            if manifest is not None:
+                self._connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                         ('manifest', manifest))
+
+            for index in _INDEXES:
+                self._connection.execute(index)
+
+            self._connection.commit()
+            self._uncommitted = 0
+
+            # the finished database is a single file again, which readers open without a log of their own
+            self._connection.execute('PRAGMA journal_mode=DELETE')
+
+    def move(self, filename):
+        '''
+        Moves a finished database into another file, and keeps using it from there.
+
+        :param filename: file to move into
+        '''
+        if os.path.abspath(filename) == os.path.abspath(self._filename):
+            return
+
+        with self._lock:
+            self.close()
+            os.replace(self._filename, filename)
+
+            self._filename = filename
+            self._connect()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self):
+        uri = 'file:{0}?mode={1}'.format(urllib.parse.quote(os.path.abspath(self._filename)),
+                                         'rw' if self._writable else 'ro')
+
+        # queries are serialized by the lock, so the connection could be shared between threads
+        self._connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._pid = os.getpid()
+        self._connection.execute('PRAGMA cache_size = -{0}'.format(2 ** 16))
+
+        if self._writable:
+            self._connection.execute('PRAGMA synchronous = NORMAL')
+        else:
+            self._connection.execute('PRAGMA mmap_size = {0}'.format(2 ** 30))
+
+    def _reconnect_if_forked(self):
+        '''
+        A connection could not be used by a process that was forked from the one that opened it, so a read-only store
+        that's used by a forked process, e.g. a worker, opens its own.
+        '''
+        if self._pid != os.getpid() and not self._writable:
+            self._connect()
+
+    def _add_name(self, edge):
+        edge_id = self._ids.get(edge)
+
+        if edge_id is None:
+            if not self._writable:
+                raise Exception('Graph database is read-only')
+
+            edge_id = self._ids[edge] = len(self._names)
+            self._names.append(edge)
+            self._has_neighbours.append(0)
+            self._pending_people.add(edge_id)
+
+        return edge_id
+
+    def _set_has_neighbours(self, edge_id):
+        if not self._has_neighbours[edge_id]:
+            self._has_neighbours[edge_id] = 1
+            self._pending_people.add(edge_id)
+
+    def _flush(self):
+        '''
+        Inserts the pending edges and vertices, and commits once a transaction is large enough.
+        '''
+        if not self._pending_people and not self._pending_pairs:
+            return
+
+        self._connection.executemany('INSERT OR REPLACE INTO people (id, name, has_neighbours) VALUES (?, ?, ?)',
+                                     ((i, self._names[i], self._has_neighbours[i])
+                                      for i in sorted(self._pending_people)))
+        self._connection.executemany('INSERT OR REPLACE INTO pairs (src, dst, weight, rank) VALUES (?, ?, ?, ?)',
+                                     self._pending_pairs)
+
+        self._uncommitted += len(self._pending_pairs)
+        self._pending_people.clear()
+        self._pending_pairs = []
+
+        if self._uncommitted >= self.transaction_size:
+            self._connection.commit()
+            self._uncommitted = 0
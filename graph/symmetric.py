@@ -0,0 +1,449 @@
+'''
+Weights of an undirected graph, where each pair of edges is stored once.
+
+Edges are identified by integer ids, in the order in which they were added, or in the order they are given to
+`order_edges`, e.g. the order of the rows of the dataset, which equal weights are ordered by. The weight of the vertex between ids
+i < j is kept at j * (j - 1) / 2 + i of a packed triangle, so the vertices of a new edge are appended after all the
+others, and the vertices of an edge to all edges before it are contiguous. Missing vertices are NaN.
+
+The triangle takes memory by the amount of edges squared, however few of the pairs are kept, so a sparse store keeps a
+list of its pairs instead, e.g. for a graph that's built with a threshold. Its neighbours are indexed on first use.
+
+A graph file holds the packed triangle only if it's dense enough for it to be smaller (see `DENSE_FRACTION`), and the
+neighbours of each edge in CSR layout otherwise, marked as 'undirected' (see `graph.csr`).
+'''
+
+import numpy
+
+from graph import csr
+
+
+# fraction of all pairs that have to be kept for the packed triangle to be saved. each pair takes the room of four
+# slots of the triangle in CSR layout, as it's stored in both directions, along with the id of its other edge
+DENSE_FRACTION = 0.25
+
+
+class SymmetricStore(object):
+    '''
+    Neighbours of an undirected graph, in a packed triangle of weights, or in a list of pairs if it's sparse. Grows as
+    edges are added.
+    '''
+
+    def __init__(self, names=None, weights=None, dtype=numpy.float64, sparse=False):
+        '''
+        :param names: names of the edges, by id. optional
+        :param weights: packed triangle of the weights between the edges. all missing if not given. optional
+        :param dtype: dtype of the weights, if they are not given. optional
+        :param sparse: keep a list of the pairs rather than a packed triangle, which takes memory by the amount of
+                       pairs rather than the amount of edges squared. weights could not be given. optional
+        '''
+        self._names = list(names or [])
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._sparse = sparse
+        self._index = None
+
+        if sparse:
+            if weights is not None:
+                raise Exception('A sparse store could not be given a packed triangle')
+
+            # pairs may be longer than the amount of pairs, to leave room for more of them
+            self._pairs = numpy.zeros(0, dtype=_pair_dtype(dtype))
+            self._amount_of_pairs = 0
+            self._weights = None
+            return
+
+        if weights is None:
+            weights = numpy.full(_triangle_size(len(self._names)), numpy.nan, dtype=dtype)
+
+        # weights may be longer than the triangle, to leave room for more edges
+        self._weights = weights
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+        :param arrays: arrays as returned by `to_arrays`, or read from a graph file
+        :rtype: SymmetricStore
+        '''
+        return cls(csr.decode_names(arrays['name_offsets'], arrays['name_data']), arrays['pair_weights'])
+
+    def to_arrays(self, weights_dtype=numpy.float32):
+        '''
+        :param weights_dtype: dtype to store weights as. optional
+        :return: arrays to write into a graph file, by name, and its meta. the packed triangle if at least
+                 DENSE_FRACTION of all pairs are kept, and the neighbours in CSR layout otherwise
+        :rtype: tuple(dict(str, numpy.ndarray), dict)
+        '''
+        name_offsets, name_data = csr.encode_names(self._names)
+        size = _triangle_size(len(self._names))
+
+        if self._sparse:
+            pairs = self._get_pairs()
+            amount_of_pairs = len(pairs[2])
+        else:
+            pairs = None
+            amount_of_pairs = numpy.count_nonzero(~numpy.isnan(self.weights))
+
+        if amount_of_pairs >= DENSE_FRACTION * size:
+            if pairs is not None:
+                low, high, weights = pairs
+                pair_weights = numpy.full(size, numpy.nan, dtype=weights_dtype)
+                pair_weights[high * (high - 1) // 2 + low] = weights
+            else:
+                pair_weights = self.weights.astype(weights_dtype)
+
+            arrays = {'name_offsets': name_offsets,
+                      'name_data': name_data,
+                      'pair_weights': pair_weights}
+
+            return arrays, {'layout': 'symmetric'}
+
+        low, high, weights = pairs if pairs is not None else self._get_pairs()
+
+        # neighbours are sorted by their stored weight, and equal weights by id, as they are in the triangle
+        sources = numpy.concatenate([low, high])
+        targets = numpy.concatenate([high, low])
+        weights = numpy.tile(weights.astype(weights_dtype), 2)
+        order = numpy.lexsort((targets, weights, sources))
+
+        offsets = numpy.zeros(len(self._names) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(sources, minlength=len(self._names)), out=offsets[1:])
+
+        # all edges are in the graph, even ones that have no neighbours left
+        arrays = {'name_offsets': name_offsets,
+                  'name_data': name_data,
+                  'has_neighbours': numpy.ones(len(self._names), dtype=numpy.uint8),
+                  'offsets': offsets,
+                  'indices': targets[order].astype(numpy.int32),
+                  'weights': weights[order]}
+
+        return arrays, {'undirected': True}
+
+    @property
+    def names(self):
+        '''
+        :return: names of all edges, by id
+        :rtype: list(str)
+        '''
+        return self._names
+
+    @property
+    def ids(self):
+        '''
+        :return: ids of all edges, by name
+        :rtype: dict(str, int)
+        '''
+        return self._ids
+
+    @property
+    def sparse(self):
+        '''
+        :return: whether the store keeps a list of its pairs rather than a packed triangle
+        :rtype: bool
+        '''
+        return self._sparse
+
+    @property
+    def weights(self):
+        '''
+        :return: the packed triangle of the weights. only kept by stores that are not sparse
+        :rtype: numpy.ndarray
+        '''
+        if self._sparse:
+            raise Exception('A sparse store keeps no packed triangle')
+
+        return self._weights[:_triangle_size(len(self._names))]
+
+    def add_edge(self, edge):
+        '''
+        Adds an edge if it's new, and makes room for its vertices. Weights could only be set between the ids returned
+        by `add_edge` and `add_edges`.
+
+        :param edge: name of the edge
+        :return: id of the edge
+        :rtype: int
+        '''
+        edge_id = self._add_name(edge)
+        if not self._sparse:
+            self._reserve(_triangle_size(len(self._names)))
+
+        return edge_id
+
+    def add_edges(self, edges):
+        '''
+        Same as `add_edge` for each of the edges, only the room for their vertices is made once.
+
+        :param edges: names of the edges
+        :return: ids of the edges
+        :rtype: numpy.ndarray
+        '''
+        ids = numpy.array([self._add_name(edge) for edge in edges], dtype=numpy.int64)
+        if not self._sparse:
+            self._reserve(_triangle_size(len(self._names)))
+
+        return ids
+
+    def order_edges(self, edges):
+        '''
+        Numbers the edges in the order of the given edges, so equal weights are ordered by it. Edges that are not given
+        keep their order, after the given ones.
+
+        :param edges: names of edges, in order. ones that are not in the store are skipped
+        '''
+        order = []
+        seen = set()
+
+        for edge in edges:
+            edge_id = self._ids.get(edge)
+            if edge_id is not None and edge_id not in seen:
+                order.append(edge_id)
+                seen.add(edge_id)
+
+        order.extend(edge_id for edge_id in range(len(self._names)) if edge_id not in seen)
+        order = numpy.array(order, dtype=numpy.int64)
+
+        if numpy.array_equal(order, numpy.arange(len(order))):
+            return
+
+        new_ids = numpy.empty(len(order), dtype=numpy.int64)
+        new_ids[order] = numpy.arange(len(order))
+
+        low, high, weights = self._get_pairs()
+        low, high = new_ids[low], new_ids[high]
+        low, high = numpy.minimum(low, high), numpy.maximum(low, high)
+
+        self._names = [self._names[i] for i in order.tolist()]
+        self._ids = {name: i for i, name in enumerate(self._names)}
+        self._index = None
+
+        if self._sparse:
+            self._pairs = numpy.zeros(0, dtype=self._pairs.dtype)
+            self._amount_of_pairs = 0
+            self._append_pairs(low, high, weights)
+        else:
+            self._weights = numpy.full(_triangle_size(len(self._names)), numpy.nan, dtype=self._weights.dtype)
+            self._weights[high * (high - 1) // 2 + low] = weights
+
+    def set_weight(self, a, b, weight):
+        '''
+        :param a: id of the first edge
+        :param b: id of the second edge, other than the first
+        :param weight: weight of the vertex between them
+        '''
+        a, b = min(a, b), max(a, b)
+
+        if self._sparse:
+            self._append_pairs(a, b, weight)
+        else:
+            self._weights[b * (b - 1) // 2 + a] = weight
+
+    def set_weights(self, a, b, weights):
+        '''
+        :param a: id of the first edge
+        :param b: ids of the second edges, other than the first
+        :param weights: weights of the vertices between the first edge and each of the second ones
+        '''
+        low = numpy.minimum(a, b)
+        high = numpy.maximum(a, b)
+
+        if self._sparse:
+            self._append_pairs(low, high, weights)
+        else:
+            self._weights[high * (high - 1) // 2 + low] = weights
+
+    def get_neighbour_ids(self, edge_id):
+        '''
+        :param edge_id: id of the edge
+        :return: ids of the neighbours of the edge, ascending, and their weights
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        '''
+        if self._sparse:
+            offsets, ids, weights = self._get_index()
+            start, stop = offsets[edge_id:edge_id + 2].tolist()
+
+            return ids[start:stop], weights[start:stop]
+
+        start = edge_id * (edge_id - 1) // 2
+        after = numpy.arange(edge_id + 1, len(self._names), dtype=numpy.int64)
+
+        ids = numpy.concatenate([numpy.arange(edge_id, dtype=numpy.int64), after])
+        weights = numpy.concatenate([self._weights[start:start + edge_id],
+                                     self._weights[after * (after - 1) // 2 + edge_id]])
+
+        present = ~numpy.isnan(weights)
+        return ids[present], weights[present]
+
+    def has_neighbours(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: whether the edge is in the graph. its neighbours could still be empty
+        :rtype: bool
+        '''
+        return edge in self._ids
+
+    def get_neighbours(self, edge):
+        '''
+        :param edge: name of the edge
+        :return: all vertices which come out of the edge, where [edge_2] = weight of the vertex (edge, edge_2)
+        :rtype: dict(str, float)
+        '''
+        ids, weights = self.get_neighbour_ids(self._ids[edge])
+        return {self._names[i]: weight for i, weight in zip(ids.tolist(), weights.tolist())}
+
+    def get_weight(self, edge, neighbour):
+        '''
+        :param edge: name of the edge
+        :param neighbour: name of the edge the vertex goes into
+        :return: weight of the vertex between them, or None if there's no such vertex
+        :rtype: float
+        '''
+        a = self._ids[edge]
+        b = self._ids.get(neighbour)
+        if b is None or a == b:
+            return None
+
+        if self._sparse:
+            # the neighbours of each edge are indexed by id
+            offsets, ids, weights = self._get_index()
+            start, stop = offsets[a:a + 2].tolist()
+            position = start + numpy.searchsorted(ids[start:stop], b)
+
+            return weights[position].item() if position < stop and ids[position] == b else None
+
+        a, b = min(a, b), max(a, b)
+        weight = self._weights[b * (b - 1) // 2 + a]
+
+        return None if numpy.isnan(weight) else weight.item()
+
+    def get_sorted_neighbours(self, edge, limit=None):
+        '''
+        :param edge: name of the edge
+        :param limit: return at most <limit> neighbours. optional
+        :return: neighbours as sorted list of tuples (name, score). equal weights are ordered by id
+        '''
+        ids, weights = self.get_neighbour_ids(self._ids[edge])
+        order = numpy.argsort(weights, kind='stable')[:limit]
+
+        return [(self._names[i], weight) for i, weight in zip(ids[order].tolist(), weights[order].tolist())]
+
+    def iter_neighbours(self):
+        '''
+        :return: iterator over (edge, neighbours) for all edges, by id
+        '''
+        for name in self._names:
+            yield name, self.get_neighbours(name)
+
+    def iter_neighbour_ids(self, start=0, stop=None):
+        '''
+        :param start: id of the first edge to go over. optional
+        :param stop: id after the last edge to go over. all edges from the first one if not given. optional
+        :return: iterator over (edge id, ids of neighbours, weights) for the edges in range
+        '''
+        for edge_id in range(start, len(self._names) if stop is None else min(stop, len(self._names))):
+            yield (edge_id,) + self.get_neighbour_ids(edge_id)
+
+    def _add_name(self, edge):
+        edge_id = self._ids.get(edge)
+
+        if edge_id is None:
+            edge_id = self._ids[edge] = len(self._names)
+            self._names.append(edge)
+
+        return edge_id
+
+    def _append_pairs(self, low, high, weights):
+        '''
+        Appends pairs to the list of a sparse store, growing it geometrically. A pair that's set again replaces its
+        previous weight once the neighbours are indexed.
+        '''
+        low = numpy.atleast_1d(low)
+        size = self._amount_of_pairs + len(low)
+
+        if size > len(self._pairs):
+            pairs = numpy.zeros(max(size, 2 * len(self._pairs)), dtype=self._pairs.dtype)
+            pairs[:self._amount_of_pairs] = self._pairs[:self._amount_of_pairs]
+            self._pairs = pairs
+
+        appended = self._pairs[self._amount_of_pairs:size]
+        appended['low'] = low
+        appended['high'] = high
+        appended['weight'] = weights
+
+        self._amount_of_pairs = size
+        self._index = None
+
+    def _get_pairs(self):
+        '''
+        :return: ids of the first and second edge of each pair that's kept, where first < second, and its weight,
+                 ordered by their position in the packed triangle
+        :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        '''
+        if not self._sparse:
+            positions = numpy.flatnonzero(~numpy.isnan(self.weights))
+
+            # the second edge of a position is the last one whose vertices start at or before it
+            starts = numpy.arange(len(self._names), dtype=numpy.int64)
+            starts = starts * (starts - 1) // 2
+            high = numpy.searchsorted(starts, positions, side='right') - 1
+
+            return positions - starts[high], high, self.weights[positions]
+
+        pairs = self._pairs[:self._amount_of_pairs]
+        low = pairs['low'].astype(numpy.int64)
+        high = pairs['high'].astype(numpy.int64)
+
+        # the last weight that was set for a pair is the one that's kept
+        positions = high * (high - 1) // 2 + low
+        order = numpy.argsort(positions, kind='stable')
+        last = numpy.ones(len(order), dtype=bool)
+        last[:-1] = positions[order][1:] != positions[order][:-1]
+
+        order = order[last]
+        order = order[~numpy.isnan(pairs['weight'][order])]
+
+        return low[order], high[order], pairs['weight'][order]
+
+    def _get_index(self):
+        '''
+        :return: neighbours of all edges of a sparse store in CSR layout, by id, as offsets, ids and weights. built on
+                 first use after the store is changed
+        :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        '''
+        if self._index is None:
+            low, high, weights = self._get_pairs()
+
+            # each pair is a vertex of both of its edges
+            sources = numpy.concatenate([low, high])
+            targets = numpy.concatenate([high, low])
+            order = numpy.lexsort((targets, sources))
+
+            offsets = numpy.zeros(len(self._names) + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(sources, minlength=len(self._names)), out=offsets[1:])
+
+            self._index = (offsets, targets[order], numpy.tile(weights, 2)[order])
+
+        return self._index
+
+    def _reserve(self, size):
+        '''
+        Makes room for a triangle of the given size, growing the weights geometrically. Weights that were read from a
+        file are copied on the first write.
+        '''
+        if size <= len(self._weights):
+            if self._weights.flags.writeable:
+                return
+
+            capacity = len(self._weights)
+        else:
+            capacity = max(size, 2 * len(self._weights))
+
+        weights = numpy.full(capacity, numpy.nan, dtype=self._weights.dtype)
+        weights[:len(self._weights)] = self._weights
+        self._weights = weights
+
+
+def _pair_dtype(weights_dtype):
+    return numpy.dtype([('low', numpy.int32), ('high', numpy.int32), ('weight', weights_dtype)])
+
+
+def _triangle_size(amount_of_edges):
+    return amount_of_edges * (amount_of_edges - 1) // 2
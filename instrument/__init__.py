@@ -0,0 +1,359 @@
+'''
+Instrumentation of the tools: how long each stage takes, how many items it processes, and how much memory is used.
+
+Instrumentation is off unless a session is started with `enable`, and costs next to nothing while it's off. Code marks
+its stages with `stage`, and hot paths that run too many times to trace each run accumulate their time with
+`accumulator` instead. A session is written as a JSON report, and as a trace in the Chrome trace event format, which
+could be opened with chrome://tracing or https://ui.perfetto.dev.
+
+CLIs add the --profile flags with `add_arguments`, and call `start` and `finish` around their work.
+'''
+
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# peak memory usage is only known on platforms that have the resource module, which windows does not
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# args of stages that count processed items, whose rates are reported
+RATE_ARGS = ('rows', 'pairs', 'edges', 'vertices', 'queries', 'groups')
+
+# the active session, or None if instrumentation is off
+_session = None
+
+
+class Session(object):
+    '''
+    Records the stages, counters and accumulated timers of a single run.
+    '''
+
+    def __init__(self, memory=False, profile=False):
+        '''
+        :param memory: whether to trace allocations with tracemalloc. optional
+        :param profile: whether to profile python functions with cProfile. optional
+        '''
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._memory = memory
+
+        self.events = []
+        self.counters = collections.Counter()
+        self.accumulated = collections.OrderedDict()
+        self.allocations = None
+        self.final_memory = None
+
+        if memory:
+            tracemalloc.start()
+
+        self.profiler = cProfile.Profile() if profile else None
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def close(self):
+        '''
+        Stops tracing allocations and profiling.
+        '''
+        if self.profiler is not None:
+            self.profiler.disable()
+
+        self.final_memory = self.memory()
+
+        if self._memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            self.allocations = [{'location': str(statistic.traceback), 'size_mb': statistic.size / 1024.0 ** 2,
+                                 'count': statistic.count}
+                                for statistic in snapshot.statistics('lineno')[:20]]
+            tracemalloc.stop()
+
+    def now(self):
+        '''
+        :return: seconds since the session started
+        :rtype: float
+        '''
+        return time.perf_counter() - self._origin
+
+    def memory(self):
+        '''
+        :return: snapshot of the memory usage of the process, in megabytes
+        :rtype: dict
+        '''
+        snapshot = {}
+
+        rss_peak_mb = peak_rss_mb()
+        if rss_peak_mb is not None:
+            snapshot['rss_peak_mb'] = rss_peak_mb
+
+        if self._memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot['allocated_mb'] = current / 1024.0 ** 2
+            snapshot['allocated_peak_mb'] = peak / 1024.0 ** 2
+
+        return snapshot
+
+    def record(self, name, start, duration, args):
+        with self._lock:
+            self.events.append({'name': name, 'start': start, 'duration': duration, 'pid': os.getpid(),
+                                'tid': threading.get_ident(), 'args': args, 'memory': self.memory()})
+
+    def accumulate(self, name, duration):
+        with self._lock:
+            total = self.accumulated.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            total['calls'] += 1
+            total['seconds'] += duration
+
+    def report(self, top=30):
+        '''
+        :param top: amount of python functions to report, if they were profiled. optional
+        :return: the stages, aggregated by name with the rates of their items, counters, accumulated timers, memory
+                 usage and profiled functions
+        :rtype: dict
+        '''
+        stages = collections.OrderedDict()
+
+        for event in self.events:
+            stage = stages.setdefault(event['name'], {'calls': 0, 'seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += event['duration']
+
+            for arg in RATE_ARGS:
+                if isinstance(event['args'].get(arg), (int, float)):
+                    stage[arg] = stage.get(arg, 0) + event['args'][arg]
+
+        for stage in stages.values():
+            for arg in RATE_ARGS:
+                if arg in stage and stage['seconds'] > 0:
+                    stage['{0}_per_second'.format(arg)] = stage[arg] / stage['seconds']
+
+        report = {'duration': self.now(),
+                  'argv': sys.argv,
+                  'stages': stages,
+                  'events': self.events,
+                  'counters': dict(self.counters),
+                  'accumulated': self.accumulated,
+                  'memory': self.final_memory or self.memory()}
+
+        if self.allocations is not None:
+            report['allocations'] = self.allocations
+
+        if self.profiler is not None:
+            report['functions'] = _top_functions(self.profiler, top)
+
+        return report
+
+    def trace(self):
+        '''
+        :return: the stages as complete events, and memory snapshots as counter events, in the chrome trace format
+        :rtype: dict
+        '''
+        events = []
+
+        for event in self.events:
+            events.append({'name': event['name'], 'cat': event['name'].split('.')[0], 'ph': 'X',
+                           'ts': event['start'] * 1e6, 'dur': event['duration'] * 1e6,
+                           'pid': event['pid'], 'tid': event['tid'], 'args': event['args']})
+            events.append({'name': 'memory', 'ph': 'C', 'ts': (event['start'] + event['duration']) * 1e6,
+                           'pid': event['pid'], 'args': event['memory']})
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, prefix):
+        '''
+        Writes the report as <prefix>.json, the trace as <prefix>.trace.json, and the profiled functions, if any, as
+        <prefix>.prof for pstats.
+
+        :param prefix: prefix of the files' names
+        '''
+        with open('{0}.json'.format(prefix), 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+
+        with open('{0}.trace.json'.format(prefix), 'w') as f:
+            json.dump(self.trace(), f, default=str)
+
+        if self.profiler is not None:
+            self.profiler.dump_stats('{0}.prof'.format(prefix))
+
+
+class _Accumulator(object):
+    '''
+    Accumulates the time spent within it into the active session.
+    '''
+
+    def __init__(self, session, name):
+        self._session = session
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._session.accumulate(self._name, time.perf_counter() - self._start)
+
+
+class _NullAccumulator(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_ACCUMULATOR = _NullAccumulator()
+
+
+def enable(memory=False, profile=False):
+    '''
+    Starts a new session.
+
+    :param memory: whether to trace allocations with tracemalloc, which slows everything down. optional
+    :param profile: whether to profile python functions with cProfile. optional
+    :rtype: Session
+    '''
+    global _session
+
+    _session = Session(memory=memory, profile=profile)
+    return _session
+
+
+def disable():
+    '''
+    Ends the active session.
+
+    :return: the ended session, or None if there was none
+    :rtype: Session
+    '''
+    global _session
+
+    session, _session = _session, None
+    if session is not None:
+        session.close()
+
+    return session
+
+
+def is_enabled():
+    '''
+    :rtype: bool
+    '''
+    return _session is not None
+
+
+@contextlib.contextmanager
+def stage(name, **args):
+    '''
+    Records the stage that runs within the context. Yields the args of the stage, so items it processes could be
+    counted once they are known.
+
+    :param name: name of the stage, prefixed by its component, e.g. 'graph.save'
+    :param args: information about the stage. counts of RATE_ARGS are reported as rates. optional
+    '''
+    session = _session
+    if session is None:
+        yield args
+        return
+
+    start = session.now()
+    try:
+        yield args
+    finally:
+        session.record(name, start, session.now() - start, args)
+
+
+def accumulator(name):
+    '''
+    :param name: name of the timer
+    :return: context that adds the time spent within it to the timer, for code that runs too many times to record
+             each run as a stage
+    '''
+    session = _session
+    if session is None:
+        return _NULL_ACCUMULATOR
+
+    return _Accumulator(session, name)
+
+
+def count(name, amount=1):
+    '''
+    Adds to a counter.
+
+    :param name: name of the counter
+    :param amount: amount to add. optional
+    '''
+    session = _session
+    if session is not None:
+        session.counters[name] += amount
+
+
+def peak_rss_mb():
+    '''
+    :return: peak resident memory of the process so far, in megabytes, or None if the platform does not report it
+    :rtype: float
+    '''
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports kilobytes, while macos reports bytes
+    return peak / 1024.0 ** 2 if sys.platform == 'darwin' else peak / 1024.0
+
+
+def add_arguments(parser):
+    '''
+    Adds the --profile flags to a CLI's argument parser.
+    '''
+    parser.add_argument('--profile', help='write stage timings into <PROFILE>.json and a chrome trace into <PROFILE>.trace.json', metavar='PROFILE', required=False)
+    parser.add_argument('--profile-memory', help='also trace allocations with tracemalloc, which is slow', action='store_true')
+    parser.add_argument('--profile-python', help='also profile python functions with cProfile, into <PROFILE>.prof', action='store_true')
+
+
+def start(args):
+    '''
+    Starts a session if the CLI was run with --profile.
+
+    :param args: parsed arguments of the CLI
+    '''
+    if args.profile is not None:
+        enable(memory=args.profile_memory, profile=args.profile_python)
+
+
+def finish(args):
+    '''
+    Ends the session and writes it, if the CLI was run with --profile.
+
+    :param args: parsed arguments of the CLI
+    '''
+    session = disable()
+
+    if session is not None and args.profile is not None:
+        session.write(args.profile)
+
+        # printed to stderr, as the output of some tools may be piped
+        print('profile written into {0}.json and {0}.trace.json'.format(args.profile), file=sys.stderr)
+
+
+def _top_functions(profiler, top):
+    '''
+    :return: the functions that took the longest, including the functions they called
+    '''
+    stats = pstats.Stats(profiler).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+
+    return [{'function': '{0}:{1}({2})'.format(*function),
+             'calls': calls,
+             'seconds': total_time,
+             'cumulative_seconds': cumulative_time}
+            for function, (_, calls, total_time, cumulative_time, _) in functions]
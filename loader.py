@@ -1,11 +1,41 @@
-import sqlite3
+#!/usr/bin/env python
+#
+# The Loader Utility
+#
+# Loads an existing graph file into a SQLite database, so it could be queried without loading it into memory, and by
+# several processes at once:
+#   python loader.py graph.bin pantheon.sqlite
+#
+# Graphs could also be generated straight into a database, by giving the generator an output with a database extension
+# (.sqlite, .sqlite3 or .db). Any tool that loads graphs loads databases as well. see `graph/sqlite.py` for the schema.
+#
+
+import argparse
+
+import graph
+import instrument
 
 
 if __name__ == '__main__':
-    path = 'pantheon.sqlite'
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', help='graph file to load')
+    parser.add_argument('output', help='database to load the graph into', nargs='?', default='pantheon.sqlite')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    if not graph.sqlite.is_database_filename(args.output):
+        parser.error('output must have one of the extensions {0}'.format(', '.join(graph.sqlite.EXTENSIONS)))
+
+    instrument.start(args)
+
+    graph = graph.Graph()
+
+    print('loading graph from disk...')
+    graph.load(args.input)
+
+    print('writing database...')
+    graph.save(args.output)
+
+    instrument.finish(args)
 
-    conn = sqlite3.connect(path)
-    conn.execute('CREATE TABLE people (name VARCHAR(80), )')
-    conn.execute(
-        'CREATE TABLE pair_p (movie_id_1 INT, movie_id_2 INT, cost FLOAT, PRIMARY KEY (movie_id_1, movie_id_2))')
-    conn.commit()
+    print('done')
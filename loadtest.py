@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# The Load Test Utility
+#
+# Sends queries to a running server (see server.py) over concurrent connections, and reports how many requests per
+# second it answers and at which latency.
+#
+# Queries are either read from a file, in the explorer's batch format, or generated at random over the names of a
+# graph file.
+#
+# example: python loadtest.py -g graph.bin -n 10000 -c 32
+#
+
+import argparse
+import asyncio
+import json
+
+import graph
+import query
+import query.batch
+from service import loadtest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', help='host of the server', default='127.0.0.1')
+    parser.add_argument('-p', '--port', help='port of the server', type=int, default=8080)
+    parser.add_argument('-g', '--graph', help='graph file to generate random queries over its names', required=False)
+    parser.add_argument('-q', '--queries', help='JSONL file of queries to send', required=False)
+    parser.add_argument('-n', '--requests', help='amount of requests to send', type=int, default=10000)
+    parser.add_argument('-c', '--concurrency', help='amount of concurrent connections', type=int, default=16)
+    parser.add_argument('-o', '--output', help='JSON file to write the summary into', required=False)
+    args = parser.parse_args()
+
+    if args.queries is not None:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [query.parse_line(line) for _, line in query.batch.read_lines(f)]
+
+        # the queries are repeated until there are enough of them
+        requests = [queries[i % len(queries)] for i in range(args.requests)]
+    elif args.graph is not None:
+        names_graph = graph.Graph()
+        names_graph.load(args.graph)
+        requests = loadtest.generate_requests(sorted(names_graph.edges), args.requests)
+    else:
+        parser.error('either --graph or --queries is required')
+
+    print('sending {0} requests over {1} connections...'.format(len(requests), args.concurrency))
+    summary = asyncio.run(loadtest.run(args.host, args.port, requests, concurrency=args.concurrency))
+
+    print(json.dumps(summary, indent=2))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,120 @@
+'''
+Backends that look titles up on a wiki.
+
+A backend implements `lookup(title)`, which returns whether there's a page with the given title, and raises an error
+if it could not find out, e.g. when the wiki can't be reached. Errors are retried, while answers are cached (see
+`name_normalizer.pipeline`), so a backend should only return False when there's definitely no such page. Its `name`
+keys its answers in the cache.
+'''
+
+import threading
+import time
+
+
+class WikiquoteBackend(object):
+    '''
+    Looks titles up on wikiquote.
+    '''
+
+    name = 'wikiquote'
+
+    def __init__(self):
+        # imported here, so other backends could be used without it
+        import wikiquote
+        self._wikiquote = wikiquote
+
+    def lookup(self, title):
+        try:
+            self._wikiquote.quotes(title)
+        except Exception as e:
+            if e.__class__.__name__ == 'NoSuchPageException':
+                return False
+
+            # pages that only list other pages
+            if e.__class__.__name__ == 'DisambiguationPageException':
+                return False
+
+            raise
+
+        return True
+
+
+class WikipediaBackend(object):
+    '''
+    Looks titles up on wikipedia.
+    '''
+
+    name = 'wikipedia'
+
+    def __init__(self):
+        # imported here, so other backends could be used without it
+        import wikipedia
+        self._wikipedia = wikipedia
+
+    def lookup(self, title):
+        try:
+            self._wikipedia.page(title)
+        except (self._wikipedia.exceptions.PageError, self._wikipedia.exceptions.DisambiguationError):
+            return False
+
+        return True
+
+
+class FakeWikiBackend(object):
+    '''
+    Looks titles up in a local list of titles, e.g. to test the pipeline without reaching an actual wiki.
+    '''
+
+    def __init__(self, titles, name='fake', latency=0.0, failures=None):
+        '''
+        :param titles: titles of the pages of the wiki
+        :param name: name of the wiki, which keys its answers in the cache. optional
+        :param latency: seconds each lookup takes. optional
+        :param failures: titles whose first lookup fails, as if the wiki could not be reached. optional
+        '''
+        self.name = name
+        self._titles = set(titles)
+        self._latency = latency
+        self._failures = set(failures or [])
+        self._lock = threading.Lock()
+        self.lookups = 0
+
+    @classmethod
+    def from_file(cls, filename, **kwargs):
+        '''
+        :param filename: text file with a title per line
+        :rtype: FakeWikiBackend
+        '''
+        with open(filename, 'r', encoding='utf8') as f:
+            return cls((line.strip() for line in f if line.strip()), **kwargs)
+
+    def lookup(self, title):
+        with self._lock:
+            self.lookups += 1
+            fails = title in self._failures
+            self._failures.discard(title)
+
+        if self._latency:
+            time.sleep(self._latency)
+
+        if fails:
+            raise IOError('{0} is unreachable'.format(self.name))
+
+        return title in self._titles
+
+
+def create(name):
+    '''
+    :param name: 'wikiquote', 'wikipedia', or 'fake:<file with a title per line>'
+    :return: backend of the given name
+    '''
+    if name == 'wikiquote':
+        return WikiquoteBackend()
+
+    if name == 'wikipedia':
+        return WikipediaBackend()
+
+    if name.startswith('fake:'):
+        return FakeWikiBackend.from_file(name[len('fake:'):])
+
+    raise Exception('Unknown backend "{0}"'.format(name))
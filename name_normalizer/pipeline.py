@@ -0,0 +1,326 @@
+'''
+Normalizes the names in a CSV file by looking them up on a wiki, with a bounded pool of threads.
+
+Each row has candidate titles, which are looked up in order. The first one that has a page is appended to the row, or
+an empty value if none has. Lookups are:
+    - cached on disk, keyed by backend and title, so running again only looks up titles that were never answered
+    - rate limited, and retried with a growing delay when they fail
+
+Rows are written to the output in their order, as soon as they are ready. A checkpoint of the rows that were written
+is kept next to the output, so an interrupted run resumes where it stopped.
+'''
+
+import collections
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+
+class LookupFailure(Exception):
+    '''
+    Raised when a title could not be looked up, even after retrying.
+    '''
+
+
+class ResponseCache(object):
+    '''
+    Answers of lookups, kept in a JSONL file that's appended to as answers arrive.
+    '''
+
+    def __init__(self, filename=None):
+        '''
+        :param filename: file to keep answers in. answers are only kept in memory if not given. optional
+        '''
+        self._answers = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+        if filename is None:
+            return
+
+        ends_with_newline = True
+
+        if os.path.exists(filename):
+            with open(filename, 'r', encoding='utf8') as f:
+                for line in f:
+                    ends_with_newline = line.endswith('\n')
+
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line may have been cut short by a crash
+                        continue
+
+                    self._answers[(entry['backend'], entry['title'])] = entry['found']
+
+        self._file = open(filename, 'a', encoding='utf8')
+        if not ends_with_newline:
+            self._file.write('\n')
+
+    def __len__(self):
+        return len(self._answers)
+
+    def get(self, backend, title):
+        '''
+        :param backend: name of the backend
+        :param title: title that was looked up
+        :return: whether there's a page with the title, or None if it was never answered
+        :rtype: bool
+        '''
+        return self._answers.get((backend, title))
+
+    def put(self, backend, title, found):
+        '''
+        :param backend: name of the backend
+        :param title: title that was looked up
+        :param found: whether there's a page with the title
+        '''
+        with self._lock:
+            self._answers[(backend, title)] = found
+
+            if self._file is not None:
+                self._file.write(json.dumps({'backend': backend, 'title': title, 'found': found}) + '\n')
+                self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RateLimiter(object):
+    '''
+    Spaces calls to `wait` evenly, across all threads.
+    '''
+
+    def __init__(self, rate=None):
+        '''
+        :param rate: maximal calls per second. unlimited if not given. optional
+        '''
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self._interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+
+        if start > now:
+            time.sleep(start - now)
+
+
+class _Resolver(object):
+    '''
+    Finds the first candidate title of a row that has a page.
+    '''
+
+    def __init__(self, backend, cache, limiter, retries, backoff):
+        self._backend = backend
+        self._cache = cache
+        self._limiter = limiter
+        self._retries = retries
+        self._backoff = backoff
+        self._lock = threading.Lock()
+
+        self.counters = collections.Counter()
+
+    def resolve(self, titles):
+        '''
+        :param titles: candidate titles, in order
+        :return: the first title that has a page, or None if there's none
+        :rtype: str
+        '''
+        for title in titles:
+            if title and self.lookup(title):
+                return title
+
+        return None
+
+    def lookup(self, title):
+        '''
+        :return: whether there's a page with the title
+        :rtype: bool
+        '''
+        found = self._cache.get(self._backend.name, title)
+        if found is not None:
+            self._count('cache_hits')
+            return found
+
+        for attempt in range(self._retries + 1):
+            if attempt > 0:
+                time.sleep(self._backoff * 2 ** (attempt - 1))
+
+            self._limiter.wait()
+            self._count('lookups')
+
+            try:
+                found = self._backend.lookup(title)
+            except Exception as e:
+                self._count('errors')
+                error = e
+                continue
+
+            self._cache.put(self._backend.name, title, found)
+            return found
+
+        raise LookupFailure('{0}: {1}'.format(title, error))
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+
+def normalize(input_filename, output_filename, column_name, candidates, backend, cache=None, workers=8, rate=None,
+              retries=3, backoff=1.0, checkpoint_interval=100, on_progress=None):
+    '''
+    Appends the first candidate title of each row that has a page as a new column, and writes the rows into the output.
+
+    :param input_filename: csv file to read rows from
+    :param output_filename: csv file to write rows into
+    :param column_name: title of the new column
+    :param candidates: function that gets a row as a list of values, and returns the titles to look up, in order
+    :param backend: backend to look titles up with (see `name_normalizer.backends`)
+    :param cache: cache of answers. answers are not kept between runs if not given. optional
+    :type cache: ResponseCache
+    :param workers: amount of lookups made at once. optional
+    :param rate: maximal lookups per second. unlimited if not given. optional
+    :param retries: times a failed lookup is retried. optional
+    :param backoff: seconds to wait before the first retry, which doubles on each retry. optional
+    :param checkpoint_interval: amount of rows written between checkpoints. optional
+    :param on_progress: callback to report progress to. gets amount of rows written as parameter. optional
+    :type on_progress: callable(int)
+    :return: summary: amount of rows, resumed rows, found names, failed rows, lookups, cache hits and errors
+    :rtype: dict
+    '''
+    if cache is None:
+        cache = ResponseCache()
+
+    resolver = _Resolver(backend, cache, RateLimiter(rate), retries, backoff)
+
+    checkpoint_filename = '{0}.checkpoint'.format(output_filename)
+    stat = os.stat(input_filename)
+    source = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'column': column_name}
+
+    checkpoint = _load_checkpoint(checkpoint_filename, source, output_filename)
+    summary = {'rows': 0, 'resumed': checkpoint['rows'] if checkpoint else 0, 'found': 0, 'failed': 0}
+
+    with open(input_filename, 'r', encoding='utf8') as input_file:
+        reader = csv.reader(input_file, delimiter=',')
+        header = next(reader)
+
+        if checkpoint is not None:
+            output_file = open(output_filename, 'r+b')
+            output_file.truncate(checkpoint['offset'])
+            output_file.seek(checkpoint['offset'])
+
+            for _ in range(checkpoint['rows']):
+                next(reader)
+        else:
+            output_file = open(output_filename, 'wb')
+            output_file.write(_encode_rows([header + [column_name]]))
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        # rows are resolved ahead of the one that's written next, but not too far ahead, so memory stays bounded
+        pending = collections.deque()
+        ready = []
+        written = summary['resumed']
+
+        def write_ready():
+            output_file.write(_encode_rows(ready))
+            output_file.flush()
+            del ready[:]
+
+            _save_checkpoint(checkpoint_filename, source, written, output_file.tell())
+
+        def write_next():
+            nonlocal written
+
+            row, future = pending.popleft()
+
+            try:
+                title = future.result()
+            except LookupFailure as e:
+                print(e)
+                title = None
+                summary['failed'] += 1
+
+            ready.append(row + [title or ''])
+            written += 1
+            summary['rows'] += 1
+            summary['found'] += title is not None
+
+            if len(ready) >= checkpoint_interval:
+                write_ready()
+
+            if callable(on_progress):
+                on_progress(written)
+
+        try:
+            for row in reader:
+                pending.append((row, executor.submit(resolver.resolve, candidates(row))))
+
+                if len(pending) >= 4 * workers:
+                    write_next()
+
+            while pending:
+                write_next()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+            # rows that were resolved are kept, so an interrupted run resumes after them
+            write_ready()
+            output_file.close()
+
+    # the output is complete. running again starts over, with all answers already cached
+    os.remove(checkpoint_filename)
+
+    summary.update(resolver.counters)
+    return summary
+
+
+def _encode_rows(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf8')
+
+
+def _load_checkpoint(checkpoint_filename, source, output_filename):
+    '''
+    :return: the checkpoint of a previous run over the same input, or None if there's none
+    '''
+    try:
+        with open(checkpoint_filename, 'r') as f:
+            checkpoint = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if checkpoint.get('source') != source:
+        return None
+
+    if not os.path.exists(output_filename) or os.path.getsize(output_filename) < checkpoint['offset']:
+        return None
+
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_filename, source, rows, offset):
+    '''
+    Records that the first <rows> rows were written, up to <offset> in the output. Written aside and then moved into
+    place, so a crash never leaves a partial checkpoint.
+    '''
+    temporary_filename = '{0}.tmp'.format(checkpoint_filename)
+
+    with open(temporary_filename, 'w') as f:
+        json.dump({'source': source, 'rows': rows, 'offset': offset}, f)
+
+    os.replace(temporary_filename, checkpoint_filename)
@@ -1,32 +1,21 @@
-import wikipedia
-
-import wikiquotes_names
+from name_normalizer import backends
+from name_normalizer import wikiquotes_names
 
 
 class WikiNameNormalizer(wikiquotes_names.NameNormalizer):
+    '''
+    Appends the name of each person on wikipedia, if there's a page for them, as a new column. Persons are looked up
+    by their original name, and then by their wikiquote name.
+    '''
 
-    def __init__(self, base_csv):
-        super(WikiNameNormalizer, self).__init__(base_csv)
+    output_file_name = 'pantheon_wikiquotes_wikipedia.csv'
+    row_name = 'wikipedia name'
 
-    def _start_polling(self):
-        self._load_persons_and_locations('pantheon_wikiquotes_wikipedia.csv', 'wikipedia name')
+    def _create_backend(self):
+        return backends.WikipediaBackend()
 
-    def _is_in_site(self, row):
+    def _get_candidates(self, row):
         original_name = row[16]
-        wikiquotes_name = row[23]
-        try:
-            result = wikipedia.page(original_name)
-            return original_name
-        except Exception as e:
-            print('original name - {0}: {1}'.format(original_name, e))
-
-        try:
-            result = wikipedia.page(wikiquotes_name)
-            return wikiquotes_name
-        except Exception as e:
-            print('{0}: {1}'.format(wikiquotes_name, e))
-
-        return False
+        wikiquotes_name = row[23] if len(row) > 23 else ''
 
-if __name__ == '__main__':
-    normalizer = WikiNameNormalizer('../pantheon_wikiquotes.csv')
+        return [original_name, wikiquotes_name]
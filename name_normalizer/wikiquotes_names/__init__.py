@@ -1,45 +1,57 @@
-import wikiquote
-import csv
+from name_normalizer import backends
+from name_normalizer import pipeline
 
 
 class NameNormalizer(object):
-
-    def __init__(self, base_csv):
+    '''
+    Appends the name of each person on wikiquote, if there's a page for them, as a new column.
+
+    Names are looked up by a pool of threads, cached on disk and written as they are found (see
+    `name_normalizer.pipeline`).
+    '''
+
+    output_file_name = 'pantheon_wikiquotes.csv'
+    row_name = 'wikiquotes name'
+
+    def __init__(self, base_csv, output_file_name=None, backend=None, cache_file=None, workers=8, rate=None,
+                 on_progress=None):
+        '''
+        :param base_csv: csv file of the people
+        :param output_file_name: csv file to write into. optional
+        :param backend: backend to look names up with. the actual wiki if not given. optional
+        :param cache_file: file to cache answers of lookups in. <output>.lookups.jsonl if not given. optional
+        :param workers: amount of lookups made at once. optional
+        :param rate: maximal lookups per second. optional
+        :param on_progress: callback to report progress to. gets amount of rows written as parameter. optional
+        '''
         self._csv_file_path = base_csv
-        self._start_polling()
+        self._output_file_name = output_file_name or self.output_file_name
+        self._backend = backend or self._create_backend()
+        self._cache_file = cache_file or '{0}.lookups.jsonl'.format(self._output_file_name)
+        self._workers = workers
+        self._rate = rate
+        self._on_progress = on_progress
+
+        self.summary = self._start_polling()
+
+    def _create_backend(self):
+        return backends.WikiquoteBackend()
 
     def _start_polling(self):
-        self._load_persons_and_locations('pantheon_wikiquotes.csv', 'wikiquotes name')
+        return self._load_persons_and_locations(self._output_file_name, self.row_name)
 
     def _load_persons_and_locations(self, output_file_name, row_name):
-        with open(self._csv_file_path, 'r', encoding='utf8') as input_file:
-            with open('../{0}'.format(output_file_name), 'w', encoding='utf8') as output_file:
-                reader = csv.reader(input_file, delimiter=',')
-
-                all_rows = []
-                row = next(reader)
-                row.append(row_name)
-                all_rows.append(row)
-
-                for row in reader:
-                    result = self._is_in_site(row)
-                    if result is not False:
-                        row.append(result)
-                    all_rows.append(row)
-
-                writer = csv.writer(output_file)
-                writer.writerows(all_rows)
-
-    def _is_in_site(self, row):
-        name = row[16]
-        try:
-            wikiquote.quotes(name)
-        except Exception as e:
-            if e.__class__.__name__ != 'NoSuchPageException':
-                print('{0}: {1}'.format(name, e))
-            return False
-        return name
-
+        cache = pipeline.ResponseCache(self._cache_file)
 
-if __name__ == '__main__':
-    normalizer = NameNormalizer('../pantheon.csv')
+        try:
+            return pipeline.normalize(self._csv_file_path, output_file_name, row_name, self._get_candidates,
+                                      self._backend, cache=cache, workers=self._workers, rate=self._rate,
+                                      on_progress=self._on_progress)
+        finally:
+            cache.close()
+
+    def _get_candidates(self, row):
+        '''
+        :return: names to look the person up by, in order
+        '''
+        return [row[16]]
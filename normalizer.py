@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#
+# The Normalizer Utility
+#
+# Looks the people of the dataset up on wikiquote, and then on wikipedia, and appends the names of their pages as a new
+# column, so they could be matched with their quotes:
+#   python normalizer.py wikiquote name_normalizer/pantheon.csv pantheon_wikiquotes.csv
+#   python normalizer.py wikipedia pantheon_wikiquotes.csv pantheon_wikiquotes_wikipedia.csv
+#
+# Lookups are made by a pool of -w threads, at most --rate per second, and answers are cached in a file next to the
+# output, so running again only looks up names that were never answered. Rows are written as they are ready, and an
+# interrupted run resumes where it stopped.
+#
+# Names could also be looked up in a local list of titles rather than on the actual wiki, with --backend fake:<file>
+#
+
+import argparse
+import json
+
+import progressbar
+
+from name_normalizer import backends
+from name_normalizer import wikipedia_names
+from name_normalizer import wikiquotes_names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('site', help='wiki to look names up on', choices=['wikiquote', 'wikipedia'])
+    parser.add_argument('input', help='csv file of the people')
+    parser.add_argument('output', help='csv file to write into')
+    parser.add_argument('-w', '--workers', help='amount of lookups made at once', type=int, default=8)
+    parser.add_argument('-r', '--rate', help='maximal lookups per second', type=float, required=False)
+    parser.add_argument('-c', '--cache', help='file to cache answers in. <output>.lookups.jsonl if not given', required=False)
+    parser.add_argument('-b', '--backend', help='backend to look names up with, e.g. fake:<file with a title per line>. the site itself if not given', required=False)
+    args = parser.parse_args()
+
+    normalizer_type = wikiquotes_names.NameNormalizer if args.site == 'wikiquote' else wikipedia_names.WikiNameNormalizer
+    backend = backends.create(args.backend) if args.backend is not None else None
+
+    bar = progressbar.ProgressBar(max_value=progressbar.UnknownLength)
+
+    normalizer = normalizer_type(args.input,
+                                 output_file_name=args.output,
+                                 backend=backend,
+                                 cache_file=args.cache,
+                                 workers=args.workers,
+                                 rate=args.rate,
+                                 on_progress=bar.update)
+
+    bar.finish()
+
+    print(json.dumps(normalizer.summary, indent=2))
@@ -0,0 +1,147 @@
+'''
+Queries over a graph, as made by the explorer.
+
+A query is a dict with a 'type' of:
+    neighbours - closest neighbours of a 'name', at most 'limit' of them
+    reverse - closest of the names that have a 'name' among their neighbours, at most 'limit' of them
+    mutual - closest neighbours of a 'name' that have it among their neighbours as well, at most 'limit' of them
+    search - names that start with or contain a 'query', or similar names if there are none, at most 'limit' of them
+    joint - joint neighbours of a group of 'names', at most 'group_size' of them, aggregated by 'mode'
+
+Neighbours and joint queries could also have 'weights', a weight vector to rank the neighbours by, out of the
+components of their weights, for graphs that keep them (see `graph.components`).
+
+Queries could also be written in the explorer's syntax: "<name>[:limit]", "~<string>" or "[<name>, ...<name>]".
+'''
+
+import json
+
+import instrument
+
+
+TYPES = ('neighbours', 'reverse', 'mutual', 'search', 'joint')
+
+DEFAULT_LIMIT = 10
+DEFAULT_GROUP_SIZE = 20
+
+
+def parse_text(text):
+    '''
+    :param text: query in the explorer's syntax
+    :return: the query
+    :rtype: dict
+    '''
+    text = text.strip()
+
+    if text.startswith('~'):
+        return {'type': 'search', 'query': text[1:]}
+
+    if text.startswith('[') and text.endswith(']'):
+        return {'type': 'joint', 'names': [word.strip() for word in text[1:-1].split(',')]}
+
+    # the name could be followed by the amount of neighbours to return
+    name, _, limit = text.rpartition(':')
+    if name and limit.strip().isdigit():
+        return {'type': 'neighbours', 'name': name, 'limit': int(limit)}
+
+    return {'type': 'neighbours', 'name': text, 'limit': DEFAULT_LIMIT}
+
+
+def parse_line(line):
+    '''
+    :param line: query as a JSON object, or in the explorer's syntax
+    :return: the query
+    :rtype: dict
+    '''
+    if not line.lstrip().startswith('{'):
+        return parse_text(line)
+
+    request = json.loads(line)
+
+    if request.get('type') not in TYPES:
+        raise Exception('Unknown query type "{0}"'.format(request.get('type')))
+
+    return request
+
+
+def answer(graph, request):
+    '''
+    :param graph: graph to query
+    :param request: the query
+    :type request: dict
+    :return: the answer, with 'results', or with an 'error' if the query failed
+    :rtype: dict
+    '''
+    with instrument.stage('query.{0}'.format(request['type']), queries=1):
+        return _answer(graph, request)
+
+
+def _answer(graph, request):
+    response = {'type': request['type']}
+    if 'id' in request:
+        response['id'] = request['id']
+
+    if request['type'] == 'search':
+        limit = request.get('limit')
+
+        # without a limit, all names that contain the string, or the closest similar ones if there are none
+        if limit is None:
+            response['results'] = graph.find_names(request['query'], limit=None) or graph.find_names(request['query'])
+        else:
+            response['results'] = graph.find_names(request['query'], limit=limit)
+
+    elif request['type'] == 'joint':
+        names = [graph.resolve_name(name) or name for name in request['names']]
+
+        try:
+            results = graph.get_joint_neighbours(names,
+                                                 group_size=request.get('group_size', DEFAULT_GROUP_SIZE),
+                                                 mode=request.get('mode', 'sum'),
+                                                 with_scores=True,
+                                                 weights=request.get('weights'))
+        except Exception as err:
+            response['error'] = str(err)
+        else:
+            response['names'] = names
+            response['results'] = [list(result) for result in results]
+
+    else:
+        name = graph.resolve_name(request['name'])
+
+        # an invalid weight vector should not be reported as a missing name
+        try:
+            _check_weights(graph, request.get('weights'))
+        except Exception as err:
+            response['error'] = str(err)
+            return response
+
+        limit = request.get('limit', DEFAULT_LIMIT)
+
+        try:
+            if request['type'] == 'reverse':
+                results = graph.get_reverse_neighbours(name, limit=limit)
+            elif request['type'] == 'mutual':
+                results = graph.get_mutual_neighbours(name, limit=limit)
+            else:
+                results = graph.get_sorted_neighbours(name, limit=limit, weights=request.get('weights'))
+        except Exception:
+            response['error'] = 'No entry named "{0}"'.format(request['name'])
+            response['suggestions'] = graph.find_names(request['name'], limit=5)
+        else:
+            response['name'] = name
+            response['results'] = [list(result) for result in results]
+
+    return response
+
+
+def _check_weights(graph, weights):
+    '''
+    Raises an error if the neighbours of the graph could not be ranked by the given weight vector.
+    '''
+    if weights is None:
+        return
+
+    if graph.component_model is None:
+        raise Exception('Graph keeps no components, so its neighbours could not be ranked by other weights')
+
+    graph.component_model.resolve(weights)
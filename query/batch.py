@@ -0,0 +1,114 @@
+'''
+Answers a stream of queries with a pool of worker processes.
+
+Each worker loads the graph on its own. Graphs in the binary format are mapped into memory rather than read, so all
+workers share the same pages of the graph file. Answers are written in the order of the queries, one JSON object per
+line, along with how long each query took to answer.
+'''
+
+import json
+import multiprocessing
+import time
+
+import numpy
+
+import graph
+import instrument
+import query
+
+
+# the graph of a worker process
+_worker_graph = None
+
+
+def _initialize_worker(graph_filename):
+    global _worker_graph
+
+    _worker_graph = graph.Graph()
+    _worker_graph.load(graph_filename)
+
+
+def _answer_line(item):
+    '''
+    :param item: tuple of (line number, line)
+    :return: the answer as a JSON line, whether it's an error, and how long it took to answer, in seconds
+    :rtype: tuple(str, bool, float)
+    '''
+    line_number, line = item
+    start = time.perf_counter()
+
+    try:
+        response = query.answer(_worker_graph, query.parse_line(line))
+    except Exception as err:
+        response = {'error': 'Invalid query: {0}'.format(err)}
+
+    latency = time.perf_counter() - start
+
+    response['line'] = line_number
+    response['latency_ms'] = latency * 1000
+
+    return json.dumps(response), 'error' in response, latency
+
+
+def read_lines(f):
+    '''
+    :param f: file to read queries from
+    :return: iterator over (line number, line) of all non-blank lines
+    '''
+    for line_number, line in enumerate(f, 1):
+        if line.strip():
+            yield line_number, line.rstrip('\n')
+
+
+def run(graph_filename, lines, output, workers=1, chunk_size=64):
+    '''
+    Answers queries, and writes the answers as they are ready.
+
+    :param graph_filename: file containing the graph
+    :param lines: iterator over (line number, line) of the queries, as returned by `read_lines`
+    :param output: file to write the answers into
+    :param workers: number of worker processes. if 1, queries are answered in this process. optional
+    :param chunk_size: amount of queries sent to a worker at once. optional
+    :return: summary of the run: amount of queries and errors, duration, throughput and latency percentiles
+    :rtype: dict
+    '''
+    start = time.perf_counter()
+
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_initialize_worker, initargs=(graph_filename,))
+        results = pool.imap(_answer_line, lines, chunksize=chunk_size)
+    else:
+        pool = None
+        _initialize_worker(graph_filename)
+        results = map(_answer_line, lines)
+
+    latencies = []
+    errors = 0
+
+    try:
+        with instrument.stage('query.batch', workers=workers) as stage:
+            for line, is_error, latency in results:
+                output.write(line)
+                output.write('\n')
+
+                latencies.append(latency)
+                errors += is_error
+
+            stage['queries'] = len(latencies)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    seconds = time.perf_counter() - start
+
+    summary = {'queries': len(latencies),
+               'errors': errors,
+               'workers': workers,
+               'seconds': seconds,
+               'throughput': len(latencies) / seconds if seconds > 0 else None}
+
+    if latencies:
+        p50, p95, p99 = numpy.percentile(numpy.array(latencies) * 1000, [50, 95, 99]).tolist()
+        summary['latency_ms'] = {'p50': p50, 'p95': p95, 'p99': p99, 'max': max(latencies) * 1000}
+
+    return summary
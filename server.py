@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+# The Server Utility
+#
+# Serves a graph over HTTP, with JSON answers, so it's loaded once and could be queried by any number of clients:
+#   GET /neighbours?name=Ariel Sharon&limit=20
+#   GET /search?query=sharon
+#   GET /joint?name=Ariel Sharon&name=Ehud Barak&group_size=10
+#   POST /query with a query as a JSON object, as in the explorer's batch mode
+#   GET /stats
+#   POST /reload, optionally with {"graph": "<filename>"}
+#
+# A newly generated graph is swapped in without downtime when /reload is requested, on SIGHUP, or, with --watch, once
+# the graph file changes. See `service/` for how queries are coalesced and batched.
+#
+# example: python server.py graph.bin -p 8080 --watch 5
+#
+
+import argparse
+import asyncio
+
+import instrument
+import service
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('graph', help='file containing the graph information')
+    parser.add_argument('--host', help='interface to listen on', default='127.0.0.1')
+    parser.add_argument('-p', '--port', help='port to listen on', type=int, default=8080)
+    parser.add_argument('--watch', help='seconds between checks of the graph file for changes', type=float, required=False)
+    parser.add_argument('--batch-window', help='milliseconds to collect small joint queries for', type=float, default=2.0)
+    parser.add_argument('--max-batch', help='maximal amount of small joint queries answered at once', type=int, default=32)
+    parser.add_argument('--cache-size', help='maximal amount of cached query results', type=int, default=1024)
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    instrument.start(args)
+
+    query_service = service.QueryService(args.graph,
+                                         batch_window=args.batch_window / 1000,
+                                         max_batch_size=args.max_batch,
+                                         cache_size=args.cache_size)
+
+    print('serving {0} on http://{1}:{2}'.format(args.graph, args.host, args.port))
+
+    try:
+        asyncio.run(service.serve(query_service, args.host, args.port, watch_interval=args.watch))
+    except KeyboardInterrupt:
+        pass
+
+    instrument.finish(args)
+
+    print('bye')
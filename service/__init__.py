@@ -0,0 +1,393 @@
+'''
+Local HTTP/JSON service over a graph, which is loaded once and shared by all requests.
+
+Endpoints:
+    GET /neighbours?name=<name>&limit=<n>
+    GET /reverse?name=<name>&limit=<n> - people that have the name among their neighbours
+    GET /mutual?name=<name>&limit=<n> - neighbours that have the name among their neighbours as well
+    GET /search?query=<string>&limit=<n>
+    GET /joint?name=<name>&name=<name>...&group_size=<n>&mode=<mode>
+    POST /query - a query as a JSON object, see `query`
+    GET /stats - counters of the service and of the graph's query cache
+    POST /reload - loads the graph file again, or {"graph": <filename>}, and swaps it in
+
+Queries are answered one at a time on a thread of their own, so the event loop keeps accepting requests meanwhile:
+    - identical queries that arrive while one of them is being answered are coalesced, and share its answer
+    - small joint queries are collected for a short while and answered together, as a single batch over the graph
+      they were queued with
+    - a new graph is loaded aside and swapped in once it's ready. queries that are already being answered finish over
+      the graph they started with, so no request fails or waits while the graph is reloaded
+'''
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import time
+
+import graph
+import query
+from service import http
+
+
+# joint queries of at most this many members, and at most this group size, are batched
+SMALL_JOINT_MEMBERS = 8
+SMALL_JOINT_GROUP_SIZE = 50
+
+
+class QueryService(object):
+    '''
+    Answers queries over a graph file, and swaps it when it's reloaded.
+    '''
+
+    def __init__(self, graph_filename, batch_window=0.002, max_batch_size=32, cache_size=1024):
+        '''
+        :param graph_filename: file containing the graph
+        :param batch_window: seconds to wait for more small joint queries before answering a batch. optional
+        :param max_batch_size: amount of small joint queries that are answered at once. optional
+        :param cache_size: maximal amount of cached query results of the graph. optional
+        '''
+        self._graph_filename = graph_filename
+        self._batch_window = batch_window
+        self._max_batch_size = max_batch_size
+        self._cache_size = cache_size
+
+        # queries are answered on a single thread, since a graph is not safe to query from several threads at once
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._loader = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        self._graph = None
+        self._generation = 0
+        self._source = None
+        self._in_flight = {}
+        self._pending = []
+        self._pending_graph = None
+        self._flush_handle = None
+        self._reload_lock = None
+
+        self._counters = {'requests': 0, 'queries': 0, 'coalesced': 0, 'batches': 0, 'batched_queries': 0,
+                          'errors': 0, 'reloads': 0}
+
+    def _load(self, graph_filename):
+        '''
+        :return: loaded graph, ready to be queried, and the identity of the file it was loaded from
+        '''
+        stat = os.stat(graph_filename)
+
+        loaded_graph = graph.Graph(cache_size=self._cache_size)
+        loaded_graph.load(graph_filename)
+
+        # built ahead, so the first queries over the new graph are not slower than the rest
+        loaded_graph.resolve_name('')
+
+        return loaded_graph, (graph_filename, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    async def start(self):
+        '''
+        Loads the graph.
+        '''
+        self._reload_lock = asyncio.Lock()
+        self._graph, self._source = await asyncio.get_running_loop().run_in_executor(self._loader, self._load,
+                                                                                     self._graph_filename)
+        self._generation = 1
+
+    async def reload(self, graph_filename=None):
+        '''
+        Loads a graph file aside, and swaps it in once it's loaded.
+
+        :param graph_filename: file to load. the current file if not given. optional
+        :return: whether the graph was swapped
+        :rtype: bool
+        '''
+        async with self._reload_lock:
+            graph_filename = graph_filename or self._graph_filename
+            loaded_graph, source = await asyncio.get_running_loop().run_in_executor(self._loader, self._load,
+                                                                                    graph_filename)
+
+            self._graph, self._source, self._graph_filename = loaded_graph, source, graph_filename
+            self._generation += 1
+            self._counters['reloads'] += 1
+
+            return True
+
+    async def watch(self, interval):
+        '''
+        Reloads the graph whenever its file is replaced or modified.
+
+        :param interval: seconds between checks of the file
+        '''
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                stat = os.stat(self._graph_filename)
+            except OSError:
+                continue
+
+            if (self._graph_filename, stat.st_ino, stat.st_size, stat.st_mtime_ns) != self._source:
+                try:
+                    await self.reload()
+                except Exception:
+
+                    # the file may still be being written. it's checked again on the next interval
+                    continue
+
+    @property
+    def stats(self):
+        '''
+        :return: counters of the service, and of the graph's query cache
+        :rtype: dict
+        '''
+        stats = dict(self._counters)
+        stats['graph'] = self._graph_filename
+        stats['generation'] = self._generation
+        stats['cache'] = self._graph.cache.stats
+        return stats
+
+    async def answer(self, request):
+        '''
+        Answers a query. Identical queries that are answered at the same time are only answered once.
+
+        :param request: the query, see `query`
+        :return: the answer
+        :rtype: dict
+        '''
+        self._counters['queries'] += 1
+
+        # answers over different graphs are never shared
+        key = (self._generation, json.dumps(request, sort_keys=True))
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._counters['coalesced'] += 1
+            return await asyncio.shield(future)
+
+        if _is_small_joint(request):
+            future = self._enqueue(request)
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, query.answer, self._graph, request)
+
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        return await asyncio.shield(future)
+
+    def _enqueue(self, request):
+        '''
+        Adds a small joint query to the next batch.
+
+        :return: future of its answer
+        '''
+        # a batch is answered over the graph that its queries were queued with, so a graph that was swapped in since
+        # starts a batch of its own
+        if self._pending and self._pending_graph is not self._graph:
+            self._flush()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        self._pending_graph = self._graph
+
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._batch_window, self._flush)
+
+        return future
+
+    def _flush(self):
+        '''
+        Answers all pending small joint queries as a single batch, over the graph they were queued with.
+        '''
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, batch_graph = self._pending, self._pending_graph
+        self._pending, self._pending_graph = [], None
+        if not batch:
+            return
+
+        self._counters['batches'] += 1
+        self._counters['batched_queries'] += len(batch)
+
+        answers = asyncio.get_running_loop().run_in_executor(self._executor, _answer_batch, batch_graph,
+                                                             [request for request, _ in batch])
+
+        def resolve(answers):
+            for (_, future), answer in zip(batch, _result_or_errors(answers, len(batch))):
+                if future.done():
+                    continue
+
+                if isinstance(answer, Exception):
+                    future.set_exception(answer)
+                else:
+                    future.set_result(answer)
+
+        answers.add_done_callback(resolve)
+
+    async def handle_connection(self, reader, writer):
+        '''
+        Serves the requests of a single connection, until it's closed.
+        '''
+        try:
+            while True:
+                try:
+                    request = await http.read_request(reader)
+                except http.HTTPError as err:
+                    writer.write(http.format_response(err.status, {'error': str(err)}, keep_alive=False))
+                    break
+                except (ValueError, asyncio.LimitOverrunError, asyncio.IncompleteReadError):
+                    writer.write(http.format_response(400, {'error': 'Invalid request'}, keep_alive=False))
+                    break
+
+                if request is None:
+                    break
+
+                self._counters['requests'] += 1
+
+                try:
+                    status, payload = await self._dispatch(request)
+                except http.HTTPError as err:
+                    status, payload = err.status, {'error': str(err)}
+                except Exception as err:
+                    status, payload = 500, {'error': str(err)}
+
+                if status != 200:
+                    self._counters['errors'] += 1
+
+                writer.write(http.format_response(status, payload, keep_alive=request.keep_alive))
+                await writer.drain()
+
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request):
+        '''
+        :return: status and payload of the response to a request
+        '''
+        routes = {'/neighbours': 'GET', '/reverse': 'GET', '/mutual': 'GET', '/search': 'GET', '/joint': 'GET',
+                  '/query': 'POST', '/stats': 'GET', '/reload': 'POST'}
+
+        if request.path not in routes:
+            raise http.HTTPError(404, 'No such endpoint')
+        if request.method != routes[request.path]:
+            raise http.HTTPError(405, 'Use {0} for {1}'.format(routes[request.path], request.path))
+
+        if request.path == '/stats':
+            return 200, self.stats
+
+        if request.path == '/reload':
+            body = request.json() if request.body else {}
+            await self.reload(body.get('graph'))
+            return 200, {'graph': self._graph_filename, 'generation': self._generation}
+
+        if request.path == '/query':
+            try:
+                query_request = query.parse_line(request.body.decode('utf-8'))
+            except Exception as err:
+                raise http.HTTPError(400, 'Invalid query: {0}'.format(err))
+        else:
+            query_request = _parse_endpoint(request)
+
+        start = time.perf_counter()
+        try:
+            response = dict(await self.answer(query_request))
+        except KeyError as err:
+            raise http.HTTPError(400, 'Missing "{0}"'.format(err.args[0]))
+        response['latency_ms'] = (time.perf_counter() - start) * 1000
+
+        return (404 if 'error' in response else 200), response
+
+
+def _parse_endpoint(request):
+    '''
+    :return: the query of a request to one of the query endpoints
+    '''
+    if request.path in ('/neighbours', '/reverse', '/mutual'):
+        name = request.get_param('name')
+        if name is None:
+            raise http.HTTPError(400, 'Missing "name"')
+
+        return {'type': request.path[1:], 'name': name, 'limit': request.get_param('limit', query.DEFAULT_LIMIT, int)}
+
+    if request.path == '/search':
+        text = request.get_param('query')
+        if text is None:
+            raise http.HTTPError(400, 'Missing "query"')
+
+        return {'type': 'search', 'query': text, 'limit': request.get_param('limit', None, int)}
+
+    names = request.params.get('name')
+    if not names:
+        raise http.HTTPError(400, 'Missing "name"')
+
+    return {'type': 'joint',
+            'names': names,
+            'group_size': request.get_param('group_size', query.DEFAULT_GROUP_SIZE, int),
+            'mode': request.get_param('mode', 'sum')}
+
+
+def _is_small_joint(request):
+    return (request['type'] == 'joint' and
+            len(request['names']) <= SMALL_JOINT_MEMBERS and
+            request.get('group_size', query.DEFAULT_GROUP_SIZE) <= SMALL_JOINT_GROUP_SIZE)
+
+
+def _answer_batch(graph_to_query, requests):
+    '''
+    :return: answer of each query, or the exception it raised
+    '''
+    answers = []
+
+    for request in requests:
+        try:
+            answers.append(query.answer(graph_to_query, request))
+        except Exception as err:
+            answers.append(err)
+
+    return answers
+
+
+def _result_or_errors(future, amount):
+    '''
+    :return: results of a batch, or its exception for each of its queries if it failed as a whole
+    '''
+    try:
+        return future.result()
+    except Exception as err:
+        return [err] * amount
+
+
+async def serve(service, host='127.0.0.1', port=8080, watch_interval=None):
+    '''
+    Serves a graph until cancelled. The graph is also reloaded on SIGHUP, where signals are supported.
+
+    :param service: service to serve
+    :type service: QueryService
+    :param host: interface to listen on. optional
+    :param port: port to listen on. optional
+    :param watch_interval: seconds between checks of the graph file for changes. not watched if not given. optional
+    '''
+    await service.start()
+
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(service.reload()))
+    except (AttributeError, NotImplementedError):
+        pass
+
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    watcher = asyncio.ensure_future(service.watch(watch_interval)) if watch_interval else None
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if watcher is not None:
+            watcher.cancel()
@@ -0,0 +1,196 @@
+'''
+Minimal HTTP/1.1 over asyncio streams, just enough for JSON requests and responses over keep-alive connections.
+'''
+
+import json
+import urllib.parse
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+# requests with larger heads or bodies are refused
+MAX_LINE = 64 * 1024
+MAX_BODY = 1024 * 1024
+
+
+class HTTPError(Exception):
+    '''
+    Error that's answered with the given status.
+    '''
+
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class Request(object):
+    '''
+    A parsed HTTP request.
+    '''
+
+    def __init__(self, method, target, headers, body):
+        '''
+        :param method: method of the request, e.g. 'GET'
+        :param target: path and query string
+        :param headers: headers by lower-cased name
+        :param body: raw body
+        '''
+        self.method = method
+        self.headers = headers
+        self.body = body
+
+        parsed = urllib.parse.urlsplit(target)
+        self.path = parsed.path
+        self.params = urllib.parse.parse_qs(parsed.query)
+
+    @property
+    def keep_alive(self):
+        '''
+        :return: whether the connection should be kept open after responding
+        :rtype: bool
+        '''
+        return self.headers.get('connection', '').lower() != 'close'
+
+    def get_param(self, name, default=None, parse=str):
+        '''
+        :param name: name of the query string parameter
+        :param default: value to return if the parameter is not given. optional
+        :param parse: function to parse the value with. optional
+        :return: the last value of the parameter
+        '''
+        values = self.params.get(name)
+        if not values:
+            return default
+
+        try:
+            return parse(values[-1])
+        except ValueError:
+            raise HTTPError(400, 'Invalid value of "{0}"'.format(name))
+
+    def json(self):
+        '''
+        :return: the body, decoded as JSON
+        '''
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'Body is not valid JSON')
+
+
+async def read_head(reader):
+    '''
+    :param reader: stream to read from
+    :return: the first line, and the headers by lower-cased name, or None if the stream ended before a message started
+    :rtype: tuple(str, dict)
+    '''
+    line = await reader.readline()
+    if not line:
+        return None
+
+    if len(line) > MAX_LINE or not line.endswith(b'\n'):
+        raise HTTPError(400, 'Invalid request line')
+
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if len(header) > MAX_LINE or not header.endswith(b'\n'):
+            raise HTTPError(400, 'Invalid header')
+
+        header = header.decode('latin-1').strip()
+        if not header:
+            break
+
+        name, _, value = header.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    return line.decode('latin-1').strip(), headers
+
+
+async def read_body(reader, headers):
+    '''
+    :return: body of the message, as declared by its content-length
+    :rtype: bytes
+    '''
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HTTPError(400, 'Invalid content-length')
+
+    if length > MAX_BODY:
+        raise HTTPError(400, 'Body is too large')
+
+    return await reader.readexactly(length) if length > 0 else b''
+
+
+async def read_request(reader):
+    '''
+    :param reader: stream to read from
+    :return: the next request, or None if the connection was closed
+    :rtype: Request
+    '''
+    head = await read_head(reader)
+    if head is None:
+        return None
+
+    request_line, headers = head
+    parts = request_line.split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise HTTPError(400, 'Invalid request line')
+
+    # http/1.0 clients close the connection unless they ask otherwise
+    if parts[2] == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive':
+        headers['connection'] = 'close'
+
+    return Request(parts[0].upper(), parts[1], headers, await read_body(reader, headers))
+
+
+def format_response(status, payload, keep_alive=True):
+    '''
+    :param status: http status code
+    :param payload: JSON serializable payload
+    :param keep_alive: whether the connection is kept open. optional
+    :return: the encoded response
+    :rtype: bytes
+    '''
+    body = json.dumps(payload).encode('utf-8')
+    head = ('HTTP/1.1 {0} {1}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {2}\r\n'
+            'Connection: {3}\r\n'
+            '\r\n').format(status, REASONS.get(status, ''), len(body), 'keep-alive' if keep_alive else 'close')
+
+    return head.encode('latin-1') + body
+
+
+def format_request(method, target, host, body=None):
+    '''
+    :param method: method of the request
+    :param target: path and query string
+    :param host: host the request is sent to
+    :param body: JSON serializable body. optional
+    :return: the encoded request, over a keep-alive connection
+    :rtype: bytes
+    '''
+    encoded_body = json.dumps(body).encode('utf-8') if body is not None else b''
+    head = ('{0} {1} HTTP/1.1\r\n'
+            'Host: {2}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {3}\r\n'
+            '\r\n').format(method, target, host, len(encoded_body))
+
+    return head.encode('latin-1') + encoded_body
+
+
+async def read_response(reader):
+    '''
+    :param reader: stream to read from
+    :return: status and raw body of the next response
+    :rtype: tuple(int, bytes)
+    '''
+    head = await read_head(reader)
+    if head is None:
+        raise ConnectionError('Connection closed')
+
+    status_line, headers = head
+    return int(status_line.split()[1]), await read_body(reader, headers)
@@ -0,0 +1,124 @@
+'''
+Load test client of the query service.
+
+Sends requests over a number of concurrent keep-alive connections, and measures the throughput and latency of the
+service.
+'''
+
+import asyncio
+import collections
+import random
+import time
+import urllib.parse
+
+import numpy
+
+from service import http
+
+
+def to_target(request):
+    '''
+    :param request: a query, see `query`
+    :return: method, path and query string, and body of the request for the query
+    :rtype: tuple(str, str, dict)
+    '''
+    if request['type'] == 'neighbours':
+        params = [('name', request['name'])]
+        if 'limit' in request:
+            params.append(('limit', request['limit']))
+
+        return 'GET', '/neighbours?' + urllib.parse.urlencode(params), None
+
+    if request['type'] == 'search':
+        params = [('query', request['query'])]
+        if request.get('limit') is not None:
+            params.append(('limit', request['limit']))
+
+        return 'GET', '/search?' + urllib.parse.urlencode(params), None
+
+    return 'POST', '/query', request
+
+
+def generate_requests(names, amount, mix=(0.6, 0.2, 0.2), group_size=3, seed=0):
+    '''
+    Generates random queries over the given names.
+
+    :param names: names to query
+    :param amount: amount of queries
+    :param mix: ratios of neighbours, search and joint queries. optional
+    :param group_size: amount of members of joint queries. optional
+    :param seed: seed of the random generator. optional
+    :return: list of queries
+    :rtype: list(dict)
+    '''
+    randomizer = random.Random(seed)
+    requests = []
+
+    for _ in range(amount):
+        kind = randomizer.choices(('neighbours', 'search', 'joint'), weights=mix)[0]
+
+        if kind == 'neighbours':
+            requests.append({'type': 'neighbours', 'name': randomizer.choice(names), 'limit': 10})
+        elif kind == 'search':
+            name = randomizer.choice(names)
+            requests.append({'type': 'search', 'query': name[:max(3, len(name) // 2)], 'limit': 10})
+        else:
+            requests.append({'type': 'joint', 'names': randomizer.sample(names, group_size), 'group_size': 10})
+
+    return requests
+
+
+async def _client(host, port, targets, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    host_header = '{0}:{1}'.format(host, port)
+
+    try:
+        for method, target, body in targets:
+            start = time.perf_counter()
+            writer.write(http.format_request(method, target, host_header, body))
+            await writer.drain()
+
+            status, _ = await http.read_response(reader)
+
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    except (ConnectionError, asyncio.IncompleteReadError):
+
+        # the connection is lost, along with the request that was sent over it
+        statuses['connection_lost'] += 1
+    finally:
+        writer.close()
+
+
+async def run(host, port, requests, concurrency=16):
+    '''
+    Sends all requests, over <concurrency> connections at once.
+
+    :param host: host of the service
+    :param port: port of the service
+    :param requests: queries to send, see `query`
+    :param concurrency: amount of concurrent connections. optional
+    :return: summary of the run: amount of requests by status, or of lost connections, duration, requests per second and
+             latency percentiles
+    :rtype: dict
+    '''
+    # all connections take their next request from the same iterator, so they are kept equally busy
+    targets = iter([to_target(request) for request in requests])
+    latencies = []
+    statuses = collections.Counter()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(host, port, targets, latencies, statuses) for _ in range(concurrency)])
+    seconds = time.perf_counter() - start
+
+    summary = {'requests': len(latencies),
+               'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+               'concurrency': concurrency,
+               'seconds': seconds,
+               'requests_per_second': len(latencies) / seconds if seconds > 0 else None}
+
+    if latencies:
+        p50, p95, p99 = numpy.percentile(numpy.array(latencies) * 1000, [50, 95, 99]).tolist()
+        summary['latency_ms'] = {'p50': p50, 'p95': p95, 'p99': p99, 'max': max(latencies) * 1000}
+
+    return summary
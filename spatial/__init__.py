@@ -0,0 +1,188 @@
+'''
+Exact nearest neighbours search under weights that are bounded by a distance.
+
+A calculator can describe its weights as a search space: each row is a point, and a weight is never lower than the
+distance between the two points, scaled by how many categories of the two rows mismatch. Rows are bucketed by their
+categories, and each bucket is indexed by a KD-tree. The nodes of all trees are then searched together, best first,
+and the search stops once no node can hold a row that's as light as the k-th lightest one found so far.
+
+The search only ever prunes rows that are strictly heavier than the k-th lightest one, so the lightest rows that are
+selected out of the rows it finds are the same as out of all rows, including ties.
+'''
+
+import heapq
+
+import numpy
+
+from spatial.kdtree import KDTree
+
+
+# lower bounds are loosened by this relative margin, so rounding errors can't prune a row they should not
+_MARGIN = 1e-9
+
+
+class SearchSpace(object):
+    '''
+    Describes how the weights of a calculator are bounded, such that for every pair of rows (i, j):
+
+        weight(i, j) >= scales[amount of mismatching categories of i and j] * distance(points[i], points[j])
+
+    where the distance sums the euclidean norms over each group of axes in <norms>.
+    '''
+
+    def __init__(self, points, norms, categories, scales):
+        '''
+        :param points: coordinates of the rows, one row per point
+        :type points: numpy.ndarray
+        :param norms: groups of axes, see `spatial.kdtree.KDTree`
+        :type norms: list(tuple(int))
+        :param categories: category ids of the rows, one row per row of the dataset
+        :type categories: numpy.ndarray
+        :param scales: scale of the distance, by amount of mismatching categories
+        :type scales: list(float)
+        '''
+        self.points = numpy.asarray(points, dtype=numpy.float64)
+        self.norms = [tuple(group) for group in norms]
+        self.categories = numpy.asarray(categories).reshape(len(self.points), -1)
+        self.scales = numpy.asarray(scales, dtype=numpy.float64)
+
+        if not numpy.isfinite(self.points).all():
+            raise Exception('Points of a search space must be finite')
+
+        if len(self.scales) != self.categories.shape[1] + 1:
+            raise Exception('A search space needs a scale for each amount of mismatching categories')
+
+
+class BucketedSearch(object):
+    '''
+    Searches the lightest rows of a search space, with a KD-tree per bucket of rows that share their categories.
+    '''
+
+    def __init__(self, space, leaf_size=32, batch_size=128):
+        '''
+        :param space: search space of the rows
+        :type space: SearchSpace
+        :param leaf_size: maximal amount of rows in a leaf of a KD-tree. optional
+        :param batch_size: amount of rows to calculate at once. optional
+        '''
+        self._space = space
+        self._batch_size = batch_size
+        self._points = space.points.tolist()
+
+        keys, buckets = numpy.unique(space.categories, axis=0, return_inverse=True)
+        buckets = buckets.reshape(-1)
+
+        self._keys = keys
+        self._trees = []
+        self._members = []
+
+        for bucket in range(len(keys)):
+            members = numpy.flatnonzero(buckets == bucket)
+            self._members.append(members)
+            self._trees.append(KDTree(space.points[members], space.norms, leaf_size))
+
+        self._lows = numpy.array([tree.box[0] for tree in self._trees], dtype=numpy.float64)
+        self._highs = numpy.array([tree.box[1] for tree in self._trees], dtype=numpy.float64)
+
+    def search(self, row, k, evaluate, limit=None):
+        '''
+        Finds candidates for the <k> lightest rows of a given row.
+
+        :param row: index of the row
+        :param k: how many rows to find
+        :param evaluate: function that gets indices of rows, and returns their exact weights from the given row
+        :type evaluate: callable(numpy.ndarray) -> numpy.ndarray
+        :param limit: rows that are heavier than the limit are not needed. optional
+        :return: indices of the candidates, ascending, and their weights. these include every row, other than the given
+                 one, that's as light as the <k> lightest rows and not heavier than the limit
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        '''
+        point = self._points[row]
+        scales = self._space.scales[(self._keys != self._space.categories[row]).sum(axis=1)]
+
+        # lower bound of each bucket, as the distance to the box of all of its rows
+        heap = [(bound, bucket, 0) for bucket, bound in enumerate((scales * self._root_distances(row)).tolist())]
+        scales = scales.tolist()
+        heapq.heapify(heap)
+
+        found_indices = []
+        found_weights = []
+        lightest = numpy.empty(0, dtype=numpy.float64)
+        bound = limit if limit is not None else float('inf')
+
+        # rows of leaves are calculated in batches, rather than leaf by leaf
+        pending = []
+        pending_size = 0
+
+        while heap:
+            lower_bound, bucket, node = heapq.heappop(heap)
+
+            if lower_bound * (1 - _MARGIN) > bound:
+                break
+
+            tree = self._trees[bucket]
+            children = tree.children(node)
+
+            if children is not None:
+                for child in children:
+                    heapq.heappush(heap, (scales[bucket] * tree.lower_bound(point, child), bucket, child))
+                continue
+
+            indices = self._members[bucket][tree.points(node)]
+            pending.append(indices[indices != row])
+            pending_size += len(pending[-1])
+
+            if pending_size < self._batch_size:
+                continue
+
+            indices, weights = self._evaluate(pending, evaluate, limit)
+            found_indices.append(indices)
+            found_weights.append(weights)
+            pending = []
+            pending_size = 0
+
+            # tighten the bound to the k-th lightest weight found so far
+            lightest = numpy.sort(numpy.concatenate([lightest, weights]))[:k]
+            if 0 < k == len(lightest):
+                bound = min(bound, lightest[-1])
+
+        # leaves that were not pruned when they were reached are calculated either way
+        if pending_size > 0:
+            indices, weights = self._evaluate(pending, evaluate, limit)
+            found_indices.append(indices)
+            found_weights.append(weights)
+
+        if not found_indices:
+            return numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.float64)
+
+        indices = numpy.concatenate(found_indices)
+        weights = numpy.concatenate(found_weights)
+        order = numpy.argsort(indices, kind='stable')
+
+        return indices[order], weights[order]
+
+    def _evaluate(self, pending, evaluate, limit):
+        '''
+        :return: indices of the pending rows and their weights, without those that are heavier than the limit
+        '''
+        indices = numpy.concatenate(pending)
+        weights = evaluate(indices)
+
+        if limit is not None:
+            mask = ~(weights > limit)
+            indices, weights = indices[mask], weights[mask]
+
+        return indices, weights
+
+    def _root_distances(self, row):
+        '''
+        :return: distance from the row to the box of each bucket
+        '''
+        point = self._space.points[row]
+        gaps = numpy.maximum(numpy.maximum(self._lows - point, point - self._highs), 0.0)
+
+        distances = numpy.zeros(len(self._trees), dtype=numpy.float64)
+        for group in self._space.norms:
+            distances += numpy.sqrt(numpy.sum(gaps[:, list(group)] ** 2, axis=1))
+
+        return distances
@@ -0,0 +1,135 @@
+'''
+KD-tree over points, searched under a distance that sums norms of groups of axes.
+
+For example, with the groups ((0, 1), (2,)) the distance between two points is the euclidean distance over the first
+two axes plus the absolute difference over the third one.
+'''
+
+import math
+
+import numpy
+
+
+class KDTree(object):
+    '''
+    Static KD-tree. Nodes are split at the median of their widest axis, until they hold at most <leaf_size> points.
+
+    Nodes are identified by integer ids, where 0 is the root. Each node covers a contiguous range of the tree's
+    points, and is bounded by the box of the points in it.
+    '''
+
+    def __init__(self, points, norms, leaf_size=32):
+        '''
+        :param points: coordinates of the points, one row per point
+        :type points: numpy.ndarray
+        :param norms: groups of axes, where the distance is the sum of the euclidean norms over each group
+        :type norms: list(tuple(int))
+        :param leaf_size: maximal amount of points in a leaf. optional
+        '''
+        self._norms = [tuple(group) for group in norms]
+        self._order = numpy.arange(len(points), dtype=numpy.int64)
+
+        # per node: range of points in self._order, box and children. leaves have no children
+        self._ranges = []
+        self._lows = []
+        self._highs = []
+        self._children = []
+
+        if len(points) > 0:
+            self._build(numpy.asarray(points, dtype=numpy.float64), leaf_size)
+
+    def _build(self, points, leaf_size):
+        stack = [(0, len(points), self._add_node(points, 0, len(points)))]
+
+        while stack:
+            start, stop, node = stack.pop()
+            if stop - start <= leaf_size:
+                continue
+
+            indices = self._order[start:stop]
+            extents = points[indices].max(axis=0) - points[indices].min(axis=0)
+            axis = int(numpy.argmax(extents))
+
+            # all points are at the same place
+            if extents[axis] == 0:
+                continue
+
+            middle = (stop - start) // 2
+            self._order[start:stop] = indices[numpy.argpartition(points[indices, axis], middle)]
+
+            left = self._add_node(points, start, start + middle)
+            right = self._add_node(points, start + middle, stop)
+            self._children[node] = (left, right)
+
+            stack.append((start, start + middle, left))
+            stack.append((start + middle, stop, right))
+
+    def _add_node(self, points, start, stop):
+        node_points = points[self._order[start:stop]]
+
+        self._ranges.append((start, stop))
+        self._lows.append(node_points.min(axis=0).tolist())
+        self._highs.append(node_points.max(axis=0).tolist())
+        self._children.append(None)
+
+        return len(self._ranges) - 1
+
+    def __len__(self):
+        return len(self._order)
+
+    @property
+    def box(self):
+        '''
+        :return: lowest and highest coordinates of all points, or None if the tree is empty
+        :rtype: tuple(list(float), list(float))
+        '''
+        return (self._lows[0], self._highs[0]) if self._ranges else None
+
+    def children(self, node):
+        '''
+        :param node: id of the node
+        :return: ids of the children of the node, or None if it's a leaf
+        :rtype: tuple(int, int)
+        '''
+        return self._children[node]
+
+    def points(self, node):
+        '''
+        :param node: id of the node
+        :return: indices of the points in the node
+        :rtype: numpy.ndarray
+        '''
+        start, stop = self._ranges[node]
+        return self._order[start:stop]
+
+    def lower_bound(self, point, node):
+        '''
+        :param point: coordinates of a point, as a list
+        :param node: id of the node
+        :return: distance from the point to the node's box, which no point in the node is closer than
+        :rtype: float
+        '''
+        return box_distance(point, self._lows[node], self._highs[node], self._norms)
+
+
+def box_distance(point, low, high, norms):
+    '''
+    :param point: coordinates of a point
+    :param low: lowest coordinates of the box
+    :param high: highest coordinates of the box
+    :param norms: groups of axes, see `KDTree`
+    :return: distance from the point to the nearest point in the box
+    :rtype: float
+    '''
+    distance = 0.0
+
+    for group in norms:
+        squares = 0.0
+
+        for axis in group:
+            gap = max(low[axis] - point[axis], point[axis] - high[axis], 0.0)
+            squares += gap * gap
+
+        distance += math.sqrt(squares)
+
+    return distance
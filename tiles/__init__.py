@@ -0,0 +1,379 @@
+'''
+Out-of-core build of full graphs, one tile of pairs at a time, which could be resumed once interrupted.
+
+The rows are split into blocks of <tile_size> consecutive rows, and tile (I, J), where I <= J, holds the pairs between
+the rows of block I and the rows of block J (or only the pairs (i, j) where i < j, if I == J). Each tile is calculated
+on its own, and the vertices that survive the threshold are spilled into files of their own, memory-mapped, as
+(source, target, weight) triples of both directions of each pair, sorted by source. Once a tile is spilled, it's
+appended to the manifest of the spill directory, so a build that's interrupted resumes from the tiles that were not
+finished yet.
+
+Once all tiles are finished, they are merged into a graph file in CSR layout (see `graph.csr`). The sources of block K
+are found in the tiles of its row and of its column, each sorted by source, so the vertices of each range of sources
+are read from them, sorted by weight, and written into the graph's arrays, which are memory-mapped as well. Memory is
+bounded by the size of a tile and of a range of sources, rather than by the amount of pairs. Equal weights are ordered
+by the row of their target, as in a graph that's built in memory.
+
+Edges are identified by their rows, so the names of the rows have to be unique, and rows without any vertices are
+left out, as with a graph in memory. The graph is undirected, so the graph file is marked as such, and its reverse
+index is its neighbours (see `graph.csr`).
+'''
+
+import json
+import os
+import shutil
+
+import numpy
+from numpy.lib import format as numpy_format
+
+from graph import csr
+
+
+MANIFEST_FILENAME = 'manifest.jsonl'
+
+_SPILL_ARRAYS = (('sources', numpy.int32), ('targets', numpy.int32), ('weights', numpy.float64))
+
+
+class TiledBuild(object):
+    '''
+    Spill directory of a tiled build, with the tiles that were finished so far.
+    '''
+
+    # maximal amount of vertices sorted at once while merging
+    merge_size = 2 ** 24
+
+    def __init__(self, directory, key, amount_of_rows, tile_size=2 ** 11):
+        '''
+        Opens the spill directory, and the tiles that were finished in it. A directory that was used by a build with
+        another key is cleared.
+
+        :param directory: directory to spill tiles into. created if it does not exist
+        :param key: describes the rows, the calculator and the parameters of the build, so tiles are only resumed by
+                    the same build
+        :param amount_of_rows: amount of rows
+        :param tile_size: amount of rows in each block. a tile is at most <tile_size> x <tile_size> pairs. optional
+        '''
+        if tile_size < 1:
+            raise Exception('Tile size should be a positive amount of rows')
+
+        self._directory = directory
+        self._key = key
+        self._amount_of_rows = amount_of_rows
+        self._tile_size = tile_size
+        self._finished = {}
+
+        header = {'key': key, 'rows': amount_of_rows, 'tile_size': tile_size}
+
+        if os.path.isdir(directory):
+            self._finished = self._read_manifest(header)
+        else:
+            os.makedirs(directory)
+
+        if not self._finished:
+            self._clear()
+
+            with open(self._get_manifest_filename(), 'w', encoding='utf-8') as f:
+                f.write(json.dumps(header))
+                f.write('\n')
+
+    def __getstate__(self):
+        # sent to worker processes, which only spill tiles
+        return {'_directory': self._directory,
+                '_key': self._key,
+                '_amount_of_rows': self._amount_of_rows,
+                '_tile_size': self._tile_size,
+                '_finished': {}}
+
+    @property
+    def directory(self):
+        '''
+        :rtype: str
+        '''
+        return self._directory
+
+    @property
+    def tiles(self):
+        '''
+        :return: all tiles, as (I, J) where I <= J
+        :rtype: list(tuple(int, int))
+        '''
+        amount_of_blocks = self._get_amount_of_blocks()
+
+        return [(i, j) for i in range(amount_of_blocks) for j in range(i, amount_of_blocks)]
+
+    @property
+    def pending(self):
+        '''
+        :return: tiles that were not finished yet
+        :rtype: list(tuple(int, int))
+        '''
+        return [tile for tile in self.tiles if tile not in self._finished]
+
+    @property
+    def finished(self):
+        '''
+        :return: amount of vertices spilled by each tile that was finished
+        :rtype: dict(tuple(int, int), int)
+        '''
+        return dict(self._finished)
+
+    def get_block(self, block):
+        '''
+        :param block: index of the block
+        :return: range of its rows, as (start, stop)
+        :rtype: tuple(int, int)
+        '''
+        start = block * self._tile_size
+        return start, min(start + self._tile_size, self._amount_of_rows)
+
+    def get_pairs(self, tile):
+        '''
+        :return: amount of pairs in the tile
+        :rtype: int
+        '''
+        a_start, a_stop = self.get_block(tile[0])
+        b_start, b_stop = self.get_block(tile[1])
+
+        if tile[0] == tile[1]:
+            return (a_stop - a_start) * (a_stop - a_start - 1) // 2
+
+        return (a_stop - a_start) * (b_stop - b_start)
+
+    def spill_tile(self, tile, calculate_block, threshold=None):
+        '''
+        Calculates a tile, and spills its vertices. The tile is not finished until it's recorded with `finish_tile`.
+
+        :param tile: the tile, as (I, J)
+        :param calculate_block: given two arrays of row indices a and b, returns a matrix where [i][j] = weight between
+                                rows a[i] and b[j]
+        :param threshold: discard vertices whose weight is above this threshold. optional
+        :return: amount of vertices spilled, i.e. twice the amount of pairs that survived
+        :rtype: int
+        '''
+        a = numpy.arange(*self.get_block(tile[0]))
+        b = numpy.arange(*self.get_block(tile[1]))
+        block = numpy.asarray(calculate_block(a, b), dtype=numpy.float64)
+
+        # missing weights are never vertices, as with an undirected graph in memory
+        mask = ~numpy.isnan(block)
+        if threshold is not None:
+            mask &= ~(block > threshold)
+
+        if tile[0] == tile[1]:
+            mask &= b[numpy.newaxis, :] > a[:, numpy.newaxis]
+
+        rows, columns = numpy.nonzero(mask)
+        weights = block[rows, columns]
+
+        sources = numpy.concatenate([a[rows], b[columns]])
+        order = numpy.argsort(sources, kind='stable')
+
+        arrays = {'sources': sources[order],
+                  'targets': numpy.concatenate([b[columns], a[rows]])[order],
+                  'weights': numpy.concatenate([weights, weights])[order]}
+
+        for name, dtype in _SPILL_ARRAYS:
+            filename = self._get_spill_filename(tile, name)
+            temporary_filename = '{0}.tmp.npy'.format(filename)
+
+            spill = numpy_format.open_memmap(temporary_filename, mode='w+', dtype=dtype, shape=(len(sources),))
+            spill[:] = arrays[name]
+            spill.flush()
+            del spill
+
+            os.replace(temporary_filename, filename)
+
+        return len(sources)
+
+    def finish_tile(self, tile, amount_of_vertices):
+        '''
+        Records a spilled tile in the manifest, so it's not calculated again.
+
+        :param tile: the tile, as (I, J)
+        :param amount_of_vertices: amount of vertices it spilled
+        '''
+        with open(self._get_manifest_filename(), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'tile': list(tile), 'vertices': amount_of_vertices}))
+            f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._finished[tuple(tile)] = amount_of_vertices
+
+    def merge(self, filename, names, weights_dtype=numpy.float32, arrays=None, meta=None):
+        '''
+        Merges the spilled vertices of all tiles into a binary graph file.
+
+        :param filename: file to write into
+        :param names: names of the rows. rows that have vertices are the edges of the graph. should be unique
+        :param weights_dtype: dtype to store weights as. optional
+        :param arrays: more arrays to store along, by name. optional
+        :type arrays: dict(str, numpy.ndarray)
+        :param meta: json serializable information to store along. optional
+        :return: amount of vertices in the graph
+        :rtype: int
+        '''
+        if self.pending:
+            raise Exception('Not all tiles were finished')
+
+        if len(set(names)) != self._amount_of_rows:
+            raise Exception('Edges of a tiled build are its rows, so their names should be unique')
+
+        # the amount of vertices out of each source is counted, so each range of sources is written in place
+        offsets = numpy.zeros(self._amount_of_rows + 1, dtype=numpy.int64)
+
+        for block in range(self._get_amount_of_blocks()):
+            start, stop = self.get_block(block)
+
+            for sources, _, _, (lo, hi) in self._iter_block_spills(block, start, stop, ('sources',)):
+                offsets[start + 1:stop + 1] += numpy.bincount(sources[lo:hi] - start, minlength=stop - start)
+
+        numpy.cumsum(offsets, out=offsets)
+
+        # rows without any vertices are not edges of the graph, as with a graph in memory
+        kept = numpy.diff(offsets) > 0
+        new_ids = (numpy.cumsum(kept) - 1).astype(numpy.int32)
+
+        indices = self._create_merge_array('indices', numpy.int32, offsets[-1])
+        weights = self._create_merge_array('weights', weights_dtype, offsets[-1])
+
+        for block in range(self._get_amount_of_blocks()):
+            start, stop = self.get_block(block)
+
+            for range_start, range_stop in self._split_ranges(offsets, start, stop):
+                parts = list(self._iter_block_spills(block, range_start, range_stop, ('sources', 'targets', 'weights')))
+
+                range_sources = numpy.concatenate([numpy.zeros(0, dtype=numpy.int32)] +
+                                                  [sources[lo:hi] for sources, _, _, (lo, hi) in parts])
+                range_targets = numpy.concatenate([numpy.zeros(0, dtype=numpy.int32)] +
+                                                  [targets[lo:hi] for _, targets, _, (lo, hi) in parts])
+                range_weights = numpy.concatenate([numpy.zeros(0, dtype=weights_dtype)] +
+                                                  [values[lo:hi].astype(weights_dtype) for _, _, values, (lo, hi)
+                                                   in parts])
+
+                # vertices are sorted by their stored weight, and equal weights by the row of their target
+                order = numpy.lexsort((range_targets, range_weights, range_sources))
+                indices[offsets[range_start]:offsets[range_stop]] = new_ids[range_targets[order]]
+                weights[offsets[range_start]:offsets[range_stop]] = range_weights[order]
+
+        name_offsets, name_data = csr.encode_names([name for name, is_kept in zip(names, kept.tolist()) if is_kept])
+
+        graph_arrays = dict(arrays or {})
+        graph_arrays.update({'name_offsets': name_offsets,
+                             'name_data': name_data,
+                             'has_neighbours': numpy.ones(int(kept.sum()), dtype=numpy.uint8),
+                             'offsets': numpy.append(offsets[:-1][kept], offsets[-1]),
+                             'indices': indices,
+                             'weights': weights})
+
+        graph_meta = dict(meta or {})
+        graph_meta['undirected'] = True
+
+        csr.write(filename, graph_arrays, graph_meta)
+
+        del indices
+        del weights
+        del graph_arrays
+
+        for name in ('indices', 'weights'):
+            os.remove(self._get_merge_filename(name))
+
+        return int(offsets[-1])
+
+    def remove(self):
+        '''
+        Removes the spill directory, once the graph is merged.
+        '''
+        shutil.rmtree(self._directory)
+
+    def _get_amount_of_blocks(self):
+        return (self._amount_of_rows + self._tile_size - 1) // self._tile_size
+
+    def _get_manifest_filename(self):
+        return os.path.join(self._directory, MANIFEST_FILENAME)
+
+    def _get_spill_filename(self, tile, name):
+        return os.path.join(self._directory, 'tile-{0}-{1}.{2}.npy'.format(tile[0], tile[1], name))
+
+    def _get_merge_filename(self, name):
+        return os.path.join(self._directory, 'merge.{0}.npy'.format(name))
+
+    def _read_manifest(self, header):
+        '''
+        :param header: header of the manifest of this build
+        :return: amount of vertices spilled by each finished tile, or nothing if the manifest is of another build
+        :rtype: dict(tuple(int, int), int)
+        '''
+        try:
+            with open(self._get_manifest_filename(), 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+        except IOError:
+            return {}
+
+        try:
+            if json.loads(lines[0]) != header:
+                return {}
+        except ValueError:
+            return {}
+
+        finished = {}
+
+        for line in lines[1:]:
+
+            # the last line could be cut short if the build was interrupted while writing it
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            tile = tuple(record['tile'])
+            if all(os.path.exists(self._get_spill_filename(tile, name)) for name, _ in _SPILL_ARRAYS):
+                finished[tile] = record['vertices']
+
+        return finished
+
+    def _clear(self):
+        '''
+        Removes the manifest and the spill files of another build.
+        '''
+        for filename in os.listdir(self._directory):
+            if filename == MANIFEST_FILENAME or (filename.startswith(('tile-', 'merge.')) and
+                                                 filename.endswith('.npy')):
+                os.remove(os.path.join(self._directory, filename))
+
+    def _create_merge_array(self, name, dtype, length):
+        return numpy_format.open_memmap(self._get_merge_filename(name), mode='w+', dtype=dtype, shape=(int(length),))
+
+    def _iter_block_spills(self, block, start, stop, names):
+        '''
+        :param block: index of a block
+        :param start: first source to find
+        :param stop: source after the last one to find
+        :param names: spilled arrays to map, out of 'sources', 'targets' and 'weights'
+        :return: iterator over the tiles that hold sources of the block, as (sources, targets, weights, (lo, hi)),
+                 where the arrays that were not asked for are None, and lo:hi are the vertices out of the sources
+        '''
+        tiles = [(i, block) for i in range(block)] + [(block, j) for j in range(block, self._get_amount_of_blocks())]
+
+        for tile in tiles:
+            spills = {name: numpy.load(self._get_spill_filename(tile, name), mmap_mode='r') for name in names}
+            bounds = numpy.searchsorted(spills['sources'], [start, stop]).tolist()
+
+            yield spills.get('sources'), spills.get('targets'), spills.get('weights'), bounds
+
+    def _split_ranges(self, offsets, start, stop):
+        '''
+        :return: ranges of the sources between start and stop, each with at most <merge_size> vertices, unless it
+                 has a single source
+        :rtype: list(tuple(int, int))
+        '''
+        ranges = []
+
+        while start < stop:
+            range_stop = int(numpy.searchsorted(offsets, offsets[start] + self.merge_size, side='right')) - 1
+            range_stop = min(max(range_stop, start + 1), stop)
+
+            ranges.append((start, range_stop))
+            start = range_stop
+
+        return ranges
@@ -1,4 +1,34 @@
+'''
+Trims graphs so each edge has at most <n> outgoing vertices, the lightest ones, sorted by weight, ascending.
+
+The lightest vertices of each edge are found by partial selection, and only they are sorted, rather than all of them.
+Edges with few vertices are simply sorted all together. Edges are selected from in chunks of consecutive ids, which
+could be spread over a pool of worker processes. Workers are forked with the graph, and each goes over its chunks on
+its own, so graphs that are backed by a mapped file share its pages with all of them.
+
+Several levels (e.g. 10, 50 and 200 vertices per edge) are trimmed in a single pass: the trimmed graph keeps the
+lightest vertices of each edge for the largest level, sorted, so the graph trimmed for any smaller level is a prefix of
+them. All levels share that one sorted prefix index, and any of them is loaded with `graph.Graph.load(filename,
+max_vertices=<level>)` (see `graph.csr`).
+
+Vertices with equal weights keep the order in which the edge's neighbours are iterated, as with a stable sort.
+'''
+
+import multiprocessing
+
+import numpy
+
 import graph
+import instrument
+from graph import csr
+
+
+# edges with fewer vertices than this are sorted all together, which costs less than selecting from each one apart
+_SMALL_DEGREE = 2 ** 10
+
+# the graph of a worker process, and the maximum outgoing vertices per edge to select
+_worker_graph = None
+_worker_max_vertices = None
 
 
 class GraphTrimmer(object):
@@ -6,38 +36,216 @@ class GraphTrimmer(object):
     Used to trim graphs so each edge as at most <n> outgoing vertices, sorted by weight, ascending.
     '''
 
+    # amount of edges in each chunk that's selected from at once
+    chunk_size = 2 ** 8
+
+    def __init__(self, workers=None):
+        '''
+        :param workers: number of processes to select vertices in. the result is the same as with a single one.
+                        optional
+        '''
+        self._workers = workers
+
     def trim(self, input_graph, max_vertices, on_status_update=None):
         '''
         :param input_graph: graph to iterate over. does not mutate
         :param max_vertices: maximum outgoing vertices per edge
         :param on_status_update: callback to report progress to. gets amount of iterations as parameter. optional
         :type on_status_update: callable(int)
-        :return:
+        :return: the trimmed graph
+        :rtype: graph.Graph
         '''
-        update_ratio = 100
+        output_graph = graph.Graph()
+        output_graph.use_store(self.trim_levels(input_graph, [max_vertices], on_status_update))
+
+        return output_graph
+
+    def trim_levels(self, input_graph, levels, on_status_update=None, weights_dtype=numpy.float64):
+        '''
+        Trims a graph for several levels at once.
+
+        :param input_graph: graph to iterate over. does not mutate
+        :param levels: maximum outgoing vertices per edge, of each level
+        :type levels: list(int)
+        :param on_status_update: callback to report progress to. gets amount of iterations as parameter. optional
+        :type on_status_update: callable(int)
+        :param weights_dtype: dtype to keep weights as. weights are kept exact unless asked otherwise, and are cast
+                              once the graph is saved (see `graph.Graph.save`). optional
+        :return: the graph trimmed for the largest level, which lists all the levels in its meta
+        :rtype: csr.CSRStore
+        '''
+        levels = sorted(set(levels))
+        if not levels or levels[0] < 1:
+            raise Exception('Levels should be positive amounts of vertices')
+
+        max_vertices = levels[-1]
+
+        # ids are found before the workers are forked, so they all share them
+        names, _ = input_graph.iter_neighbour_ids()
+        chunks = [(start, min(start + self.chunk_size, len(names))) for start in range(0, len(names), self.chunk_size)]
+
+        if self._workers is not None and self._workers > 1:
+            pool = multiprocessing.Pool(self._workers, initializer=_initialize_worker,
+                                        initargs=(input_graph, max_vertices))
+            results = pool.imap(_select_worker_chunk, chunks)
+        else:
+            pool = None
+            results = (_select_chunk(input_graph, start, stop, max_vertices) for start, stop in chunks)
+
+        selected = []
         iterations = 0
+        amount_of_vertices = 0
 
-        # construct the trimmed graph as a new one
-        output_graph = graph.Graph()
+        try:
+            with instrument.stage('trim', max_vertices=max_vertices, levels=len(levels),
+                                  workers=self._workers) as stage:
+                for chunk in results:
+                    selected.append(chunk[:4])
+                    iterations += len(chunk[0])
+                    amount_of_vertices += chunk[4]
 
-        # iterate over all vertices in the given graph
-        for edge, vertices in input_graph.vertices.items():
-            iterations += 1
+                    # notify callback if needed
+                    if callable(on_status_update):
+                        on_status_update(iterations)
 
-            # notify callback if needed
-            if iterations % update_ratio == 0 and callable(on_status_update):
-                on_status_update(iterations)
+                stage['edges'] = iterations
+                stage['vertices'] = amount_of_vertices
+        finally:
+            if pool is not None:
+                pool.terminate()
 
-            # sort vertices for given edge
-            sorted_vertices = sorted(vertices.items(), key=lambda x: x[1])
+        with instrument.stage('trim.merge', edges=iterations):
+            return _merge(names, selected, levels, weights_dtype)
 
-            # trim vertices
-            trimmed_vertices = sorted_vertices[:max_vertices]
 
-            # construct new neighbours matrix
-            neighbours = {neighbour: weight for neighbour, weight in trimmed_vertices}
+def _initialize_worker(input_graph, max_vertices):
+    global _worker_graph
+    global _worker_max_vertices
 
-            # set neighbours for given edge in the new graph
-            output_graph.set_neighbours(edge, neighbours)
+    _worker_graph = input_graph
+    _worker_max_vertices = max_vertices
 
-        return output_graph
+
+def _select_worker_chunk(chunk):
+    start, stop = chunk
+    return _select_chunk(_worker_graph, start, stop, _worker_max_vertices)
+
+
+def _select_chunk(input_graph, start, stop, max_vertices):
+    '''
+    :param input_graph: graph to select from
+    :param start: id of the first edge of the chunk
+    :param stop: id after the last edge of the chunk
+    :param max_vertices: maximum outgoing vertices per edge
+    :return: ids of the edges that have outgoing vertices, the amount of vertices kept for each of them, the ids of the
+             kept neighbours and their weights, sorted by weight, and the amount of vertices the edges had
+    :rtype: tuple
+    '''
+    _, rows = input_graph.iter_neighbour_ids(start, stop)
+    rows = list(rows)
+
+    edge_ids = numpy.array([edge_id for edge_id, _, _ in rows], dtype=numpy.int64)
+    offsets = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(ids) for _, ids, _ in rows], out=offsets[1:])
+
+    indices = numpy.concatenate([numpy.zeros(0, dtype=numpy.int64)] + [ids for _, ids, _ in rows])
+    weights = numpy.concatenate([numpy.zeros(0)] + [weights for _, _, weights in rows])
+
+    all_degrees = numpy.diff(offsets)
+    rows = numpy.repeat(numpy.arange(len(edge_ids)), all_degrees)
+
+    # the vertices of all small edges are sorted at once, by edge and then by weight, and the first ones of each edge
+    # are kept
+    small = numpy.flatnonzero(all_degrees[rows] < _SMALL_DEGREE)
+    small = small[numpy.lexsort((weights[small], rows[small]))]
+
+    ranks = numpy.arange(len(small)) - numpy.searchsorted(rows[small], rows[small])
+    kept = [small[ranks < max_vertices]]
+
+    for i in numpy.flatnonzero(all_degrees >= _SMALL_DEGREE).tolist():
+        start, stop = offsets[i:i + 2].tolist()
+        kept.append(start + _select_lightest(weights[start:stop], max_vertices))
+
+    # the kept vertices of each edge are in order, and the edges are put back in order
+    positions = numpy.concatenate(kept)
+    positions = positions[numpy.argsort(rows[positions], kind='stable')]
+
+    degrees = numpy.minimum(all_degrees, max_vertices)
+    return edge_ids, degrees, indices[positions], weights[positions], int(offsets[-1])
+
+
+def _select_lightest(weights, max_vertices):
+    '''
+    :param weights: weights of the vertices of an edge
+    :param max_vertices: maximum amount of vertices to select
+    :return: positions of the lightest vertices, sorted by weight. equal weights are ordered by position
+    :rtype: numpy.ndarray
+    '''
+    if len(weights) > max_vertices:
+        # all vertices that are lighter than the <max_vertices>-th lightest are kept, along with as many of the first
+        # ones of its weight as there's room for
+        kth = numpy.partition(weights, max_vertices - 1)[max_vertices - 1]
+        lighter = numpy.flatnonzero(weights < kth)
+        equal = numpy.flatnonzero(weights == kth)[:max_vertices - len(lighter)]
+
+        candidates = numpy.sort(numpy.concatenate([lighter, equal]))
+    else:
+        candidates = numpy.arange(len(weights))
+
+    return candidates[numpy.argsort(weights[candidates], kind='stable')]
+
+
+def _merge(names, selected, levels, weights_dtype):
+    '''
+    Merges the selected vertices of all chunks into a store in CSR layout.
+
+    :param names: names of all edges of the input graph, by id
+    :param selected: selected vertices of each chunk, as returned by `_select_chunk`
+    :param levels: levels the graph is trimmed for, ascending
+    :rtype: csr.CSRStore
+    '''
+    empty = numpy.zeros(0, dtype=numpy.int64)
+
+    edge_ids = numpy.concatenate([empty] + [chunk[0] for chunk in selected])
+    degrees = numpy.concatenate([empty] + [chunk[1] for chunk in selected])
+    indices = numpy.concatenate([empty] + [chunk[2] for chunk in selected])
+    weights = numpy.concatenate([numpy.zeros(0)] + [chunk[3] for chunk in selected])
+
+    # the trimmed graph holds the edges that have vertices, and the neighbours they kept, named in order
+    used = numpy.zeros(len(names), dtype=bool)
+    used[edge_ids] = True
+    used[indices] = True
+
+    kept_ids = sorted(numpy.flatnonzero(used).tolist(), key=lambda x: names[x])
+    kept_names = [names[i] for i in kept_ids]
+
+    new_ids = numpy.full(len(names), -1, dtype=numpy.int64)
+    new_ids[kept_ids] = numpy.arange(len(kept_ids))
+
+    row_ids = new_ids[edge_ids]
+
+    has_neighbours = numpy.zeros(len(kept_names), dtype=numpy.uint8)
+    has_neighbours[row_ids] = 1
+
+    new_degrees = numpy.zeros(len(kept_names), dtype=numpy.int64)
+    new_degrees[row_ids] = degrees
+
+    offsets = numpy.zeros(len(kept_names) + 1, dtype=numpy.int64)
+    numpy.cumsum(new_degrees, out=offsets[1:])
+
+    # the rows were selected in the order of the input graph, and are gathered in the order of their new ids
+    order = numpy.argsort(row_ids)
+    starts = numpy.cumsum(degrees) - degrees
+    positions = numpy.repeat(starts[order] - offsets[row_ids[order]], degrees[order]) + numpy.arange(offsets[-1])
+
+    name_offsets, name_data = csr.encode_names(kept_names)
+
+    arrays = {'name_offsets': name_offsets,
+              'name_data': name_data,
+              'has_neighbours': has_neighbours,
+              'offsets': offsets,
+              'indices': new_ids[indices[positions]].astype(numpy.int32),
+              'weights': weights[positions].astype(weights_dtype)}
+    arrays.update(csr.build_reverse(offsets, arrays['indices'], arrays['weights']))
+
+    return csr.CSRStore(arrays, {'levels': levels})
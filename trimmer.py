@@ -4,37 +4,55 @@
 #
 # Used for trimming an already existing graph.
 #
+# Several levels could be trimmed at once, e.g. `trimmer.py graph.csr 10 50 200`, into a single file that holds the
+# lightest 200 vertices of each edge, sorted, out of which each level is a prefix. Load a level of it with
+# `graph.Graph.load(filename, max_vertices=50)`.
+#
 
 import argparse
+import numpy
 import progressbar
 
 import graph
+import instrument
 import trim
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('input', help='input file to trim')
-    parser.add_argument('max_vertices', help='maximum vertices per edge', type=int)
+    parser.add_argument('max_vertices', help='maximum vertices per edge, of each level to trim for', type=int, nargs='+')
+    parser.add_argument('-w', '--workers', help='number of processes to trim in', type=int, required=False)
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    graph = graph.Graph()
+    instrument.start(args)
+
+    input_graph = graph.Graph()
 
     print('loading graph from disk...')
-    graph.load(args.input)
+    input_graph.load(args.input)
 
     print('updating neighbours map...')
-    bar = progressbar.ProgressBar(max_value=len(graph.edges))
+    bar = progressbar.ProgressBar(max_value=len(input_graph.edges))
 
-    trimmed_graph = trim.GraphTrimmer().trim(graph, args.max_vertices, on_status_update=bar.update)
+    store = trim.GraphTrimmer(workers=args.workers).trim_levels(input_graph, args.max_vertices,
+                                                                on_status_update=bar.update)
 
     bar.finish()
 
+    trimmed_graph = graph.Graph()
+    trimmed_graph.use_store(store)
+
     print('saving graph to disk...')
     filename_without_ext, ext = args.input.rsplit('.', 1)
-    filename_without_ext = '{0}_trim_{1}'.format(filename_without_ext, args.max_vertices)
+    levels = '_'.join(str(level) for level in store.meta['levels'])
+    filename_without_ext = '{0}_trim_{1}'.format(filename_without_ext, levels)
     trimmed_filename = '{0}.{1}'.format(filename_without_ext, ext)
 
-    trimmed_graph.save(trimmed_filename)
+    # weights are trimmed exact, and stored compact
+    trimmed_graph.save(trimmed_filename, weights_dtype=numpy.float32)
+
+    instrument.finish(args)
 
     print('done')